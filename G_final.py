@@ -14,48 +14,225 @@
 #
 #   G_final.py processes the filenames provided as command line
 #   arguments to so they will load into the Roland mill
+#
+#   The file is streamed: the header is checked from the first two
+#   lines read, and the rest goes line by line through buffered reads
+#   and writes, so memory use does not grow with the file size.
+#
+#   G_final.py [--reorder] [--arcs] [--arc-tolerance MM] [--simplify MM]
+#              [--compact] [--toolpath] <filename>
+#     --reorder           cut the isolation runs in a short rapid order,
+#                         some of them backwards (see path_order.py);
+#                         done first, and holds the file in memory
+#     --arcs              replace runs of short G01 moves that lie on a
+#                         circle with G02/G03 arcs (see arc_fit.py)
+#     --arc-tolerance MM  how far a point or chord may be from its arc
+#     --simplify MM       drop zero length moves, merge in-line moves
+#                         and remove points within MM of the cut path
+#                         (see simplify.py); done after arc fitting
+#     --compact           leave out the words that repeat the modal
+#                         state, G01 and F on every line and unchanged
+#                         axes (see gcode_emit.py); done last
+#     --toolpath          write <filename>_final.tp, a binary toolpath
+#                         (see toolpath.py), in place of the G-code
+#     --profile JSON, --cprofile FILE, --log-level LEVEL
+#                         see profiling.py
 
+import argparse
+import os
+import re
 import sys
 
-# conduct argument checking
-if(len(sys.argv) != 2):
-    print("Usage: G_final.py <filename>")
-    print("\t<filename> must point to the G-code file output from PCBmill.")
-    sys.exit()
-
-# ensure the argument connects to a file that be opened
-try:
-    fp = open(sys.argv[1], 'r')
-except IOError:
-    print("Error: unable to open file " + str(sys.argv[1]))
-    sys.exit()
+import arc_fit
+import gcode_emit
+import gcode_lexer
+import path_order
+import profiling
+import simplify
+import toolpath
 
 # PCBmill provided G-code files begin with
 # excellon drill formats begin like this:
 #   %~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #   %        File was created with PCBMill V1.0          
-#
-# ensure the passed file matches this format
-def format_error():
-    print("Error: " + str(sys.argv[1])+ " is not a PCBMill V1.0 formatted file")
-    sys.exit()
+HEADER_LINE_0 = '%~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~'
+HEADER_LINE_1 = '%        File was created with PCBMill V1.0'
 
-lines = fp.readlines()
-if(str(lines[0]).strip() != '%~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~'):
-    format_error()
-if(str(lines[1]).rstrip() != '%        File was created with PCBMill V1.0'):
-    format_error()  
+# lines of the PCBmill header left out of the output
+HEADER_LINES = 5
+
+read_buffer = 1 << 20
+write_buffer = 1 << 20
+
+# a Z word of 8 marks a line that might be a travel retract
+_retract_re = re.compile(r'Z[ \t]*\+?0*8')
+
+#---------Retract to travel height----------#
+# PCBmill writes the retract as "G00 Z8", which the Roland mill will not
+# load without the decimal point
+def is_travel_retract(line):
+    if 'Z' not in line or '8' not in line:
+        return False
+    if line.rstrip() == "G00 Z8":
+        return True
+    words = gcode_lexer.lex_line(line)
+    return (len(words) == 2 and words[0].letter == 'G' and words[0].value == 0
+            and words[1].letter == 'Z' and words[1].value == 8.0)
 
-print ("Arguments are good")
+#---------Fix the retracts------------------#
+def fix_retracts(lines):
+    for line in lines:
+        if is_travel_retract(line):
+            line = "G00 Z8.0\n"
+        yield line
+
+#---------Read in blocks of whole lines-----#
+def read_blocks(fp, size):
+    rest = ''
+    while True:
+        block = fp.read(size)
+        if not block:
+            break
+        block = rest + block
+        cut = block.rfind('\n') + 1
+        rest = block[cut:]
+        if cut:
+            yield block[:cut]
+    if rest:
+        yield rest
+
+#---------Fix the retracts in a block-------#
+# block holds whole lines; only lines with a Z8 word are lexed
+def fix_block_retracts(block):
+    out = []
+    last = 0
+    for m in _retract_re.finditer(block):
+        start = block.rfind('\n', 0, m.start()) + 1
+        if start < last:
+            continue
+        end = block.find('\n', m.end())
+        end = len(block) if end < 0 else end + 1
+        if is_travel_retract(block[start:end]):
+            out.append(block[last:start])
+            out.append("G00 Z8.0\n")
+            last = end
+    out.append(block[last:])
+    return ''.join(out)
+
+#---------Finalize a PCBmill file-----------#
+# writes the Roland ready G-code to <filename>_final, or to the same name
+# in out_dir when one is given; returns the output file name
+# arc_tolerance turns on arc fitting, with the counts kept in arc_stats
+# chord_tolerance turns on simplification, counted in simplify_stats
+# compact leaves out the words that repeat the modal state
+# order_stats turns on reordering the runs, with the travel kept in it
+# raises IOError if the file cannot be read, ValueError if it is not
+# a PCBMill V1.0 file
+def finalize(filename, out_dir=None, arc_tolerance=None, arc_stats=None,
+             chord_tolerance=None, simplify_stats=None, binary=False, compact=False,
+             order_stats=None):
+    with profiling.stage('finalize ' + os.path.basename(filename)):
+        outfile_name = finalize_stream(filename, out_dir, arc_tolerance, arc_stats,
+                                       chord_tolerance, simplify_stats, binary, compact,
+                                       order_stats)
+        profiling.count_file('bytes read', filename)
+        profiling.count_file('bytes written', outfile_name)
+    return outfile_name
+
+def finalize_stream(filename, out_dir, arc_tolerance, arc_stats,
+                    chord_tolerance, simplify_stats, binary, compact=False,
+                    order_stats=None):
+    fp = open(filename, 'r', read_buffer)
+    try:
+        # ensure the passed file matches the PCBmill format
+        if(str(fp.readline()).strip() != HEADER_LINE_0):
+            raise ValueError(str(filename) + " is not a PCBMill V1.0 formatted file")
+        if(str(fp.readline()).rstrip() != HEADER_LINE_1):
+            raise ValueError(str(filename) + " is not a PCBMill V1.0 formatted file")
+        for n in range(HEADER_LINES - 2):
+            fp.readline()
+
+        outfile_name = filename + "_final"
+        if binary:
+            outfile_name += ".tp"
+        if out_dir is not None:
+            outfile_name = os.path.join(out_dir, os.path.basename(outfile_name))
+        if (arc_tolerance is None and chord_tolerance is None and not compact and
+                order_stats is None):
+            # nothing works on whole moves, so go a block at a time
+            program = (fix_block_retracts(b) for b in read_blocks(fp, read_buffer))
+        else:
+            program = fix_retracts(fp)
+        if order_stats is not None:
+            program = path_order.order_program(program, stats=order_stats)
+        if arc_tolerance is not None:
+            program = arc_fit.fit_arcs(program, arc_tolerance, arc_stats)
+        if chord_tolerance is not None:
+            program = simplify.simplify_moves(program, chord_tolerance, simplify_stats)
+        if compact:
+            program = gcode_emit.compact(program)
+        if binary:
+            toolpath.save(outfile_name, toolpath.from_gcode(''.join(program)))
+            return outfile_name
+        outfile = open(outfile_name, 'w', write_buffer)
+        try:
+            outfile.writelines(program)
+        finally:
+            outfile.close()
+    finally:
+        fp.close()
+    return outfile_name
 
 ##############################################
 #                 MAIN
 ##############################################
-outfile_name = sys.argv[1] + "_final"
-outfile = open(outfile_name, 'w')
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Make a PCBmill G-code file load into the Roland mill.")
+    parser.add_argument('filename',
+        help="the G-code file output from PCBmill")
+    parser.add_argument('--reorder', action='store_true',
+        help="reorder the cutting runs to cut the rapid travel between them")
+    parser.add_argument('--arcs', action='store_true',
+        help="replace runs of G01 moves along a circle with G02/G03 arcs")
+    parser.add_argument('--arc-tolerance', type=float, default=arc_fit.default_tolerance,
+        metavar='MM', help="largest distance of a point or chord from its arc "
+                           "(default " + str(arc_fit.default_tolerance) + ")")
+    parser.add_argument('--simplify', type=float, default=None, metavar='MM',
+        help="simplify runs of G01 moves to a chord tolerance of MM")
+    parser.add_argument('--compact', action='store_true',
+        help="leave out the words that repeat the modal state")
+    parser.add_argument('--toolpath', action='store_true',
+        help="write a binary .tp toolpath (see toolpath.py) instead of G-code text")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
 
-for line in lines[5:]:
-    if line.rstrip() == "G00 Z8":
-        print"line match on G00"
-        line = "G00 Z8.0\n"
-    outfile.write(line)
+    arc_tolerance = args.arc_tolerance if args.arcs else None
+    arc_stats = arc_fit.new_stats()
+    simplify_stats = simplify.new_stats()
+    order_stats = path_order.new_stats() if args.reorder else None
+    with profiling.session(args, 'G_final'):
+        try:
+            out_name = finalize(args.filename, arc_tolerance=arc_tolerance, arc_stats=arc_stats,
+                                chord_tolerance=args.simplify, simplify_stats=simplify_stats,
+                                binary=args.toolpath, compact=args.compact,
+                                order_stats=order_stats)
+        except IOError:
+            print("Error: unable to open file " + str(args.filename))
+            sys.exit()
+        except ValueError:
+            print("Error: " + str(args.filename)+ " is not a PCBMill V1.0 formatted file")
+            sys.exit()
+        if args.reorder:
+            path_order.report(out_name, order_stats)
+            profiling.count('runs ordered', order_stats['runs'])
+        if args.arcs:
+            arc_fit.report(out_name, arc_stats)
+            profiling.count('lines read', arc_stats['lines_in'])
+            profiling.count('arcs written', arc_stats['arcs'])
+        if args.simplify is not None:
+            simplify.report(out_name, simplify_stats)
+            profiling.count('lines written', simplify_stats['lines_out'])
+
+if __name__ == '__main__':
+    main()
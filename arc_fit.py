@@ -0,0 +1,184 @@
+#! /usr/bin/env python
+
+#
+# arc_fit.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   PCBmill writes every pad circle and curved trace as a chain of
+#   short G01 moves.  fit_arcs() finds runs of these moves whose points
+#   lie on a circle to within a tolerance and replaces each run with
+#   one G02 or G03 move with I and J centre offsets.
+#
+#   The lines are streamed: only the current run of G01 moves is held,
+#   and a run longer than max_run_points is fitted in pieces, so time
+#   and memory grow linearly with the file.
+#
+#   A run is replaced only when every original point is within the
+#   tolerance of the arc, no chord between them sags further than that
+#   inside it, and the points turn steadily one way around the centre,
+#   no more than max_step per move.  The chords PCBmill wrote cut
+#   inside the true curve; the arc follows the curve they were
+#   flattened from, and the max deviation reported is the most the cut
+#   path moves, at a point or mid-chord.  Nearly straight runs (radius over max_radius)
+#   are left as lines.
+
+import math
+
+import gcode_emit
+import gcode_lexer
+
+#--------------SETTINGS----------------------#
+default_tolerance = 0.01    # mm
+min_arc_points = 4          # points on an arc, including its start
+max_arc_points = 128        # longest run of points one arc may replace
+max_run_points = 4096       # points held before a run is fitted
+max_radius = 500.0          # mm
+max_sweep = 2 * math.pi - 0.01
+max_step = math.pi / 4      # largest turn of one move about the centre
+
+#---------Circle through three points--------#
+# return (cx, cy, r), or None if the points are in a line
+def circle_through(a, b, c):
+    bx = b[0] - a[0]
+    by = b[1] - a[1]
+    cx = c[0] - a[0]
+    cy = c[1] - a[1]
+    d = 2.0 * (bx * cy - by * cx)
+    if abs(d) < 1e-12:
+        return None
+    b2 = bx * bx + by * by
+    c2 = cx * cx + cy * cy
+    ux = (cy * b2 - by * c2) / d
+    uy = (bx * c2 - cx * b2) / d
+    return (a[0] + ux, a[1] + uy, math.hypot(ux, uy))
+
+#---------Fit one arc------------------------#
+# pts[s..e] are the points of a run of moves
+# return (cx, cy, r, ccw, deviation) if one arc through pts[s] and
+# pts[e] follows all of them and the chords between them within tol,
+# else None
+def fit(pts, s, e, tol):
+    circle = circle_through(pts[s], pts[(s + e) // 2], pts[e])
+    if circle is None:
+        return None
+    cx, cy, r = circle
+    if r > max_radius:
+        return None
+
+    worst = 0.0
+    sweep = 0.0
+    turn = 0
+    px = pts[s][0] - cx
+    py = pts[s][1] - cy
+    for k in range(s + 1, e + 1):
+        qx = pts[k][0] - cx
+        qy = pts[k][1] - cy
+        # every step must turn the same way about the centre
+        step = math.atan2(px * qy - py * qx, px * qx + py * qy)
+        if step == 0.0 or abs(step) > max_step:
+            return None
+        sign = 1 if step > 0 else -1
+        if turn == 0:
+            turn = sign
+        elif sign != turn:
+            return None
+        sweep += abs(step)
+        if sweep > max_sweep:
+            return None
+        # distance of the point from the arc, and how far the chord to
+        # it sags inside the arc
+        c2 = (qx - px) ** 2 + (qy - py) ** 2
+        sag = r - math.sqrt(max(r * r - c2 / 4.0, 0.0))
+        worst = max(worst, abs(math.hypot(qx, qy) - r), sag)
+        if worst > tol:
+            return None
+        px = qx
+        py = qy
+    return (cx, cy, r, turn > 0, worst)
+
+#---------Longest arc from a point-----------#
+# return (e, arc) for the furthest e that pts[s..e] fits, or (None, None)
+# The run is grown by doubling and then narrowed by bisection, so a
+# long arc takes O(n log n) point checks rather than O(n^2).
+def longest_fit(pts, s, tol):
+    last = min(len(pts) - 1, s + max_arc_points - 1)
+    e = s + min_arc_points - 1
+    if e > last:
+        return None, None
+    arc = fit(pts, s, e, tol)
+    if arc is None:
+        return None, None
+    good = e
+    bad = None
+    while good < last:
+        e = min(s + 2 * (good - s), last)
+        found = fit(pts, s, e, tol)
+        if found is None:
+            bad = e
+            break
+        good = e
+        arc = found
+    while bad is not None and bad - good > 1:
+        e = (good + bad) // 2
+        found = fit(pts, s, e, tol)
+        if found is None:
+            bad = e
+        else:
+            good = e
+            arc = found
+    return good, arc
+
+#---------Fit a run of moves-----------------#
+# pts, lines and feed are a run from gcode_lexer.cutting_runs()
+# yields the output lines
+def fit_run(pts, lines, feed, tol, stats):
+    num = gcode_emit.num
+    s = 0
+    n = len(pts)
+    while s < n - 1:
+        e, arc = longest_fit(pts, s, tol)
+        if arc is None:
+            yield lines[s]
+            s += 1
+            continue
+        cx, cy, r, ccw, dev = arc
+        line = ("G03" if ccw else "G02") + " X" + num(pts[e][0]) + " Y" + num(pts[e][1]) + \
+               " I" + num(cx - pts[s][0]) + " J" + num(cy - pts[s][1])
+        if feed is not None:
+            line += " F" + feed
+        yield line + "\n"
+        stats['arcs'] += 1
+        stats['replaced'] += e - s
+        stats['max_deviation'] = max(stats['max_deviation'], dev)
+        s = e
+
+#---------Fitting statistics-----------------#
+def new_stats():
+    return {'lines_in': 0, 'lines_out': 0, 'arcs': 0, 'replaced': 0, 'max_deviation': 0.0}
+
+#---------Fit arcs in a stream of lines------#
+# lines is any iterable of G-code lines ending in newlines
+# yields the lines with runs of G01 moves replaced by G02/G03 arcs
+# stats, a dict from new_stats(), is filled in as the lines go by
+def fit_arcs(lines, tol=default_tolerance, stats=None):
+    if stats is None:
+        stats = new_stats()
+    for pts, run, feed in gcode_lexer.cutting_runs(lines, max_run_points):
+        if pts is None:
+            stats['lines_in'] += 1
+            stats['lines_out'] += 1
+            yield run
+            continue
+        stats['lines_in'] += len(run)
+        for out in fit_run(pts, run, feed, tol, stats):
+            stats['lines_out'] += 1
+            yield out
+
+#---------Print the fitting report-----------#
+def report(name, stats):
+    saved = stats['lines_in'] - stats['lines_out']
+    pct = 100.0 * saved / max(stats['lines_in'], 1)
+    print(name + ": " + str(stats['lines_in']) + " lines -> " + str(stats['lines_out']) +
+          " lines (" + str(round(pct, 1)) + "% fewer), " + str(stats['arcs']) +
+          " arcs, max deviation " + str(round(stats['max_deviation'], 4)) + " mm")
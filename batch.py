@@ -0,0 +1,307 @@
+#! /usr/bin/env python
+
+#
+# batch.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   Runs the CAM-to-G-code scripts over many boards at once instead
+#   of one Python launch per file.
+#
+#   batch.py [-j JOBS] [-o OUTDIR] [--drill-gcode] <path> [<path> ...]
+#
+#   Each <path> is a file, a glob ("boards/*/*.drd") or a directory of
+#   CAM exports, which is searched recursively.  Files are sorted by
+#   their contents:
+#     Excellon drill files      drill_reduce.py and drill_G_output_lite.py
+#                               (and drill_G_output.py with --drill-gcode)
+#     PCBmill outline files     cutline.py
+#     other PCBmill files       G_final.py
+#   A PCBmill file is taken as an outline when its name matches one of
+#   the --outline patterns.
+#
+#   Files belong to the board named by their file name up to the first
+#   '.', and every board writes into its own directory OUTDIR/<board>,
+#   so fixed output names such as 65_drill.txt do not collide.  The
+#   jobs run in a pool of JOBS processes; a failing file is reported in
+#   the summary table and does not stop the others.
+#
+#   Stage outputs are kept in a build cache (see build_cache.py) in
+#   OUTDIR/.cache, so a re-run only redoes the stages whose input file,
+#   settings or script changed.
+#     --no-cache          run every stage and leave the cache alone
+#     --cache-stats       print the cache hits and size after the run
+#     --cache-size MB     largest size of the cache (default 500)
+#
+#   --profile, --cprofile and --log-level are described in profiling.py.
+#   The profile times the steps of the batch as a whole; the time of
+#   every job is in the summary table.  The scripts' progress messages
+#   are only shown with --log-level info or debug.
+
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import fnmatch
+import glob
+import io
+import os
+import sys
+import time
+
+import G_final
+import build_cache
+import cutline
+import drill_G_output
+import drill_G_output_lite
+import drill_reduce
+import excellon
+import profiling
+
+default_outline_patterns = ['*outline*', '*dimension*', '*dim.*']
+
+Job = collections.namedtuple('Job', 'board stage filename out_dir')
+Result = collections.namedtuple('Result', 'job ok outputs seconds message')
+
+#---------Stage runners----------------------#
+# each takes (filename, out_dir) and returns the list of files written
+def run_drill_reduce(filename, out_dir):
+    return [drill_reduce.reduce_file(filename, out_dir)]
+
+def run_drill_split(filename, out_dir):
+    return drill_G_output_lite.split_drill_file(filename, out_dir)
+
+def run_drill_gcode(filename, out_dir):
+    return drill_G_output.make_drill_files(filename, out_dir)
+
+def run_g_final(filename, out_dir):
+    return [G_final.finalize(filename, out_dir)]
+
+def run_cutline(filename, out_dir):
+    out_name = os.path.join(out_dir, os.path.basename(filename) + "_cutline.txt")
+    return [cutline.make_cutline_file(filename, out_name)]
+
+# the script each stage runs, whose settings and code key the cache
+STAGE_MODULES = {
+    'drill_reduce': drill_reduce,
+    'drill_split': drill_G_output_lite,
+    'drill_gcode': drill_G_output,
+    'G_final': G_final,
+    'cutline': cutline,
+}
+
+STAGES = collections.OrderedDict([
+    ('drill_reduce', run_drill_reduce),
+    ('drill_split', run_drill_split),
+    ('drill_gcode', run_drill_gcode),
+    ('G_final', run_g_final),
+    ('cutline', run_cutline),
+])
+
+#---------Find the input files---------------#
+# paths may be files, globs or directories; returns a sorted list of files
+def find_inputs(paths):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    found.append(os.path.join(root, name))
+        elif glob.has_magic(path):
+            found.extend(f for f in sorted(glob.glob(path)) if os.path.isfile(f))
+        else:
+            found.append(path)
+    seen = set()
+    unique = []
+    for f in found:
+        key = os.path.abspath(f)
+        if key not in seen:
+            seen.add(key)
+            unique.append(f)
+    return unique
+
+#---------Kind of CAM file-------------------#
+# returns 'excellon', 'outline', 'pcbmill' or None
+def classify(filename, outline_patterns):
+    try:
+        fp = open(filename, 'r')
+        try:
+            head = fp.readline() + fp.readline() + fp.readline()
+        finally:
+            fp.close()
+    except (IOError, UnicodeDecodeError):
+        return None
+    if excellon.is_excellon(head):
+        return 'excellon'
+    lines = head.split('\n')
+    if (len(lines) > 1 and lines[0].strip() == cutline.HEADER_LINE_0
+            and lines[1].rstrip() == cutline.HEADER_LINE_1):
+        name = os.path.basename(filename).lower()
+        for pattern in outline_patterns:
+            if fnmatch.fnmatch(name, pattern.lower()):
+                return 'outline'
+        return 'pcbmill'
+    return None
+
+#---------Board of a file--------------------#
+def board_name(filename):
+    return os.path.basename(filename).split('.')[0]
+
+#---------Plan the jobs----------------------#
+# returns (jobs, skipped files)
+def plan_jobs(files, out_root, outline_patterns, drill_gcode=False):
+    stages = {'excellon': ['drill_reduce', 'drill_split'],
+              'outline': ['cutline'],
+              'pcbmill': ['G_final']}
+    if drill_gcode:
+        stages['excellon'].append('drill_gcode')
+
+    # boards with the same name in different directories get the
+    # directory name added so their outputs stay apart
+    dirs_of = collections.defaultdict(set)
+    for f in files:
+        dirs_of[board_name(f)].add(os.path.dirname(os.path.abspath(f)))
+
+    jobs = []
+    skipped = []
+    for f in files:
+        kind = classify(f, outline_patterns)
+        if kind is None:
+            skipped.append(f)
+            continue
+        board = board_name(f)
+        if len(dirs_of[board]) > 1:
+            board = os.path.basename(os.path.dirname(os.path.abspath(f))) + '_' + board
+        for stage in stages[kind]:
+            jobs.append(Job(board, stage, f, os.path.join(out_root, board)))
+    return jobs, skipped
+
+#---------Run one job------------------------#
+# runs in a worker process; every error is caught and reported
+# cache is a build_cache.BuildCache, or None to always run the stage
+def run_job(job, cache=None):
+    t0 = time.time()
+    chatter = io.StringIO()
+    try:
+        os.makedirs(job.out_dir, exist_ok=True)
+        key = None
+        if cache is not None:
+            key = build_cache.cache_key(job.stage, job.filename, STAGE_MODULES[job.stage])
+            outputs = cache.lookup(key, job.out_dir)
+            if outputs is not None:
+                return Result(job, True, outputs, time.time() - t0, 'cached')
+        with contextlib.redirect_stdout(chatter):
+            outputs = STAGES[job.stage](job.filename, job.out_dir)
+        if key is not None:
+            cache.store(key, outputs)
+        return Result(job, True, outputs, time.time() - t0, '')
+    except Exception as e:
+        return Result(job, False, [], time.time() - t0, type(e).__name__ + ": " + str(e))
+
+#---------Run all jobs-----------------------#
+# at most max_workers jobs run at once; results are in job order
+def run_batch(jobs, max_workers=None, cache=None):
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(run_job, job, cache) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # the worker itself died, e.g. out of memory
+                results.append(Result(job, False, [], 0.0, type(e).__name__ + ": " + str(e)))
+    return results
+
+#---------Summary table----------------------#
+def print_summary(results, skipped, elapsed):
+    rows = [('board', 'stage', 'file', 'status', 'secs', 'outputs')]
+    for r in results:
+        status = 'FAILED'
+        if r.ok:
+            status = 'cached' if r.message == 'cached' else 'ok'
+        detail = str(len(r.outputs)) if r.ok else r.message
+        rows.append((r.job.board, r.job.stage, os.path.basename(r.job.filename),
+                     status, '%.2f' % r.seconds, detail))
+    widths = [max(len(row[i]) for row in rows) for i in range(5)]
+    for row in rows:
+        print('  '.join(row[i].ljust(widths[i]) for i in range(5)) + '  ' + row[5])
+
+    failed = sum(1 for r in results if not r.ok)
+    boards = len(set(r.job.board for r in results))
+    print(str(len(results)) + " jobs on " + str(boards) + " boards, " +
+          str(failed) + " failed, " + str(len(skipped)) + " files skipped, " +
+          '%.2f' % elapsed + " s")
+    for f in skipped:
+        print("skipped (not Excellon or PCBmill): " + f)
+
+#---------Cache statistics-------------------#
+def print_cache_stats(results, cache, evicted):
+    hits = sum(1 for r in results if r.ok and r.message == 'cached')
+    entries, size = cache.usage()
+    print("cache: " + str(hits) + " hits, " + str(len(results) - hits) + " misses, " +
+          str(entries) + " entries, " + str(round(size / 1048576.0, 1)) + " of " +
+          str(round(cache.max_bytes / 1048576.0, 1)) + " MB, " + str(evicted) + " evicted")
+
+##############################################
+#                 MAIN
+##############################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the PCB mill scripts over many boards in parallel.")
+    parser.add_argument('paths', nargs='+',
+        help="CAM export files, globs or directories")
+    parser.add_argument('-o', '--out-dir', default='batch_out',
+        help="root directory for the per-board outputs (default batch_out)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help="number of worker processes (default: one per CPU)")
+    parser.add_argument('--outline', action='append', default=None, metavar='PATTERN',
+        help="file name pattern of outline files, may be repeated "
+             "(default: " + ' '.join(default_outline_patterns) + ")")
+    parser.add_argument('--drill-gcode', action='store_true',
+        help="also write drill G-code with drill_G_output.py")
+    parser.add_argument('--no-cache', action='store_true',
+        help="run every stage without the build cache")
+    parser.add_argument('--cache-stats', action='store_true',
+        help="print the build cache hits and size")
+    parser.add_argument('--cache-size', type=float, default=build_cache.default_max_bytes >> 20,
+        metavar='MB', help="largest size of the build cache (default " +
+                           str(build_cache.default_max_bytes >> 20) + " MB)")
+    profiling.add_arguments(parser)
+    parser.set_defaults(log_level='warning')
+    args = parser.parse_args(argv)
+
+    with profiling.session(args, 'batch'):
+        with profiling.stage('plan jobs'):
+            files = find_inputs(args.paths)
+            jobs, skipped = plan_jobs(files, args.out_dir,
+                                      args.outline or default_outline_patterns, args.drill_gcode)
+            profiling.count('files found', len(files))
+        if not jobs:
+            print("Error: no Excellon or PCBmill files found")
+            sys.exit(1)
+
+        cache = None
+        if not args.no_cache:
+            cache = build_cache.BuildCache(os.path.join(args.out_dir, '.cache'),
+                                           int(args.cache_size * 1048576))
+
+        t0 = time.time()
+        with profiling.stage('run jobs'):
+            results = run_batch(jobs, args.jobs, cache)
+            profiling.count('jobs run', len(results))
+            profiling.count('jobs cached', sum(1 for r in results if r.message == 'cached'))
+            profiling.count('jobs failed', sum(1 for r in results if not r.ok))
+        print_summary(results, skipped, time.time() - t0)
+        if cache is not None:
+            with profiling.stage('evict cache'):
+                evicted = cache.evict()
+            if args.cache_stats:
+                print_cache_stats(results, cache, evicted)
+        elif args.cache_stats:
+            print("cache: not used (--no-cache)")
+        if any(not r.ok for r in results):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+#! /usr/bin/env python
+
+#
+# bench.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   Times the scripts on made-up boards of growing size, so a change
+#   that slows them down is seen before it reaches the mill.
+#
+#   bench.py [--size small|full] [--only STAGE] [--repeat N] [--data DIR]
+#            [-o results.json] [--baseline base.json] [--threshold F]
+#
+#   The boards are written once into DIR (default bench_data) and
+#   reused:
+#     Excellon drill files with 1k to 1M holes spread over four tools,
+#     one in each of the #65, #58, #52 and #44 bins
+#     PCBmill isolation files of pads and traces, and PCBmill outline
+#     files of a board with rounded corners, from 10k to 10M segments,
+#     with the PCBmill V1.0 header
+#   --size small stops at 100k holes and 1M segments.
+#
+#   Every stage and size runs in a fresh process, so the peak memory
+#   is its own.  The best of --repeat runs is kept.  Results are
+#   written as JSON; with --baseline, every case more than --threshold
+#   (a fraction, default 0.25) slower or larger than in the baseline
+#   is reported and bench.py exits with status 1.  Slowdowns under
+#   min_slowdown seconds are taken as timer noise.
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import G_final
+import cutline
+import drill_G_output_lite
+import drill_reduce
+import profiling
+
+#--------------SETTINGS----------------------#
+hole_counts = {'small': [1000, 10000, 100000],
+               'full': [1000, 10000, 100000, 1000000]}
+segment_counts = {'small': [10000, 100000, 1000000],
+                  'full': [10000, 100000, 1000000, 10000000]}
+
+# one tool in each drill_G_output_lite bin: #65, #58, #52, #44
+bench_tools = [0.0236, 0.0394, 0.0520, 0.0860]
+
+board_size = 100.0          # mm, the synthetic boards are square
+default_threshold = 0.25
+default_repeat = 3
+min_slowdown = 0.05         # s, smaller differences are timer noise
+seed = 1
+
+PCBMILL_HEADER = [cutline.HEADER_LINE_0, cutline.HEADER_LINE_1,
+                  '%        Date: 2015-04-01', cutline.HEADER_LINE_0, '',
+                  '%', 'G90', 'G55', 'G00 Z50.0', 'F600.0 S15000 M03', 'G00 X0.0 Y0.0']
+PCBMILL_FOOTER = ['G00 Z8', 'M05', 'M02', '%']
+
+#---------Synthetic drill file---------------#
+# Eagle style Excellon: inches, 2.4 digits, leading zeros suppressed
+def make_drill_file(filename, holes):
+    rng = np.random.RandomState(seed)
+    lines = ['%', 'M48', 'M72']
+    for t, size in enumerate(bench_tools, 1):
+        lines.append('T%02dC%.4f' % (t, size))
+    lines.append('%')
+    span = int(board_size / 25.4 * 10000)
+    xy = rng.randint(0, span, size=(holes, 2)).tolist()
+    per_tool = int(math.ceil(holes / float(len(bench_tools))))
+    for t in range(len(bench_tools)):
+        lines.append('T%02d' % (t + 1))
+        lines.extend(['X%dY%d' % (x, y) for x, y in xy[t * per_tool:(t + 1) * per_tool]])
+    lines.append('M30')
+    write_lines(filename, lines)
+
+#---------Synthetic isolation file-----------#
+# round pads of 16 segments joined by straight traces, as PCBmill
+# writes them: a retract, a rapid, a plunge, then the G01 moves
+def make_isolation_file(filename, segments):
+    rng = np.random.RandomState(seed)
+    lines = list(PCBMILL_HEADER)
+    per_pad = 16
+    ang = np.linspace(0.0, 2 * np.pi, per_pad + 1)
+    done = 0
+    while done < segments:
+        n = min(segments - done, 100000)
+        pads = n // (per_pad + 1) + 1
+        centres = rng.uniform(2.0, board_size - 2.0, size=(pads, 2))
+        radius = rng.uniform(0.4, 1.2, size=pads)
+        for (cx, cy), r in zip(centres.tolist(), radius.tolist()):
+            xs = cx + r * np.cos(ang)
+            ys = cy + r * np.sin(ang)
+            lines.append('G00 Z8')
+            lines.append('G00 X%.4f Y%.4f' % (xs[0], ys[0]))
+            lines.append('G00 Z3')
+            lines.append('G01 Z-0.6 F50.0')
+            moves = ['G01 X%.4f Y%.4f' % p for p in zip(xs[1:].tolist(), ys[1:].tolist())]
+            moves[0] += ' F100.0'
+            # a trace leaving the pad
+            moves.append('G01 X%.4f Y%.4f' % (min(cx + 5.0, board_size), cy))
+            lines.extend(moves)
+            done += len(moves)
+            if done >= segments:
+                break
+    lines.extend(PCBMILL_FOOTER)
+    write_lines(filename, lines)
+
+#---------Synthetic outline file-------------#
+# one closed board edge with rounded corners, segments G01 moves long
+def make_outline_file(filename, segments):
+    t = np.linspace(0.0, 2 * np.pi, segments + 1)
+    # a superellipse: straight sides and round corners
+    c = np.cos(t)
+    s = np.sin(t)
+    half = board_size / 2
+    x = half + half * np.sign(c) * np.abs(c) ** 0.25
+    y = half + half * np.sign(s) * np.abs(s) ** 0.25
+    lines = list(PCBMILL_HEADER)
+    lines.extend(['G00 Z8', 'G00 X%.4f Y%.4f' % (x[0], y[0]), 'G00 Z3', 'G01 Z-0.6 F100.0'])
+    block = 1000000
+    for k in range(1, segments + 1, block):
+        lines.extend(['G01 X%.4f Y%.4f' % p for p in
+                      zip(x[k:k + block].tolist(), y[k:k + block].tolist())])
+    lines.extend(PCBMILL_FOOTER)
+    write_lines(filename, lines)
+
+def write_lines(filename, lines):
+    fp = open(filename, 'w', 1 << 20)
+    try:
+        for k in range(0, len(lines), 100000):
+            fp.write('\n'.join(lines[k:k + 100000]) + '\n')
+    finally:
+        fp.close()
+
+#---------The benchmarked stages-------------#
+# each takes (filename, out_dir); kind is the input it needs
+def bench_drill_reduce(filename, out_dir):
+    drill_reduce.reduce_file(filename, out_dir)
+
+def bench_drill_split(filename, out_dir):
+    drill_G_output_lite.split_drill_file(filename, out_dir)
+
+def bench_g_final(filename, out_dir):
+    G_final.finalize(filename, out_dir)
+
+def bench_cutline(filename, out_dir):
+    cutline.make_cutline_file(filename, os.path.join(out_dir, 'cutline.txt'))
+
+STAGES = [('drill_reduce', 'drill', bench_drill_reduce),
+          ('drill_split', 'drill', bench_drill_split),
+          ('G_final', 'isolation', bench_g_final),
+          ('cutline', 'outline', bench_cutline)]
+
+MAKERS = {'drill': make_drill_file, 'isolation': make_isolation_file,
+          'outline': make_outline_file}
+
+#---------The benchmark cases----------------#
+# returns a list of (name, stage, kind, count)
+def cases(size, only=None):
+    found = []
+    for stage, kind, func in STAGES:
+        if only and stage not in only:
+            continue
+        counts = hole_counts[size] if kind == 'drill' else segment_counts[size]
+        for n in counts:
+            found.append((stage + '/' + str(n), stage, kind, n))
+    return found
+
+#---------Input file of a case---------------#
+# made the first time it is needed
+def input_file(data_dir, kind, count):
+    ext = '.drd' if kind == 'drill' else '.nc'
+    filename = os.path.join(data_dir, kind + '_' + str(count) + ext)
+    if not os.path.exists(filename):
+        os.makedirs(data_dir, exist_ok=True)
+        tmp = filename + '.tmp'
+        MAKERS[kind](tmp, count)
+        os.rename(tmp, filename)
+    return filename
+
+#---------Run one case-----------------------#
+# runs in a fresh process; returns a dict of the measurements
+def run_case(stage, filename, count, repeat):
+    func = [f for name, kind, f in STAGES if name == stage][0]
+    out_dir = tempfile.mkdtemp(prefix='bench_')
+    base = profiling.peak_mb()
+    best = None
+    try:
+        for r in range(repeat):
+            t0 = time.time()
+            with contextlib.redirect_stdout(io.StringIO()):
+                func(filename, out_dir)
+            seconds = time.time() - t0
+            if best is None or seconds < best:
+                best = seconds
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    size = os.path.getsize(filename)
+    return {'stage': stage, 'items': count, 'bytes': size, 'seconds': best,
+            'items_per_s': count / max(best, 1e-9),
+            'mb_per_s': size / 1048576.0 / max(best, 1e-9),
+            'peak_mb': profiling.peak_mb(), 'start_mb': base}
+
+#---------Run the suite----------------------#
+def run_suite(size, data_dir, repeat, only=None):
+    ctx = multiprocessing.get_context('spawn')
+    results = {}
+    for name, stage, kind, count in cases(size, only):
+        filename = input_file(data_dir, kind, count)
+        pool = ctx.Pool(1)
+        try:
+            results[name] = pool.apply(run_case, (stage, filename, count, repeat))
+        finally:
+            pool.close()
+            pool.join()
+        print_result(name, results[name])
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'repeat': repeat, 'results': results}
+
+def print_result(name, r):
+    print(name.ljust(24) + ('%.3f s' % r['seconds']).rjust(11) +
+          ('%.0f /s' % r['items_per_s']).rjust(16) + ('%.1f MB/s' % r['mb_per_s']).rjust(13) +
+          ('%.0f MB peak' % r['peak_mb']).rjust(15))
+
+#---------Compare with a baseline------------#
+# returns the list of (name, what, baseline, now) worse than threshold
+def regressions(results, baseline, threshold=default_threshold):
+    found = []
+    for name, r in sorted(results['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        if (r['seconds'] > base['seconds'] * (1 + threshold) and
+                r['seconds'] - base['seconds'] > min_slowdown):
+            found.append((name, 'seconds', base['seconds'], r['seconds']))
+        if r['peak_mb'] > base['peak_mb'] * (1 + threshold):
+            found.append((name, 'peak_mb', base['peak_mb'], r['peak_mb']))
+    return found
+
+##############################################
+#                 MAIN
+##############################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the scripts on synthetic boards.")
+    parser.add_argument('--size', choices=['small', 'full'], default='small',
+        help="small: up to 100k holes and 1M segments, full: up to 1M and 10M")
+    parser.add_argument('--only', action='append', default=None, metavar='STAGE',
+        help="run only this stage, may be repeated (" +
+             ', '.join(s[0] for s in STAGES) + ")")
+    parser.add_argument('--repeat', type=int, default=default_repeat,
+        help="runs of each case, the best is kept (default " + str(default_repeat) + ")")
+    parser.add_argument('--data', default='bench_data',
+        help="directory of the synthetic boards (default bench_data)")
+    parser.add_argument('-o', '--output', default=None, metavar='JSON',
+        help="write the results to this file")
+    parser.add_argument('--baseline', default=None, metavar='JSON',
+        help="results of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=default_threshold,
+        help="fraction slower or larger than the baseline that is a "
+             "regression (default " + str(default_threshold) + ")")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline is not None:
+        try:
+            fp = open(args.baseline, 'r')
+            try:
+                baseline = json.load(fp)
+            finally:
+                fp.close()
+        except (IOError, ValueError):
+            print("Error: unable to read baseline " + str(args.baseline))
+            sys.exit(1)
+
+    results = run_suite(args.size, args.data, args.repeat, args.only)
+    if args.output is not None:
+        fp = open(args.output, 'w')
+        try:
+            json.dump(results, fp, indent=1, sort_keys=True)
+        finally:
+            fp.close()
+        print("Results written to " + args.output)
+    if baseline is None:
+        return
+    found = regressions(results, baseline, args.threshold)
+    for name, what, old, new in found:
+        print("REGRESSION " + name + " " + what + ": " + ('%.3f' % old) + " -> " + ('%.3f' % new))
+    if found:
+        sys.exit(1)
+    print("No regressions over " + str(int(args.threshold * 100)) + "% against " + args.baseline)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+#! /usr/bin/env python
+
+#
+# build_cache.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   Keeps the files a stage of the CAM-to-G-code pipeline wrote, so a
+#   re-run with the same input does not have to make them again.
+#
+#   An entry is found by a hash of
+#     the stage name and the input file's name and contents,
+#     the settings (module level numbers, strings and lists) of the
+#     stage's script and of every script it imports from this directory,
+#     and the source code of those scripts, which stands in for the
+#     tool version.
+#   Changing a layer, a feed rate or a script therefore misses the
+#   cache, and anything else is copied straight from it.
+#
+#   The cache is bounded: once it holds more than max_bytes, the least
+#   recently used entries are removed.  batch.py uses it unless given
+#   --no-cache; --cache-stats prints the hits and the cache size.
+
+import hashlib
+import json
+import os
+import shutil
+import types
+
+#--------------SETTINGS----------------------#
+default_max_bytes = 500 << 20
+META_NAME = 'entry.json'
+
+_simple_types = (bool, int, float, str, bytes, list, tuple, dict)
+
+#---------Scripts a module uses--------------#
+# return the module and every module it imports from its own directory,
+# and so on, sorted by name
+def local_modules(module):
+    here = os.path.dirname(os.path.abspath(module.__file__))
+    found = {}
+    todo = [module]
+    while todo:
+        m = todo.pop()
+        if m.__name__ in found:
+            continue
+        found[m.__name__] = m
+        for value in vars(m).values():
+            path = getattr(value, '__file__', None)
+            if (isinstance(value, types.ModuleType) and path and
+                    os.path.dirname(os.path.abspath(path)) == here):
+                todo.append(value)
+    return [found[name] for name in sorted(found)]
+
+#---------Hash a file------------------------#
+def file_digest(filename, h=None):
+    if h is None:
+        h = hashlib.sha256()
+    fp = open(filename, 'rb')
+    try:
+        while True:
+            block = fp.read(1 << 20)
+            if not block:
+                break
+            h.update(block)
+    finally:
+        fp.close()
+    return h
+
+#---------Settings of a module---------------#
+# return the module level settings as a sorted list of (name, repr)
+def settings_of(module):
+    items = []
+    for name, value in vars(module).items():
+        if name.startswith('_') or not isinstance(value, _simple_types):
+            continue
+        items.append((name, repr(value)))
+    return sorted(items)
+
+#---------Cache key of a stage run-----------#
+# stage is the stage name, module the script that runs it
+def cache_key(stage, filename, module):
+    h = hashlib.sha256()
+    h.update(stage.encode('utf-8') + b'\0')
+    h.update(os.path.basename(filename).encode('utf-8') + b'\0')
+    file_digest(filename, h)
+    for m in local_modules(module):
+        h.update(m.__name__.encode('utf-8') + b'\0')
+        h.update(repr(settings_of(m)).encode('utf-8'))
+        file_digest(m.__file__, h)
+    return h.hexdigest()
+
+#---------The cache--------------------------#
+class BuildCache(object):
+    def __init__(self, root, max_bytes=default_max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    #---------copy a stored result out----------#
+    # return the list of files written to out_dir, or None on a miss
+    def lookup(self, key, out_dir):
+        entry = self.entry_dir(key)
+        try:
+            fp = open(os.path.join(entry, META_NAME), 'r')
+            try:
+                meta = json.load(fp)
+            finally:
+                fp.close()
+            outputs = []
+            for name in meta['outputs']:
+                out_name = os.path.join(out_dir, name)
+                shutil.copyfile(os.path.join(entry, name), out_name)
+                outputs.append(out_name)
+            # mark the entry as recently used
+            os.utime(entry, None)
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+        return outputs
+
+    #---------store the files a stage wrote-----#
+    def store(self, key, outputs):
+        entry = self.entry_dir(key)
+        if os.path.isdir(entry):
+            return
+        tmp = entry + '.tmp' + str(os.getpid())
+        try:
+            os.makedirs(tmp)
+            size = 0
+            names = []
+            for f in outputs:
+                name = os.path.basename(f)
+                shutil.copyfile(f, os.path.join(tmp, name))
+                size += os.path.getsize(f)
+                names.append(name)
+            fp = open(os.path.join(tmp, META_NAME), 'w')
+            try:
+                json.dump({'outputs': names, 'bytes': size}, fp)
+            finally:
+                fp.close()
+            os.rename(tmp, entry)
+        except (IOError, OSError):
+            # another process stored it first, or the disk is full
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    #---------entries, oldest use first---------#
+    # returns a list of (last used, bytes, key)
+    def entries(self):
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for key in os.listdir(self.root):
+            entry = self.entry_dir(key)
+            meta = os.path.join(entry, META_NAME)
+            if not os.path.isfile(meta):
+                continue
+            try:
+                fp = open(meta, 'r')
+                try:
+                    size = json.load(fp)['bytes']
+                finally:
+                    fp.close()
+                found.append((os.path.getmtime(entry), size, key))
+            except (IOError, OSError, ValueError, KeyError):
+                continue
+        return sorted(found)
+
+    #---------total entries and bytes-----------#
+    def usage(self):
+        entries = self.entries()
+        return len(entries), sum(e[1] for e in entries)
+
+    #---------remove least recently used--------#
+    # returns the number of entries removed
+    def evict(self):
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        removed = 0
+        for used, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    #---------remove everything-----------------#
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
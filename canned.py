@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+
+#
+# canned.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   G81 and G83 canned drilling cycles written out as the plain G00/G01
+#   moves they stand for, for controllers without canned cycles
+#   (drill_G_output.py --cycle expanded) and for the scripts that replay
+#   a program move by move (cycle_time.py, and mill_sim.py through it).
+#
+#   G81 rapids to the hole, down to the R-plane, feeds to Z and rapids
+#   back up; G83 feeds down Q at a time, rapids out to the R-plane after
+#   every peck to clear the chips and back down to peck_clearance above
+#   the last peck.  G98 returns to the height before the cycle, G99 to
+#   the R-plane.
+
+import gcode_lexer
+
+#--------------SETTINGS----------------------#
+peck_clearance = 0.2    # mm, expanded pecks rapid back down to this far above the last peck
+
+##canned_hole(): the plain moves of one hole of a G81/G83 cycle; cycle holds
+##the cycle's words as written and the height before the cycle began
+def canned_hole(cycle,x_val,y_val,clearance):
+    output = []
+    output.append("G00 X" + str(x_val) + " Y" + str(y_val))
+    output.append("G00 Z" + cycle['R'])
+    feed = ""
+    if cycle['F'] is not None:
+        feed = " F" + cycle['F']
+    if cycle['G'] == 83 and cycle['Q'] is not None and float(cycle['Q']) > 0:
+        bottom = float(cycle['Z'])
+        level = float(cycle['R'])
+        while True:
+            level = max(level - float(cycle['Q']), bottom)
+            output.append("G01 Z" + str(round(level,4)) + feed)
+            if level <= bottom:
+                break
+            ##clear the chips, then rapid back to just above the last peck
+            output.append("G00 Z" + cycle['R'])
+            output.append("G00 Z" + str(round(level + clearance,4)))
+    else:
+        output.append("G01 Z" + cycle['Z'] + feed)
+    if cycle['retract'] == 98 and cycle['initial'] is not None:
+        output.append("G00 Z" + cycle['initial'])
+    else:
+        output.append("G00 Z" + cycle['R'])
+    return output
+
+##expand_canned(): yields the lines of a program with every G81/G83 cycle
+##written out as plain G00/G01 moves for controllers without canned cycles;
+##lines outside the cycles pass through unchanged
+def expand_canned(lines,clearance=peck_clearance):
+    cycle = None
+    retract = 98
+    z_val = None
+    x_val = None
+    y_val = None
+    for line in lines:
+        words = gcode_lexer.lex_line(line,excellon=True)
+        g_codes = [int(float(w.value)) for w in words if w.letter == 'G']
+        for g in g_codes:
+            if g in (98, 99):
+                retract = g
+        if 80 in g_codes:
+            cycle = None
+            continue
+        starts = [g for g in g_codes if g in (81, 83)]
+        if starts:
+            cycle = {'G': starts[-1], 'Z': None, 'R': None, 'Q': None, 'F': None, 'initial': z_val}
+        if cycle is None:
+            x_val = gcode_lexer.value_of(words,'X',x_val)
+            y_val = gcode_lexer.value_of(words,'Y',y_val)
+            z_val = gcode_lexer.value_of(words,'Z',z_val)
+            yield line
+            continue
+        for w in words:
+            if w.letter in 'ZRQF':
+                cycle[w.letter] = w.value
+        cycle['retract'] = retract
+        if gcode_lexer.value_of(words,'X') is None and gcode_lexer.value_of(words,'Y') is None:
+            continue
+        if cycle['Z'] is None or cycle['R'] is None:
+            raise ValueError("canned cycle without Z and R: " + line.strip())
+        x_val = gcode_lexer.value_of(words,'X',x_val)
+        y_val = gcode_lexer.value_of(words,'Y',y_val)
+        for out in canned_hole(cycle,x_val,y_val,clearance):
+            yield out
+        if cycle['retract'] == 99:
+            z_val = cycle['R']
+        elif cycle['initial'] is not None:
+            z_val = cycle['initial']
@@ -16,198 +16,225 @@
 #   Eagle.  So cutline.py takes the plane file produced by
 #   outputting the G-code from the outline layer and altering
 #   it so that it has 2mm tabs at the edge of every board.
+#
+#   The program is built as a chain of generators:
+#     outline parse -> corner detection -> pass planning -> emit
+#   With --rectangle and --origin-returns memory use does not grow with
+#   the size of the outline file.  The polygon outline, the default,
+#   reads the outline moves into memory at once and holds its flattened
+#   vertices while the passes are planned.  Other tools can import cutline and iterate over
+#   cutline.cutline(lines) to get the G-code lines directly.
+#
+#   The outline is rebuilt as the real closed polygon cut by PCBmill,
+#   with G02/G03 arcs flattened to short lines, so rounded and notched
+#   boards are cut along their edge.  tab_count tabs of tab_width mm
+#   are spread evenly by distance along the edge and moved off the
+#   corners.  The copper cut goes once round the polygon, then the FR4
+#   and through cuts follow the same loop, stepping down at the start
+#   point and only rising to z_fast_stop to hop over a tab.
+#
+#   --rectangle cuts the bounding rectangle of the outline instead,
+#   with two 10mm tabs per side, as one loop.  --origin-returns uses
+#   the original rectangle planner, which lifts to travel height and
+#   returns to the origin corner before every side.
+#
+#   cutline.py [-v] [--tabs N] [--tab-width MM] [--rectangle]
+#              [--origin-returns] [--fixture FILE] [--tools FILE] <filename>
+#     -v                echo every G-code line as it is written
+#     --tabs N          number of tabs on a polygon outline
+#     --tab-width MM    length of each tab along the edge
+#     --rectangle       cut the bounding rectangle as one loop
+#     --origin-returns  cut the bounding rectangle, original planner
+#     --fixture FILE    lift only to the clearance plane for short moves
+#                       over the board, away from the clamp zones in
+#                       FILE (see retract_plan.py and fixture.cfg)
+#     --tools FILE      feeds for the outline mill from the tool table
+#                       in FILE: faster on long straight edges, slower
+#                       into corners and plunges (see feed_plan.py and
+#                       tools.cfg)
+#     --profile, --cprofile, --log-level   see profiling.py
+#
+#   <filename> may also be a binary toolpath (.tp, see toolpath.py)
+#   made from the PCBmill outline file.
 
+import argparse
+import collections
+import logging
 import sys
 
-# conduct argument checking
-if(len(sys.argv) != 2):
-    print("Usage: cutline.py <filename>")
-    print("\t<filename> must point to the G-code file of the board")
-    print("\toutline produced in PCBmill.")
-    sys.exit()
+import numpy as np
+
+import cycle_time
+import feed_plan
+import gcode_emit
+import gcode_lexer
+import profiling
+import retract_plan
+import toolpath
+
+##############################################
+#                 SETTINGS
+##############################################
+coord_system = "G55"
 
-# ensure the argument connects to a file that be opened
-try:
-    fp = open(sys.argv[1], 'r')
-except IOError:
-    print("Error: unable to open file " + str(sys.argv[1]))
-    sys.exit()
+z_travel_height = 8.0
+z_fast_stop = 3.0
+copper_depth = -.6
+fr4_depth = -1.65
+final_depth = -2.4
+
+feed_rate = 250.0
+feed_tool = 'outline'       # the tool table entry of the outline mill
+
+spindle_spd = 15000
+
+outfile_name = 'GZ_test.txt'
+
+# polygon outlines
+tab_count = 8
+tab_width = 10.0            # mm along the edge
+tab_corner_clearance = 5.0  # mm from a corner to the nearest tab end
+corner_angle = 30.0         # degrees of turn that make a vertex a corner
+curve_angle = 0.5           # degrees of turn that put a vertex on a curve
+arc_tolerance = 0.01        # mm, largest gap between an arc and its lines
 
 # PCBmill provided G-code files begin with
 # excellon drill formats begin like this:
 #   %~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#   %        File was created with PCBMill V1.0          
-#
-# ensure the passed file matches this format
-def format_error():
-    print("Error: " + str(sys.argv[1])+ " is not a PCBMill V1.0 formatted file")
-    sys.exit()
+#   %        File was created with PCBMill V1.0
+HEADER_LINE_0 = '%~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~'
+HEADER_LINE_1 = '%        File was created with PCBMill V1.0'
+
+# the outline moves sit between the PCBmill header and footer
+OUTLINE_START = 11
+OUTLINE_END = 3
 
-lines = fp.readlines()
-if(str(lines[0]).strip() != '%~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~'):
-    format_error()
-if(str(lines[1]).rstrip() != '%        File was created with PCBMill V1.0'):
-    format_error()  
+log = logging.getLogger(__name__)
 
-print ("Arguments are good")
+#---------Check the PCBmill header---------------#
+# raise ValueError if the two lines are not a PCBMill V1.0 header
+def check_header(line0, line1):
+    if(str(line0).strip() != HEADER_LINE_0):
+        raise ValueError("not a PCBMill V1.0 formatted file")
+    if(str(line1).rstrip() != HEADER_LINE_1):
+        raise ValueError("not a PCBMill V1.0 formatted file")
 
 #---------Get X------------------------------#
 def get_x(line):    #return float value of any x in the line
-    x_val = None
     # line contains space delimited values as follows:
     #   G00 X100.3968 Y-0.3970 F100.0
-    tokens = line.split(' ')
-    for token in tokens:
-        if (token.find('X') != -1):
-            print("found an x")
-            token = token.strip()
-            token = token.strip('X')
-            x_val = float(token)
-
-    return x_val
-    
+    return gcode_lexer.value_of(gcode_lexer.lex_line(line), 'X')
+
 #---------Get Y------------------------------#
 def get_y(line):    #return float value of any y in the line
-    y_val = None
     # line contains space delimited values as follows:
     #   G00 X100.3968 Y-0.3970 F100.0
-    tokens = line.split(' ')
-    for token in tokens:
-        if (token.find('Y') != -1):
-            print("found an y")
-            token = token.strip()
-            token = token.strip('Y')
-            y_val = float(token)
-
-    return y_val
-    
+    return gcode_lexer.value_of(gcode_lexer.lex_line(line), 'Y')
+
+#---------Outline lines----------------------#
+# lines is any iterable of the PCBmill file's lines
+# yields the lines between the PCBmill header and footer
+# only OUTLINE_END lines are held back at a time
+def outline_lines(lines):
+    lines = iter(lines)
+    head = []
+    for line in lines:
+        head.append(line)
+        if len(head) == 2:
+            break
+    if len(head) < 2:
+        raise ValueError("not a PCBMill V1.0 formatted file")
+    check_header(head[0], head[1])
+
+    held = collections.deque()
+    for n, line in enumerate(lines, 2):
+        if n < OUTLINE_START:
+            continue
+        held.append(line)
+        if len(held) > OUTLINE_END:
+            yield held.popleft()
+
+#---------Outline parse----------------------#
+# yields (x, y) for every outline line, either may be None
+def outline_points(lines):
+    for n, line in enumerate(outline_lines(lines), OUTLINE_START):
+        words = gcode_lexer.lex_line(line, n)
+        yield (gcode_lexer.value_of(words, 'X'), gcode_lexer.value_of(words, 'Y'))
+
 #---------Find corners----------------------#
+# points is an iterable of (x, y) as made by outline_points()
 # return dict {x_max, x_min, y_max, y_min}
-def find_corners(lines):
+def find_corners(points):
     x_max = None
     x_min = None
     y_max = None
     y_min = None
-    
-    for line in lines[11:-3]:
-        x = get_x(line)
-        y = get_y(line)
-        if(x):
+
+    for x, y in points:
+        if(x is not None):
             #x max
-            if (x_max):
-                if(x > x_max):
-                    x_max = x
-            else:
+            if (x_max is None or x > x_max):
                 x_max = x
             #x min
-            if(x_min):
-                if(x < x_min):
-                    x_min = x
-            else:
+            if(x_min is None or x < x_min):
                 x_min = x
-        if(y):
+        if(y is not None):
             #y max
-            if (y_max):
-                if(y > y_max):
-                    y_max = y
-            else:
+            if (y_max is None or y > y_max):
                 y_max = y
             #y min
-            if(y_min):
-                if(y < y_min):
-                    y_min = y
-            else:
+            if(y_min is None or y < y_min):
                 y_min = y
     D = {'x_max': x_max, 'x_min': x_min, 'y_max': y_max, 'y_min':y_min}
-    print("corners: " + str(D))
     return D
 
 #-------Lift cutter to travel height---#
 def lift():
-    res = []
-    mv = "G00 Z" + str(z_travel_height)
-    res.append(mv)
-
-    return res
+    yield "G00 Z" + str(z_travel_height)
 
 #---------Header--------------------------#
-#return a List of lines
+#yield the lines of the program header
 def header():
-    res = []
-    mv = '%'
-    res.append(mv)
-    mv = 'G90'
-    res.append(mv)
-    mv = coord_system
-    res.append(mv)
-    mv = "G00 Z50.0"
-    res.append(mv)
-    mv = "F600.0 S"+str(spindle_spd)+" M03"
-    res.append(mv)
-    mv = 'G00 X0.0 Y0.0'
-    res.append(mv)
-    res = res + lift()
-
-    return res
+    yield '%'
+    yield 'G90'
+    yield coord_system
+    yield "G00 Z50.0"
+    yield "F600.0 S"+str(spindle_spd)+" M03"
+    yield 'G00 X0.0 Y0.0'
+    for mv in lift():
+        yield mv
 
 #--------Footer--------------------------#
 def footer():
-    res = []
-    mv = "G00 Z" +str(z_travel_height)
-    res.append(mv)
-    mv = 'G00 X0.0 Y0.0'
-    res.append(mv)
-    mv = 'M05'
-    res.append(mv)
-    mv = 'M02'
-    res.append(mv)
-    mv = '%'
-    res.append(mv)
-
-    return res
+    yield "G00 Z" +str(z_travel_height)
+    yield 'G00 X0.0 Y0.0'
+    yield 'M05'
+    yield 'M02'
+    yield '%'
 
 #---------Move to origin-----------------#
 def move_to_origin(corners):
     #takes a dictionary of corners
-    #return a list of lines
-    res = []
-    origin = "G00 X" + str(corners['x_min']) + " Y" + str(corners['y_min'])
-    res.append(origin)
+    #yield a line
+    yield "G00 X" + str(corners['x_min']) + " Y" + str(corners['y_min'])
 
-    return res                                                     
+#---------Drop to a depth---------------#
+def drop_to(depth):
+    # yield the lines to plunge to depth
+    yield "G00 Z" + str(z_fast_stop)
+    yield "G01 Z" + str(depth) + " F" + str(feed_rate)
 
 #---------Drop to copper depth----------#
 def drop_to_cd():
-    # return a list of lines
-    res = []
-    step1 = "G00 Z" + str(z_fast_stop)
-    res.append(step1)
-    step2 = "G01 Z" + str(copper_depth) + " F" + str(feed_rate)
-    res.append(step2)
-
-    return res
+    return drop_to(copper_depth)
 
 #---------Drop to fr4----------#
 def drop_to_fr4():
-    # return a list of lines
-    res = []
-    step1 = "G00 Z" + str(z_fast_stop)
-    res.append(step1)
-    step2 = "G01 Z" + str(fr4_depth) + " F" + str(feed_rate)
-    res.append(step2)
-
-    return res
+    return drop_to(fr4_depth)
 
 #---------Drop to final----------#
 def drop_to_final():
-    # return a list of lines
-    res = []
-    step1 = "G00 Z" + str(z_fast_stop)
-    res.append(step1)
-    step2 = "G01 Z" + str(final_depth) + " F" + str(feed_rate)
-    res.append(step2)
-
-    return res
+    return drop_to(final_depth)
 
 #--------Feed_rate----------------------#
 def fr():
@@ -215,18 +242,11 @@ def fr():
 
 #--------Make rectangle-----------------#
 def make_rect(corners):
-    #return a list of lines
-    res = []
-    mv = "G01 X" + str(corners['x_min']) + " Y" + str(corners['y_max']) +fr()
-    res.append(mv)
-    mv = "G01 X" + str(corners['x_max']) + " Y" + str(corners['y_max'])
-    res.append(mv)
-    mv = "G01 X" + str(corners['x_max']) + " Y" + str(corners['y_min'])
-    res.append(mv)
-    mv = "G01 X" + str(corners['x_min']) + " Y" + str(corners['y_min'])
-    res.append(mv)
-    
-    return res
+    #yield a line for each side
+    yield "G01 X" + str(corners['x_min']) + " Y" + str(corners['y_max']) +fr()
+    yield "G01 X" + str(corners['x_max']) + " Y" + str(corners['y_max'])
+    yield "G01 X" + str(corners['x_max']) + " Y" + str(corners['y_min'])
+    yield "G01 X" + str(corners['x_min']) + " Y" + str(corners['y_min'])
 
 #-------Tab btwn 2 corners---------------#
 def tab_line(c1, c2, depth):
@@ -235,7 +255,7 @@ def tab_line(c1, c2, depth):
     # c1 must be less than c2
     # I make a 10mm tab beginning 10mm away from each corner
     res = []
-    
+
     if(c1[0] == c2[0]):
         # milling a vertical line
         # x stays constant, and we generate six points
@@ -251,12 +271,12 @@ def tab_line(c1, c2, depth):
         for coord in y_list:
             res.append(str("G01 X"+str(c1[0])+" Y"+str(coord))+fr())
             if down_cut:
-                res = res + lift()
+                res.extend(lift())
             else:
                 res.append("G01 Z"+str(depth)+fr())
 
             down_cut = not down_cut
-               
+
     if(c1[1] == c2[1]):
         #milling a horizontal line
         # y stays constant, and we generate six points
@@ -272,171 +292,604 @@ def tab_line(c1, c2, depth):
         for coord in x_list:
             res.append("G01 X"+str(coord)+" Y"+str(c1[1])+fr())
             if down_cut:
-                res = res + lift()
+                res.extend(lift())
             else:
                 res.append("G01 Z"+str(depth)+fr())
 
             down_cut = not down_cut
-            
-    #add the feed rate to line[0]
-    res[0] = res[0] + fr()
-    
+
     return res
 
 #-----------Translate in X--------------------#
-def translate_x_abs(x_coord):
-    #use the last line of global output to find the x pos and tranlate to the given
-    global output
-    res = []
-
-    last_line = output[-1]
-
-    token_list = last_line.split(' ')
-    tokens = []
-    
-    for token in token_list:
-        #find the x token and change it
-        if(token.find('X') != -1):
-            token = "X"+str(x_coord)
-        #append all tokens to 
-        tokens.append(token)
-
-    mod_line = ' '.join(tokens)
- 
-    res.append(mod_line)
-    return res
+def translate_x_abs(last_line, x_coord):
+    #take the last line written and translate its x pos to the given
+    words = gcode_lexer.lex_line(last_line)
+    yield gcode_lexer.join_words(gcode_lexer.replace_value(words, 'X', x_coord))
 
 #-----------Translate in Y--------------------#
-def translate_y_abs(y_coord):
-    #use the last line of global output to find the x pos and tranlate to the given
-    global output
-    res = []
-
-    last_line = output[-1]
-
-    token_list = last_line.split(' ')
-    tokens = []
-    
-    for token in token_list:
-        #find the y token and change it
-        if(token.find('Y') != -1):
-            token = "Y"+str(y_coord)
-        #append all tokens to 
-        tokens.append(token)
-
-    mod_line = ' '.join(tokens)
- 
-    res.append(mod_line)
-    return res
+def translate_y_abs(last_line, y_coord):
+    #take the last line written and translate its y pos to the given
+    words = gcode_lexer.lex_line(last_line)
+    yield gcode_lexer.join_words(gcode_lexer.replace_value(words, 'Y', y_coord))
+
+#-----------Translate in X and Y--------------#
+# return line with dx added to its X and dy to its Y; lines without
+# X or Y come back unchanged
+def translate_line(line, dx, dy):
+    words = gcode_lexer.lex_line(line)
+    x = gcode_lexer.value_of(words, 'X')
+    y = gcode_lexer.value_of(words, 'Y')
+    if x is None and y is None:
+        return line
+    if x is not None:
+        words = gcode_lexer.replace_value(words, 'X', round(x + dx, 4))
+    if y is not None:
+        words = gcode_lexer.replace_value(words, 'Y', round(y + dy, 4))
+    return gcode_lexer.join_words(words)
+
+#-----------Tab pass around the board---------#
+# cut all four sides at depth, leaving tabs
+def tab_pass(corners, drop, depth, last):
+    x_min = corners['x_min']
+    x_max = corners['x_max']
+    y_min = corners['y_min']
+    y_max = corners['y_max']
+    origin = "G00 X" + str(x_min) + " Y" + str(y_min)
+
+    # left side
+    for mv in move_to_origin(corners): yield mv
+    for mv in drop(): yield mv
+    for mv in tab_line([x_min, y_min], [x_min, y_max], depth): yield mv
+    for mv in lift(): yield mv
+
+    # bottom side
+    for mv in move_to_origin(corners): yield mv
+    for mv in drop(): yield mv
+    for mv in tab_line([x_min, y_min], [x_max, y_min], depth): yield mv
+    for mv in lift(): yield mv
+
+    # right side
+    for mv in move_to_origin(corners): yield mv
+    for mv in translate_x_abs(origin, x_max): yield mv
+    for mv in drop(): yield mv
+    for mv in tab_line([x_max, y_min], [x_max, y_max], depth): yield mv
+    for mv in lift(): yield mv
+
+    # top side
+    for mv in move_to_origin(corners): yield mv
+    for mv in translate_y_abs(origin, y_max): yield mv
+    for mv in drop(): yield mv
+    for mv in tab_line([x_min, y_max], [x_max, y_max], depth): yield mv
+    if not last:
+        for mv in lift(): yield mv
+
+#-----------Pass planning---------------------#
+# yield every line of the outline program for the given corners
+def plan_passes(corners):
+    for mv in header(): yield mv
+
+    #---------Copper Cut-------------------------#
+    for mv in move_to_origin(corners): yield mv
+    for mv in drop_to_cd(): yield mv
+    for mv in make_rect(corners): yield mv
+    for mv in lift(): yield mv
+
+    #---------FR4 Cut----------------------------#
+    for mv in tab_pass(corners, drop_to_fr4, fr4_depth, False): yield mv
+
+    #---------------Through Cut------------------#
+    for mv in tab_pass(corners, drop_to_final, final_depth, True): yield mv
+
+    for mv in footer(): yield mv
+
+#-----------Tab stops along a side------------#
+# return the six points where the cutter goes down or up between c1 and
+# c2, in the order met going from c1 to c2; the same 10mm tabs as
+# tab_line() make, whichever end the side is cut from
+def tab_stops(c1, c2):
+    if(c1[0] == c2[0]):
+        step = 10 if c2[1] > c1[1] else -10
+        ys = [c1[1], c1[1]+step, c1[1]+2*step, c2[1]-2*step, c2[1]-step, c2[1]]
+        return [[c1[0], y] for y in ys]
+    step = 10 if c2[0] > c1[0] else -10
+    xs = [c1[0], c1[0]+step, c1[0]+2*step, c2[0]-2*step, c2[0]-step, c2[0]]
+    return [[x, c1[1]] for x in xs]
+
+#-----------Continuous tab pass---------------#
+# cut all four sides at depth as one loop, starting and ending at the
+# origin corner with the cutter down.  The loop runs the same way as
+# make_rect(): up the left side, along the top, down the right side
+# and back along the bottom.
+def loop_tab_pass(corners, depth):
+    x_min = corners['x_min']
+    x_max = corners['x_max']
+    y_min = corners['y_min']
+    y_max = corners['y_max']
+    loop = [[x_min, y_min], [x_min, y_max], [x_max, y_max], [x_max, y_min], [x_min, y_min]]
+
+    # step down in place from the pass above
+    yield "G01 Z" + str(depth) + fr()
+    for c1, c2 in zip(loop[:-1], loop[1:]):
+        stops = tab_stops(c1, c2)
+        # cut, hop the tab, cut, hop the tab, cut; the last cut ends
+        # at the next corner, which is cut straight through
+        for n in range(1, 6):
+            x, y = stops[n]
+            if n % 2 == 0:
+                yield "G00 Z" + str(z_fast_stop)
+                yield "G00 X" + str(x) + " Y" + str(y)
+                yield "G01 Z" + str(depth) + fr()
+            else:
+                yield "G01 X" + str(x) + " Y" + str(y)
+
+#-----------Continuous pass planning----------#
+# yield every line of the outline program, cutting all passes as one
+# loop with no lifts to travel height or returns to the origin
+def plan_loop_passes(corners):
+    for mv in header(): yield mv
+
+    #---------Copper Cut-------------------------#
+    for mv in move_to_origin(corners): yield mv
+    for mv in drop_to_cd(): yield mv
+    for mv in make_rect(corners): yield mv
+
+    #---------FR4 and Through Cut----------------#
+    for mv in loop_tab_pass(corners, fr4_depth): yield mv
+    for mv in loop_tab_pass(corners, final_depth): yield mv
+
+    for mv in footer(): yield mv
+
+#-----------Outline polygon-------------------#
+# lines is any iterable of the PCBmill outline file's lines
+# The outline moves are lexed in one scan and replayed with array
+# operations.  Every run of G01/G02/G03 moves between two G00 moves is
+# a contour; arcs are flattened to lines no further than arc_tolerance
+# from the arc.  returns the (N, 2) vertices of the contour enclosing
+# the largest area, closed so the last vertex is the first
+def outline_polygon(lines):
+    text = '\n'.join(line.rstrip('\n') for line in outline_lines(lines))
+    words = gcode_lexer.scan(text, 0)
+    if len(words) == 0:
+        return np.zeros((0, 2))
+    nlines = words.line[-1] + 1
+    vals = words.values()
+    motion_val, motion_has = words.per_line('G', nlines, vals, where=vals <= 3)
+    mode = gcode_lexer.fill_modal(motion_val.astype(np.int8), motion_has)
+    x = gcode_lexer.fill_modal(*words.per_line('X', nlines, vals))
+    y = gcode_lexer.fill_modal(*words.per_line('Y', nlines, vals))
+    i_val, i_has = words.per_line('I', nlines, vals)
+    j_val, j_has = words.per_line('J', nlines, vals)
+
+    # the PCBmill header leaves the cutter at X0 Y0
+    x_prev = np.concatenate(([0.0], x[:-1]))
+    y_prev = np.concatenate(([0.0], y[:-1]))
+    arc = ((mode == 2) | (mode == 3)) & (i_has | j_has)
+    return polygon_of_moves(mode, x_prev, y_prev, x, y, i_val, j_val, arc)
+
+#-----------Outline of a binary toolpath------#
+# path is a toolpath.Toolpath of a PCBmill outline file
+def toolpath_polygon(path):
+    header = path.header['preamble']
+    if len(header) < 2:
+        raise ValueError("not a PCBMill V1.0 formatted file")
+    check_header(header[0], header[1])
+    moves = path.moves
+    if len(moves) == 0:
+        return np.zeros((0, 2))
+    x, y, z = toolpath.positions(path)
+    mode = moves['kind'].astype(np.int8)
+    return polygon_of_moves(mode, x[:-1], y[:-1], x[1:], y[1:], moves['i'], moves['j'],
+                            mode >= toolpath.CW)
+
+#-----------Outline of a list of moves--------#
+# every move goes from (x_prev, y_prev) to (x, y) in mode 0 to 3;
+# arc is True for G02/G03 moves with a centre offset i, j
+def polygon_of_moves(mode, x_prev, y_prev, x, y, i_val, j_val, arc):
+    moved = (x != x_prev) | (y != y_prev)
+    cut = (mode != 0) & (moved | arc)
+    contour = np.cumsum((mode == 0) & moved)
+    k = np.flatnonzero(cut)
+    if len(k) == 0:
+        return np.zeros((0, 2))
+
+    # every cut move becomes n points, the last one its end point
+    sx, sy, ex, ey = x_prev[k], y_prev[k], x[k], y[k]
+    ci, cj = i_val[k], j_val[k]
+    is_arc = arc[k]
+    cw = mode[k] == 2
+    radius = np.hypot(ci, cj)
+    sweep = cycle_time.arc_sweep(sx, sy, ex, ey, ci, cj, cw)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step = 2 * np.arccos(np.clip(1 - arc_tolerance / radius, 0.0, 1.0))
+        n = np.where(is_arc & (step > 0), np.ceil(sweep / step), 1)
+    n = np.maximum(n, 1).astype(np.int64)
+    move = np.repeat(np.arange(len(k)), n)
+    frac = (np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n) + 1) / n[move]
+    ang = (np.arctan2(sy - (sy + cj), sx - (sx + ci))[move] +
+           np.where(cw[move], -1.0, 1.0) * sweep[move] * frac)
+    px = np.where(is_arc[move], (sx + ci)[move] + radius[move] * np.cos(ang),
+                  sx[move] + (ex - sx)[move] * frac)
+    py = np.where(is_arc[move], (sy + cj)[move] + radius[move] * np.sin(ang),
+                  sy[move] + (ey - sy)[move] * frac)
+    end = frac == 1
+    px[end] = ex[move[end]]
+    py[end] = ey[move[end]]
+    point_contour = contour[k][move]
+
+    # the contour enclosing the largest area is the board edge
+    best = None
+    best_area = 0.0
+    for c in np.unique(point_contour).tolist():
+        first = np.flatnonzero(contour[k] == c)[0]
+        sel = point_contour == c
+        poly = np.column_stack((np.concatenate(([sx[first]], px[sel])),
+                                np.concatenate(([sy[first]], py[sel]))))
+        area = abs(polygon_area(poly))
+        if best is None or area > best_area:
+            best = poly
+            best_area = area
+    return close_polygon(best)
+
+#-----------Tidy a polygon--------------------#
+# drop repeated vertices and make the last vertex the first
+def close_polygon(poly):
+    keep = np.ones(len(poly), dtype=bool)
+    keep[1:] = np.hypot(*np.diff(poly, axis=0).T) > 1e-9
+    poly = poly[keep]
+    if np.hypot(*(poly[-1] - poly[0])) > 1e-6:
+        poly = np.vstack((poly, poly[:1]))
+    else:
+        poly[-1] = poly[0]
+    return poly
+
+#-----------Signed area of a polygon----------#
+def polygon_area(poly):
+    x = poly[:, 0]
+    y = poly[:, 1]
+    return 0.5 * float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]) +
+                       x[-1] * y[0] - x[0] * y[-1])
+
+#-----------Bounds and perimeter--------------#
+# return dict {x_max, x_min, y_max, y_min, perimeter} of a closed polygon
+def polygon_stats(poly):
+    lo = poly.min(axis=0)
+    hi = poly.max(axis=0)
+    return {'x_max': float(hi[0]), 'x_min': float(lo[0]),
+            'y_max': float(hi[1]), 'y_min': float(lo[1]),
+            'perimeter': float(np.hypot(*np.diff(poly, axis=0).T).sum())}
+
+#-----------Distance along the edge-----------#
+# return the distance from the first vertex to every vertex
+def edge_positions(poly):
+    return np.concatenate(([0.0], np.cumsum(np.hypot(*np.diff(poly, axis=0).T))))
+
+#-----------Corners of a polygon--------------#
+# return the edge positions of the vertices where the edge turns by more
+# than corner_angle degrees, and of every vertex of a curve that turns
+# by more than corner_angle in all: a flattened arc turns only a few
+# degrees at each vertex, so a rounded corner is a run of vertices that
+# each turn by more than curve_angle.  The start point, where the passes
+# step down, counts as a corner at both ends of the loop
+def corner_positions(poly, s):
+    d = np.diff(poly, axis=0)
+    d_in = np.vstack((d[-1:], d[:-1]))
+    cross = d_in[:, 0] * d[:, 1] - d_in[:, 1] * d[:, 0]
+    dot = (d_in * d).sum(axis=1)
+    turn = np.degrees(np.abs(np.arctan2(cross, dot)))
+    corner = turn > corner_angle
+    curved = np.flatnonzero(turn > curve_angle)
+    if len(curved):
+        # runs of consecutive curved vertices and the turn of each
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(curved) > 1) + 1))
+        total = np.add.reduceat(turn[curved], starts)
+        if len(starts) > 1 and curved[0] == 0 and curved[-1] == len(turn) - 1:
+            # the run through the start point goes round the end of the loop
+            total[0] = total[-1] = total[0] + total[-1]
+        run = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(curved))))
+        corner[curved] |= total[run] > corner_angle
+    corners = s[:-1][corner]
+    return np.unique(np.concatenate((corners, [0.0, s[-1]])))
+
+#-----------Place tabs------------------------#
+# perimeter and corners are edge positions as made above
+# Tabs are spread evenly along the edge, then each one is moved to the
+# nearest place where both its ends are at least clearance from every
+# corner and at least a tab width from every tab already placed, so
+# there is always a cut between two tabs.  Tabs that fit
+# nowhere are left out with a warning.  returns a sorted list of
+# (start, end)
+def place_tabs(perimeter, corners, count=None, width=None, clearance=None):
+    if count is None:
+        count = tab_count
+    if width is None:
+        width = tab_width
+    if clearance is None:
+        clearance = tab_corner_clearance
+    if count <= 0 or width <= 0:
+        return []
+    half = clearance + width / 2.0
+    spacing = perimeter / count
+    tabs = []
+    for n in range(count):
+        want = spacing * (n + 0.5)
+        cand = np.concatenate(([want], corners - half, corners + half))
+        cand = cand[(cand >= half) & (cand <= perimeter - half)]
+        # distance from every candidate to its nearest corner
+        idx = np.clip(np.searchsorted(corners, cand), 1, len(corners) - 1)
+        near = np.minimum(np.abs(cand - corners[idx - 1]), np.abs(corners[idx] - cand))
+        ok = near >= half - 1e-9
+        for a, b in tabs:
+            ok &= (cand + 1.5 * width <= a + 1e-9) | (cand - 1.5 * width >= b - 1e-9)
+        if not ok.any():
+            continue
+        cand = cand[ok]
+        best = float(cand[np.argmin(np.abs(cand - want))])
+        tabs.append((best - width / 2.0, best + width / 2.0))
+    if len(tabs) < count:
+        log.warning("only " + str(len(tabs)) + " of " + str(count) + " tabs fit on the outline "
+                    "clear of its corners; the board is held by fewer tabs")
+    return sorted(tabs)
+
+#-----------Polygon coordinates---------------#
+def xy_words(x, y):
+    return "X" + str(round(float(x), 4)) + " Y" + str(round(float(y), 4))
+
+#-----------Tab pass around a polygon---------#
+# poly is a closed polygon, s its edge positions, tabs from place_tabs()
+# cut the whole loop at depth starting and ending at poly[0] with the
+# cutter down, rising to z_fast_stop to rapid over every tab
+def polygon_tab_pass(poly, s, tabs, depth):
+    # every vertex and tab end, in order along the edge
+    ends = [p for tab in tabs for p in tab]
+    stops = np.concatenate((s, ends))
+    kind = np.concatenate((np.zeros(len(s), dtype=int), np.tile([1, 2], len(tabs))))
+    order = np.lexsort((kind, stops))
+    stops = stops[order]
+    kind = kind[order]
+    xs = np.interp(stops, s, poly[:, 0])
+    ys = np.interp(stops, s, poly[:, 1])
+
+    yield "G01 Z" + str(depth) + fr()
+    over_tab = False
+    for x, y, k in zip(xs[1:].tolist(), ys[1:].tolist(), kind[1:].tolist()):
+        if k == 1:
+            # tab start: cut up to it and lift
+            yield "G01 " + xy_words(x, y)
+            yield "G00 Z" + str(z_fast_stop)
+            over_tab = True
+        elif k == 2:
+            # tab end: rapid to it and plunge
+            yield "G00 " + xy_words(x, y)
+            yield "G01 Z" + str(depth) + fr()
+            over_tab = False
+        elif not over_tab:
+            yield "G01 " + xy_words(x, y)
+
+#-----------Polygon pass planning-------------#
+# yield every line of the outline program for a closed polygon
+def plan_polygon_passes(poly, tabs):
+    s = edge_positions(poly)
+    for mv in header(): yield mv
+
+    #---------Copper Cut-------------------------#
+    yield "G00 " + xy_words(poly[0][0], poly[0][1])
+    for mv in drop_to_cd(): yield mv
+    first = True
+    for x, y in poly[1:].tolist():
+        yield "G01 " + xy_words(x, y) + (fr() if first else '')
+        first = False
+
+    #---------FR4 and Through Cut----------------#
+    for mv in polygon_tab_pass(poly, s, tabs, fr4_depth): yield mv
+    for mv in polygon_tab_pass(poly, s, tabs, final_depth): yield mv
+
+    for mv in footer(): yield mv
+
+#-----------Tabs for a polygon----------------#
+def polygon_tabs(poly, count=None, width=None):
+    s = edge_positions(poly)
+    return place_tabs(s[-1], corner_positions(poly, s), count, width)
+
+#-----------Choose a planner------------------#
+def planner(origin_returns=False):
+    if origin_returns:
+        return plan_passes
+    return plan_loop_passes
+
+#-----------Cutline program-------------------#
+# lines is any iterable of the PCBmill outline file's lines
+# yields the lines of the outline program, without line endings and
+# without the words that repeat the modal state (see gcode_emit.py)
+# raises ValueError if the file is not a PCBMill V1.0 file or has no
+# outline moves
+# rectangle cuts the bounding rectangle instead of the polygon
+# fixture, a retract_plan.Fixture, lowers the lifts of short moves
+# tools, a feed_plan.Tools, sets the feed of every move for its kind
+def cutline(lines, origin_returns=False, rectangle=False, tabs=None, width=None,
+            fixture=None, tools=None):
+    if rectangle or origin_returns:
+        corners = find_corners(outline_points(lines))
+        if None in corners.values():
+            raise ValueError("no outline moves")
+        program = planner(origin_returns)(corners)
+    else:
+        poly = outline_polygon(lines)
+        if len(poly) < 4:
+            raise ValueError("no outline moves")
+        program = plan_polygon_passes(poly, polygon_tabs(poly, tabs, width))
+    if fixture is not None:
+        program = retract_plan.plan_retracts(program, fixture)
+    if tools is not None:
+        program = feed_plan.schedule_feeds(program, tools, feed_tool)
+    for mv in gcode_emit.compact(program):
+        yield mv
+
+#-----------Savings of the loop planner-------#
+# return (origin planner, loop planner) cycle_time estimates
+def pass_savings(corners):
+    return (cycle_time.estimate_lines(plan_passes(corners)),
+            cycle_time.estimate_lines(plan_loop_passes(corners)))
+
+def report_savings(corners):
+    old, new = pass_savings(corners)
+    print("Continuous passes: rapid XY " + str(round(old.rapid_mm, 1)) + " mm -> " +
+          str(round(new.rapid_mm, 1)) + " mm, Z moves " + str(round(old.z_mm, 1)) +
+          " mm -> " + str(round(new.z_mm, 1)) + " mm")
+    print("Estimated run time " + cycle_time.hms(old.total()) + " -> " +
+          cycle_time.hms(new.total()) + ", saves " +
+          cycle_time.hms(old.total() - new.total()))
+
+#-----------Emit------------------------------#
+# write the program through one buffered writer, leaving out the words
+# that repeat the modal state (see gcode_emit.py) and logging every line
+# at debug level with verbose; returns the number of lines written
+def emit(program, out_fp, verbose=False):
+    echo = verbose and log.isEnabledFor(logging.DEBUG)
+    count = 0
+    for line in gcode_emit.compact(program):
+        if echo:
+            log.debug(line)
+        out_fp.write(line + '\n')
+        count += 1
+    profiling.count('lines written', count)
+    return count
+
+#-----------Cut an outline file--------------#
+# writes the outline program for filename to out_name
+# raises IOError if the file cannot be read, ValueError if it is not
+# a PCBMill V1.0 file; returns out_name
+# report prints the outline found, or for rectangles the travel and
+# time saved by the loop planner, the Z travel the fixture saves and the
+# time the feeds save
+# fixture, a retract_plan.Fixture, lowers the lifts of short moves
+# tools, a feed_plan.Tools, sets the feed of every move for its kind
+def make_cutline_file(filename, out_name=None, verbose=False, origin_returns=False,
+                      report=False, rectangle=False, tabs=None, width=None, fixture=None,
+                      tools=None):
+    if out_name is None:
+        out_name = outfile_name
+    rectangle = rectangle or origin_returns
+    with profiling.stage('read outline'):
+        profiling.count_file('bytes read', filename)
+        if toolpath.is_toolpath(filename):
+            poly = toolpath_polygon(toolpath.load(filename))
+            if rectangle:
+                corners = find_corners(poly.tolist())
+        else:
+            fp = open(filename, 'r')
+            try:
+                if rectangle:
+                    corners = find_corners(outline_points(fp))
+                else:
+                    poly = outline_polygon(fp)
+            except ValueError as e:
+                raise ValueError(str(filename) + " is " + str(e))
+            finally:
+                fp.close()
+    if rectangle:
+        if None in corners.values():
+            raise ValueError(str(filename) + " has no outline moves")
+        program = planner(origin_returns)(corners)
+    else:
+        if len(poly) < 4:
+            raise ValueError(str(filename) + " has no outline moves")
+        tab_list = polygon_tabs(poly, tabs, width)
+        program = plan_polygon_passes(poly, tab_list)
+    lift_stats = retract_plan.new_stats()
+    if fixture is not None:
+        program = retract_plan.plan_retracts(program, fixture, lift_stats)
+    feed_stats = feed_plan.new_stats()
+    if tools is not None:
+        program = feed_plan.schedule_feeds(program, tools, feed_tool, feed_stats)
+
+    with profiling.stage('plan and write passes'):
+        out_fp = open(out_name, 'w', 1 << 16)
+        try:
+            emit(program, out_fp, verbose)
+        finally:
+            out_fp.close()
+        profiling.count_file('bytes written', out_name)
+    if report:
+        if not rectangle:
+            stats = polygon_stats(poly)
+            print("Outline: " + str(len(poly) - 1) + " vertices, " +
+                  str(round(stats['x_max'] - stats['x_min'], 3)) + " x " +
+                  str(round(stats['y_max'] - stats['y_min'], 3)) + " mm, perimeter " +
+                  str(round(stats['perimeter'], 1)) + " mm, " + str(len(tab_list)) + " tabs")
+        elif not origin_returns:
+            report_savings(corners)
+        if fixture is not None:
+            retract_plan.report(out_name, lift_stats)
+        if tools is not None:
+            feed_plan.report(out_name, feed_stats)
+    return out_name
 
 ##############################################
 #                 MAIN
 ##############################################
-coord_system = "G55"
-
-z_travel_height = 8.0
-z_fast_stop = 3.0
-copper_depth = -.6
-fr4_depth = -1.65
-final_depth = -2.4
-
-feed_rate = 250.0
-
-spindle_spd = 15000
-
-output = []   #List of string lines of G-code
-
-corners = find_corners(lines)
-
-output = output + header()
-
-output = output + move_to_origin(corners)
-
-output = output + drop_to_cd()
-
-output = output + make_rect(corners)
-
-output = output + lift()
-
-#---------FR4 Cut----------------------------#
-output = output + move_to_origin(corners)
-
-output = output + drop_to_fr4()
-
-output = output + tab_line([corners['x_min'], corners['y_min']], [corners['x_min'], corners['y_max']], fr4_depth)
-
-output = output + lift()
-
-output = output + move_to_origin(corners)
-
-output = output + drop_to_fr4()
-
-output = output + tab_line([corners['x_min'], corners['y_min']], [corners['x_max'], corners['y_min']], fr4_depth)
-
-output = output + lift()
-
-output = output + move_to_origin(corners)
-
-output = output + translate_x_abs(corners['x_max'])
-
-output = output + drop_to_fr4()
-
-output = output + tab_line([corners['x_max'], corners['y_min']], [corners['x_max'], corners['y_max']], fr4_depth)
-
-output = output + lift()
-
-output = output + move_to_origin(corners)
-
-output = output + translate_y_abs(corners['y_max'])
-
-output = output + drop_to_fr4()
-
-output = output + tab_line([corners['x_min'], corners['y_max']], [corners['x_max'], corners['y_max']], fr4_depth)
-
-output = output + lift()
-
-#---------------Through Cut------------------#
-output = output + move_to_origin(corners)
-
-output = output + drop_to_final()
-
-output = output + tab_line([corners['x_min'], corners['y_min']], [corners['x_min'], corners['y_max']], final_depth)
-
-output = output + lift()
-
-output = output + move_to_origin(corners)
-
-output = output + drop_to_final()
-
-output = output + tab_line([corners['x_min'], corners['y_min']], [corners['x_max'], corners['y_min']], final_depth)
-
-output = output + lift()
-
-output = output + move_to_origin(corners)
-
-output = output + translate_x_abs(corners['x_max'])
-
-output = output + drop_to_final()
-
-output = output + tab_line([corners['x_max'], corners['y_min']], [corners['x_max'], corners['y_max']], final_depth)
-
-output = output + lift()
-
-output = output + move_to_origin(corners)
-
-output = output + translate_y_abs(corners['y_max'])
-
-output = output + drop_to_final()
-
-output = output + tab_line([corners['x_min'], corners['y_max']], [corners['x_max'], corners['y_max']], final_depth)
-
-output = output + footer()
-
-outfile_name = 'GZ_test.txt'
-out_fp = open(outfile_name, 'w')
-
-for line in output:
-    print line.rstrip()
-    out_fp.write(line+'\n')
-
-    
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Make the tabbed outline cut from a PCBmill outline file.")
+    parser.add_argument('filename',
+        help="the G-code file of the board outline produced in PCBmill")
+    parser.add_argument('-v', '--verbose', action='store_true',
+        help="echo every G-code line as it is written (same as --log-level debug)")
+    parser.add_argument('--tabs', type=int, default=tab_count,
+        help="number of tabs on a polygon outline (default " + str(tab_count) + ")")
+    parser.add_argument('--tab-width', type=float, default=tab_width,
+        help="tab length along the edge in mm (default " + str(tab_width) + ")")
+    parser.add_argument('--rectangle', action='store_true',
+        help="cut the bounding rectangle of the outline as one loop")
+    parser.add_argument('--origin-returns', action='store_true',
+        help="cut the bounding rectangle, lifting and returning to the "
+             "origin corner before every side")
+    parser.add_argument('--fixture', default=None, metavar='FILE',
+        help="clearance plane and clamp zones for lowering the lifts of short moves "
+             "(see retract_plan.py and fixture.cfg)")
+    parser.add_argument('--tools', default=None, metavar='FILE',
+        help="tool table with the feeds of the outline mill for every kind of move "
+             "(see feed_plan.py and tools.cfg)")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.verbose:
+        args.log_level = 'debug'
+    fixture = None
+    if args.fixture is not None:
+        try:
+            fixture = retract_plan.read_fixture(args.fixture)
+        except IOError:
+            print("Error: unable to open fixture file " + str(args.fixture))
+            sys.exit()
+        except ValueError as e:
+            print("Error: " + str(e))
+            sys.exit()
+    tools = None
+    if args.tools is not None:
+        try:
+            tools = feed_plan.read_tools(args.tools)
+        except IOError:
+            print("Error: unable to open tool table " + str(args.tools))
+            sys.exit()
+        except ValueError as e:
+            print("Error: " + str(e))
+            sys.exit()
+
+    with profiling.session(args, 'cutline'):
+        # ensure the argument connects to a file that be opened
+        try:
+            out_name = make_cutline_file(args.filename, verbose=True,
+                                         origin_returns=args.origin_returns, report=True,
+                                         rectangle=args.rectangle, tabs=args.tabs,
+                                         width=args.tab_width, fixture=fixture,
+                                         tools=tools)
+        except IOError:
+            print("Error: unable to open file " + str(args.filename))
+            sys.exit()
+        except ValueError as e:
+            print("Error: " + str(e))
+            sys.exit()
+
+        print("Outline G-code stored in: " + out_name)
+
+if __name__ == '__main__':
+    main()
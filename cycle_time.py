@@ -0,0 +1,280 @@
+#! /usr/bin/env python
+
+#
+# cycle_time.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   Predicts how long the mill will take to run a G-code file written
+#   by PCBmill, G_final.py, cutline.py or drill_G_output.py.
+#
+#   cycle_time.py [options] <filename> [<filename> ...]
+#
+#   The file is replayed line by line with the modal state of the
+#   controller: the motion mode (G00, G01, G02, G03), the feed rate F
+#   and the X, Y and Z position carry over from line to line.  Every
+#   move is taken to start and end at rest (no look-ahead between
+#   lines), so the estimate errs on the long side for jobs made of
+#   many short moves.
+#
+#   The time is split into
+#     cutting             G01/G02/G03 moves in X and Y
+#     rapid XY            G00 moves in X and Y
+#     Z plunge/retract    moves along Z only, at rapid or feed rate
+#     tool changes        one per M06, and one before every file after
+#                         the first when several files are given
+#
+#   Binary toolpath files (.tp, see toolpath.py) are timed from their
+#   moves directly.  G81 and G83 canned drilling cycles (drill_G_output.py --cycle
+#   canned) are timed as the plain moves they stand for.
+#
+#   Rates are in mm/min like the F words of the files, acceleration
+#   in mm/s^2.  The defaults are the MDX-40A's maximum speeds.
+#
+#   --profile, --cprofile and --log-level are described in profiling.py.
+
+import argparse
+import collections
+import os
+import re
+import sys
+
+import numpy as np
+
+import canned
+import gcode_lexer
+import profiling
+import toolpath
+
+#--------------SETTINGS----------------------#
+rapid_xy_rate = 3000.0      # mm/min, G00 speed in X and Y
+rapid_z_rate = 1800.0       # mm/min, G00 speed in Z
+acceleration = 500.0        # mm/s^2, on the path
+tool_change_time = 60.0     # s, stop, change the bit, zero Z and restart
+default_feed = 100.0        # mm/min, used until the file sets F
+
+_canned_re = re.compile(r'G\s*0*8[13](?!\d)')
+_canned_bytes_re = re.compile(br'G\s*0*8[13](?!\d)')
+
+Machine = collections.namedtuple('Machine', 'rapid_xy rapid_z accel tool_change')
+default_machine = Machine(rapid_xy_rate, rapid_z_rate, acceleration, tool_change_time)
+
+#---------Estimated run time-----------------#
+# times in seconds, distances in mm
+class Estimate(object):
+    def __init__(self, cutting=0.0, rapid_xy=0.0, z_moves=0.0, tool_changes=0.0,
+                 cut_mm=0.0, rapid_mm=0.0, z_mm=0.0, changes=0):
+        self.cutting = cutting
+        self.rapid_xy = rapid_xy
+        self.z_moves = z_moves
+        self.tool_changes = tool_changes
+        self.cut_mm = cut_mm
+        self.rapid_mm = rapid_mm
+        self.z_mm = z_mm
+        self.changes = changes
+
+    def total(self):
+        return self.cutting + self.rapid_xy + self.z_moves + self.tool_changes
+
+    def __add__(self, other):
+        return Estimate(self.cutting + other.cutting, self.rapid_xy + other.rapid_xy,
+                        self.z_moves + other.z_moves, self.tool_changes + other.tool_changes,
+                        self.cut_mm + other.cut_mm, self.rapid_mm + other.rapid_mm,
+                        self.z_mm + other.z_mm, self.changes + other.changes)
+
+#---------Time for straight moves------------#
+# length in mm, speed in mm/s, accel in mm/s^2
+# each move starts and ends at rest: a trapezoid speed profile, or a
+# triangle when the move is too short to reach full speed
+def move_time(length, speed, accel):
+    ramp = speed * speed / accel
+    return np.where(length >= ramp,
+                    length / speed + speed / accel,
+                    2.0 * np.sqrt(length / accel))
+
+#---------Angle swept by arcs----------------#
+# x0, y0 start, x1, y1 end, i, j centre offset from the start
+# cw is True for G02; an arc that ends where it starts is a full circle
+# returns the sweep in radians, always positive
+def arc_sweep(x0, y0, x1, y1, i, j, cw):
+    cx = x0 + i
+    cy = y0 + j
+    a0 = np.arctan2(y0 - cy, x0 - cx)
+    a1 = np.arctan2(y1 - cy, x1 - cx)
+    sweep = np.where(cw, a0 - a1, a1 - a0) % (2 * np.pi)
+    closed = (np.abs(x1 - x0) < 1e-9) & (np.abs(y1 - y0) < 1e-9)
+    return np.where(closed, 2 * np.pi, sweep)
+
+#---------Length of arcs---------------------#
+def arc_length(x0, y0, x1, y1, i, j, cw):
+    return np.hypot(i, j) * arc_sweep(x0, y0, x1, y1, i, j, cw)
+
+#---------Expand canned cycles---------------#
+# return data with any G81/G83 cycles written out as plain moves
+def expand_cycles(data):
+    if isinstance(data, bytes):
+        if not _canned_bytes_re.search(data):
+            return data
+        data = data.decode('ascii', 'replace')
+    elif not _canned_re.search(data):
+        return data
+    return '\n'.join(canned.expand_canned(data.splitlines()))
+
+#---------Estimate a whole program-----------#
+# data is the text of a G-code file, str or bytes
+def estimate(data, machine=default_machine):
+    data = expand_cycles(data)
+    words = gcode_lexer.scan(data, 0)
+    if len(words) == 0:
+        return Estimate()
+    nlines = words.line[-1] + 1
+    profiling.count('lines read', int(nlines))
+    vals = words.values()
+
+    # modal state after every line
+    motion_val, motion_has = words.per_line('G', nlines, vals, where=vals <= 3)
+    motion = gcode_lexer.fill_modal(motion_val.astype(np.int8), motion_has)
+    feed = gcode_lexer.fill_modal(*words.per_line('F', nlines, vals), initial=default_feed)
+    x = gcode_lexer.fill_modal(*words.per_line('X', nlines, vals))
+    y = gcode_lexer.fill_modal(*words.per_line('Y', nlines, vals))
+    z_val, z_has = words.per_line('Z', nlines, vals)
+    # nothing is known about Z before the first Z word, so start there
+    z0 = z_val[np.argmax(z_has)] if z_has.any() else 0.0
+    z = gcode_lexer.fill_modal(z_val, z_has, initial=z0)
+    i_val, i_has = words.per_line('I', nlines, vals)
+    j_val, j_has = words.per_line('J', nlines, vals)
+    mode = motion[1:]
+    arc = ((mode == 2) | (mode == 3)) & (i_has[1:] | j_has[1:])
+    changes = int(np.count_nonzero((words.letter == ord('M')) & (vals == 6)))
+    return estimate_moves(mode, x, y, z, feed[1:], i_val[1:], j_val[1:], arc, changes, machine)
+
+#---------Estimate a list of moves-----------#
+# x, y and z hold the start position and the end of every move; mode,
+# feed, i, j and arc (True for G02/G03 moves with a centre) one entry
+# per move.  Moves that go nowhere take no time.
+def estimate_moves(mode, x, y, z, feed, i_val, j_val, arc, changes, machine=default_machine):
+    profiling.count('moves timed', len(mode))
+    dx = np.diff(x)
+    dy = np.diff(y)
+    dz = np.diff(z)
+    xy = np.hypot(dx, dy)
+    if arc.any():
+        xy[arc] = arc_length(x[:-1][arc], y[:-1][arc], x[1:][arc], y[1:][arc],
+                             i_val[arc], j_val[arc], mode[arc] == 2)
+    length = np.hypot(xy, np.abs(dz))
+    moving = length > 0.0
+
+    # path speed: the feed (or rapid) rate, held down so that neither
+    # the XY nor the Z axis goes faster than its rapid rate
+    rapid = mode == 0
+    speed = np.where(rapid, np.inf, feed)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.minimum(speed, np.where(xy > 0, machine.rapid_xy * length / xy, np.inf))
+        speed = np.minimum(speed, np.where(dz != 0, machine.rapid_z * length / np.abs(dz), np.inf))
+    speed = np.where(moving, speed, 1.0) / 60.0
+    t = np.where(moving, move_time(length, speed, machine.accel), 0.0)
+
+    is_z = moving & (xy == 0)
+    is_rapid = moving & rapid & ~is_z
+    is_cut = moving & ~rapid & ~is_z
+    return Estimate(float(t[is_cut].sum()), float(t[is_rapid].sum()),
+                    float(t[is_z].sum()), changes * machine.tool_change,
+                    float(length[is_cut].sum()), float(length[is_rapid].sum()),
+                    float(length[is_z].sum()), changes)
+
+#---------Estimate a binary toolpath---------#
+# path is a toolpath.Toolpath; a change of tool between moves counts
+# as a tool change
+def estimate_toolpath(path, machine=default_machine):
+    moves = path.moves
+    if len(moves) == 0:
+        return Estimate()
+    x, y, z = toolpath.positions(path)
+    mode = moves['kind'].astype(np.int8)
+    feed = moves['feed'].astype(np.float64)
+    feed[feed <= 0] = default_feed
+    tool = moves['tool']
+    changes = int(np.count_nonzero(tool[1:] != tool[:-1]))
+    return estimate_moves(mode, x, y, z, feed, moves['i'], moves['j'],
+                          mode >= toolpath.CW, changes, machine)
+
+#---------Estimate generated lines-----------#
+# lines is any iterable of G-code lines, with or without newlines
+def estimate_lines(lines, machine=default_machine):
+    return estimate('\n'.join(line.rstrip('\n') for line in lines), machine)
+
+#---------Estimate a file--------------------#
+def estimate_file(filename, machine=default_machine):
+    with profiling.stage('estimate ' + os.path.basename(filename)):
+        profiling.count_file('bytes read', filename)
+        if toolpath.is_toolpath(filename):
+            return estimate_toolpath(toolpath.load(filename), machine)
+        fp = open(filename, 'rb')
+        try:
+            data = fp.read()
+        finally:
+            fp.close()
+        return estimate(data, machine)
+
+#---------Estimate a job of several files----#
+# the files run one after the other with a bit change between them
+def estimate_job(filenames, machine=default_machine):
+    estimates = [estimate_file(f, machine) for f in filenames]
+    total = Estimate()
+    for e in estimates:
+        total = total + e
+    between = max(len(filenames) - 1, 0)
+    total.changes += between
+    total.tool_changes += between * machine.tool_change
+    return estimates, total
+
+#---------Seconds as h:mm:ss-----------------#
+def hms(seconds):
+    seconds = int(round(seconds))
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    if h:
+        return '%d:%02d:%02d' % (h, m, s)
+    return '%d:%02d' % (m, s)
+
+#---------Print one estimate-----------------#
+def report(name, e):
+    print(name + ": " + hms(e.total()))
+    print("  cutting           " + hms(e.cutting).rjust(9) + "  " + str(round(e.cut_mm, 1)) + " mm")
+    print("  rapid XY          " + hms(e.rapid_xy).rjust(9) + "  " + str(round(e.rapid_mm, 1)) + " mm")
+    print("  Z plunge/retract  " + hms(e.z_moves).rjust(9) + "  " + str(round(e.z_mm, 1)) + " mm")
+    print("  tool changes      " + hms(e.tool_changes).rjust(9) + "  " + str(e.changes))
+
+##############################################
+#                 MAIN
+##############################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Estimate the run time of G-code files on the mill.")
+    parser.add_argument('filenames', nargs='+', metavar='filename',
+        help="G-code files, run in the order given")
+    parser.add_argument('--rapid-xy', type=float, default=rapid_xy_rate,
+        help="G00 rate in X and Y, mm/min (default " + str(rapid_xy_rate) + ")")
+    parser.add_argument('--rapid-z', type=float, default=rapid_z_rate,
+        help="G00 rate in Z, mm/min (default " + str(rapid_z_rate) + ")")
+    parser.add_argument('--accel', type=float, default=acceleration,
+        help="acceleration, mm/s^2 (default " + str(acceleration) + ")")
+    parser.add_argument('--tool-change', type=float, default=tool_change_time,
+        help="seconds per tool change (default " + str(tool_change_time) + ")")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    machine = Machine(args.rapid_xy, args.rapid_z, args.accel, args.tool_change)
+    with profiling.session(args, 'cycle_time'):
+        try:
+            estimates, total = estimate_job(args.filenames, machine)
+        except IOError as e:
+            print("Error: unable to open file " + str(e.filename))
+            sys.exit(1)
+        for name, e in zip(args.filenames, estimates):
+            report(name, e)
+        if len(estimates) > 1:
+            report("total", total)
+
+if __name__ == '__main__':
+    main()
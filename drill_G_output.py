@@ -2,136 +2,138 @@
 #drill_G_output.py
 #
 #This file outputs a G-code script for use with a CNC milling machine when
-#fed an Excellon formatted drill file.  The current version assumes a
-#1/10000" scale for the Excellon units and no offset in the excellon file.
+#fed an Excellon formatted drill file.  Units and number format are read
+#from the Excellon header (see excellon.py); no offset is applied.
+#
+#Usage: drill_G_output.py [--cycle plain|canned|expanded] [--peck MM]
+#                         [--r-plane MM] [--dedupe MM] [--fixture FILE]
+#                         [--tools FILE] [--toolpath] <filename>
+#  plain     every hole is a lift to travel height, a move, a rapid to
+#            3mm and a plunge (the default)
+#  canned    one modal G81 cycle per bit, G83 pecking for the #44 bit,
+#            then one X/Y line per hole; the bit returns to the R-plane
+#            between holes (G99)
+#  expanded  the canned program written out as plain G00/G01 moves for
+#            controllers without canned cycles
+#--dedupe MM drills holes closer than MM once, with the larger bit; by default
+#only holes in exactly the same place are merged (see hole_dedupe.py)
+#--fixture lifts only to the clearance plane between nearby holes, away from
+#the clamp zones listed in FILE (see retract_plan.py and fixture.cfg), and
+#prints the Z travel saved for every bit
+#--tools plunges every bit at its own feed from the tool table in FILE, the
+#bits named 65, 58 and 44 (see feed_plan.py and tools.cfg), and prints the
+#time saved for every bit
+#--toolpath writes 65_drill.tp, 58_drill.tp and 44_drill.tp binary toolpaths
+#(see toolpath.py) in place of the G-code text
 
+import argparse
+import logging
+import os
 import sys
 
-##Error catch for file IO issues
-if(len(sys.argv) != 2):
-    print("Usage: drill_G_output.py <filename>")
-    print("\t<filename> must point to the Excellon drill file")
-    print("\tproduced in Eagle.")
-    sys.exit()
-
-try:
-    fp = open(sys.argv[1], 'r')
-except IOError:
-    print("Unable to open drill file " + str(sys.argv[1]))
-    sys.exit()
-
-##Read in the file as a list of strings
-lines=fp.readlines()
-
-##Check that loaded file is of excellon type: starts with %\n != '%')
-if(str(lines[0]).strip() != '%' or str(lines[1]).strip() != 'M48'):
-    print("Error: " + str(sys.argv[1]) + " is not an Excellon drill file")
-    sys.exit()
-else:
-    print("Arguments are good")
+import numpy as np
+
+import canned
+import excellon
+import feed_plan
+import gcode_emit
+import gcode_lexer
+import hole_dedupe
+import hole_order
+import profiling
+import retract_plan
+import toolpath
+
+##Settings
+coord_sys = 'G55'
+feed_rate = 100
+drill_speed = 15000
+travel_height = 8.0
+drill_depth = -2.5
+order_time_budget = 2.0 #seconds spent refining each bit group's drill path
+dedupe_tolerance = 0    #holes closer than this (mm) are drilled once, with the larger bit; 0 merges only holes in the same place, below 0 keeps all
+drill_cycle = 'plain'   #'plain', 'canned' or 'expanded'
+r_plane = 3.0           #canned cycles rapid down to and return to this height
+peck_depth = 0.8        #depth of each G83 peck
+peck_groups = ["44_drill.txt"] #bit groups drilled with G83 pecking
+fixture = None          #retract_plan.Fixture for lowering the lifts between holes; None lifts to travel_height
+tool_table = None       #feed_plan.Tools with the plunge feed of every bit; None plunges all at feed_rate
+
+outfiles = ["65_drill.txt","58_drill.txt","44_drill.txt"]
+
+log = logging.getLogger(__name__)
+
+##read_drill_file(): reads and parses an Excellon drill file, raises IOError
+##if it cannot be read and ValueError if it is not an Excellon file
+def read_drill_file(filename):
+    with profiling.stage('read drill file'):
+        fp = open(filename, 'r')
+        ##Read in the whole file; it is parsed once into arrays of holes
+        text=fp.read()
+        fp.close()
+        profiling.count('bytes read',len(text))
+        ##Check that loaded file is of excellon type: starts with %\n != '%')
+        if(not excellon.is_excellon(text)):
+            raise ValueError(str(filename) + " is not an Excellon drill file")
+        return excellon.parse_excellon(text)
 
 ##Function definitions
-##get_drill_sizes(): outputs a list of drill bits from the beginning of the
-##Excellon file ordered by size
-def get_drill_sizes():
+##get_drill_sizes(): outputs a list of drill bit sizes in inches, in the
+##order the tools are defined in the Excellon header
+def get_drill_sizes(drill):
     drill_list = []
-    drill_size = 0    
-    ## Drill definitions lines are separated from the drill block by a % sign.
-    ## Definitions are of the form T##C0.####, where the last block of numbers
-    ## is the drill bit size in 1/10000"
-    for line in lines[1:len(lines)]:
-        if(str(line).strip() == '%'):
-            break
-        else:
-            holder = str(line).strip()
-            if(holder[0] == 'T'):
-                tokens = holder[1:len(holder)].split('.')
-                drill_size = float(tokens[1])/10000
-                print("Found a drill bit of size: " + str(drill_size))
-                drill_list.append(drill_size)     
-
+    for tool in drill.tool_ids():
+        drill_size = drill.diameter_in(tool) if tool in drill.tools else 0.0
+        log.debug("Found a drill bit of size: " + str(drill_size))
+        drill_list.append(drill_size)
     return drill_list
 
-##strip_e_file(): removes the bit definition block from the excellon files 
-##lines
-def strip_e_file():
-    sep_in = 1
-    for line in lines[1:len(lines)]:
-        if(str(line) == '%\n'):
-            break
-        sep_in += 1
-    print('Excellon file stripped!')
-    return lines[sep_in+1:len(lines)-1]
-
-##split_file_by_bit(): splits drill pattern part of Excellon file by bit
-##size, returns list of string lists ordered by bit size    
-def split_e_file_by_bit(stripped_file):
+##split_e_file_by_bit(): splits the holes of the Excellon file by bit,
+##returns a list of (N,2) arrays of hole positions in mm in the same order
+##as get_drill_sizes()
+def split_e_file_by_bit(drill):
     drill_lines = []
-    i = 1
-    while(i <= len(stripped_file)-1 ):
-        holder = []
-        while(stripped_file[i][0] != 'T'):
-            holder.append(stripped_file[i])
-            i += 1
-            if( i == len(stripped_file) ):
-                break         
-        drill_lines.append(holder)
-        i += 1
-    print("Drill file split!")
+    for tool in drill.tool_ids():
+        drill_lines.append(drill.coords_mm(tool))
+    log.info("Drill file split!")
+    return drill_lines
+
+##dedupe_holes(): removes holes drilled twice or within dedupe_tolerance of
+##another hole, keeping the larger tool, and reports what was removed
+def dedupe_holes(drill_list,drill_lines,tolerance):
+    drill_lines, stats = hole_dedupe.dedupe_tools(drill_lines,drill_list,tolerance)
+    hole_dedupe.report(stats)
     return drill_lines
 
+##bit_group(): index into outfiles of the bit used for a hole of the given
+##size in inches.  If the drill bit size is not 0.086, 0.042 or 0.035, round
+##to the nearest
+def bit_group(drill_size):
+    if( drill_size < 0.0385 ):
+        return 0
+    elif( drill_size < 0.064 ):
+        return 1
+    return 2
+
 def group_lines(drill_list,drill_lines):
     grouped_lines = []
-    D65_lines = []
-    D58_lines = []
-    D44_lines = []
-    ##If the drill bit size is not 0.086, 0.042 or 0.035, round to the nearest
+    groups = [[] for name in outfiles]
     i = 0
     for bit_vals in drill_list:
-        if( drill_list[i] < 0.035 ):
-            for line in drill_lines[i]:
-                D65_lines.append(line)
-        elif( drill_list[i] >= 0.035 and drill_list[i] < 0.0385 ):
-            for line in drill_lines[i]:
-                D65_lines.append(line)
-        elif( drill_list[i] >= 0.0385 and drill_list[i] < 0.064 ):
-            for line in drill_lines[i]:
-                D58_lines.append(line)
-        elif( drill_list[i] >= 0.064 ):
-            for line in drill_lines[i]:
-                D44_lines.append(line)
+        groups[bit_group(drill_list[i])].append(drill_lines[i])
         i += 1
-    grouped_lines.append(D65_lines)
-    grouped_lines.append(D58_lines)
-    grouped_lines.append(D44_lines)
-    print("Drill file successfully grouped into #44, #58 and #65 bit groupings!")
+    for group in groups:
+        grouped_lines.append(np.concatenate(group + [np.zeros((0,2))]))
+    log.info("Drill file successfully grouped into #44, #58 and #65 bit groupings!")
     return grouped_lines
 
-##
-def convert_in_to_mm(in_val):
-    mm_val = in_val/0.0393
-    mm_val = round(mm_val,4)
-    return mm_val
-
-def get_x(line):
-    line = line.strip()
-    X_ind = line.find('X')
-    Y_ind = line.find('Y')
-    hold = str(line[X_ind+1:Y_ind])
-    x_val = float(hold)/10000
-    x_val = round(x_val,4)
-    print("Found X: " + str(x_val))
-    return x_val
-
-def get_y(line):
-    line = line.strip()
-    X_ind = line.find('X')
-    Y_ind = line.find('Y')
-    hold = str(line[Y_ind+1:len(line)])
-    y_val = float(hold)/10000
-    y_val = round(y_val,4)
-    print("Found Y: " + str(y_val))
-    return y_val
+##order_drill_lines(): reorders one bit group's drill positions into a short
+##travel path starting from the work origin, and reports the travel saved
+def order_drill_lines(group_name,drill_lines,time_budget):
+    points = [tuple(xy) for xy in drill_lines.tolist()]
+    order, stats = hole_order.order_holes(points,time_budget)
+    hole_order.report(group_name,stats)
+    return drill_lines[order]
 
 def make_G_header(coord_sys,feed_rate, drill_speed):
     output = []
@@ -176,11 +178,9 @@ def make_drill_G_output(grouped_lines,coord_sys,feed_rate,drill_speed,travel_hei
     holder = make_G_header(coord_sys,feed_rate,drill_speed)
     for line in holder:
         G_file.append(line)
-    for line in grouped_lines:
+    for x_val, y_val in grouped_lines.tolist():
         G_file.append(raise_bit(travel_height))
-        x_val = convert_in_to_mm(get_x(line))
-        y_val = convert_in_to_mm(get_y(line))
-        G_file.append(mv_to_xy(x_val,y_val))
+        G_file.append(mv_to_xy(round(x_val,4),round(y_val,4)))
         holder = drop_bit(drill_depth,feed_rate)
         for linea in holder:
             G_file.append(linea)
@@ -189,30 +189,214 @@ def make_drill_G_output(grouped_lines,coord_sys,feed_rate,drill_speed,travel_hei
         G_file.append(line)
     return G_file
 
-##MAIN Body##
+##make_canned_G_output(): the same holes as make_drill_G_output() with one
+##modal G81 cycle, or G83 when peck is given, and bare X/Y words per hole
+def make_canned_G_output(grouped_lines,coord_sys,feed_rate,drill_speed,travel_height,drill_depth,r_plane,peck=None):
+    G_file = make_G_header(coord_sys,feed_rate,drill_speed)
+    G_file.append(raise_bit(travel_height))
+    first = True
+    for x_val, y_val in grouped_lines.tolist():
+        x_val = round(x_val,4)
+        y_val = round(y_val,4)
+        if first:
+            G_file.append(mv_to_xy(x_val,y_val))
+            holder = "G99 G81"
+            if peck is not None:
+                holder = "G99 G83"
+            holder += " X" + str(x_val) + " Y" + str(y_val) + " Z" + str(drill_depth) + " R" + str(r_plane)
+            if peck is not None:
+                holder += " Q" + str(peck)
+            G_file.append(holder + " F" + str(feed_rate))
+            first = False
+        else:
+            G_file.append("X" + str(x_val) + " Y" + str(y_val))
+    if not first:
+        G_file.append("G80")
+        G_file.append(raise_bit(travel_height))
+    for line in make_G_footer():
+        G_file.append(line)
+    return G_file
 
-coord_sys = 'G55'
-feed_rate = 100
-drill_speed = 15000
-travel_height = 8.0
-drill_depth = -2.5
+##make_group_G_output(): the G-code for one bit group in the given cycle mode
+def make_group_G_output(group_name,grouped_lines,cycle=drill_cycle):
+    if cycle == 'plain':
+        return make_drill_G_output(grouped_lines,coord_sys,feed_rate,drill_speed,travel_height,drill_depth)
+    peck = None
+    if group_name in peck_groups:
+        peck = peck_depth
+    G_file = make_canned_G_output(grouped_lines,coord_sys,feed_rate,drill_speed,travel_height,drill_depth,r_plane,peck)
+    if cycle == 'expanded':
+        G_file = list(canned.expand_canned(G_file))
+    return G_file
 
-d_sizes = get_drill_sizes()
-output = strip_e_file()
-output2 = split_e_file_by_bit(output)
-grouped = group_lines(d_sizes,output2)
+##plan_group_lifts(): lowers the lifts of a bit group's G-code to the
+##clearance plane where the fixture allows (see retract_plan.py) and
+##reports the Z travel saved; unchanged when no fixture is set
+def plan_group_lifts(group_name,G_file):
+    if fixture is None:
+        return G_file
+    stats = retract_plan.new_stats()
+    G_file = retract_plan.plan_retracts(G_file,fixture,stats)
+    retract_plan.report(group_name,stats)
+    return G_file
 
-outfiles = ["65_drill.txt","58_drill.txt","44_drill.txt"]
+##schedule_group_feeds(): sets the feeds of a bit group's G-code from the
+##tool table, the bit named by the number its file starts with (see
+##feed_plan.py), and reports the time saved; unchanged when no table is set
+def schedule_group_feeds(group_name,G_file):
+    if tool_table is None:
+        return G_file
+    stats = feed_plan.new_stats()
+    G_file = feed_plan.schedule_feeds(G_file,tool_table,group_name.split('_')[0],stats)
+    feed_plan.report(group_name,stats)
+    return G_file
 
-i=0
-for item in grouped:
-    G_outfile = make_drill_G_output(item,coord_sys,feed_rate,drill_speed,travel_height,drill_depth)
-    out_fp = open(outfiles[i],'w')
+##make_group_toolpath(): one bit group as a binary toolpath (see toolpath.py);
+##canned cycles are stored as the plain moves they stand for
+def make_group_toolpath(group_index,grouped_lines,cycle=drill_cycle):
+    group_name = outfiles[group_index]
+    if cycle == 'plain' and fixture is None and tool_table is None:
+        moves = toolpath.drill_moves(grouped_lines,travel_height,3.0,drill_depth,feed_rate,group_index)
+    else:
+        G_file = make_group_G_output(group_name,grouped_lines,cycle)
+        G_file = canned.expand_canned(schedule_group_feeds(group_name,plan_group_lifts(group_name,G_file)))
+        moves = toolpath.from_gcode('\n'.join(G_file),group_index).moves
+    header = toolpath.new_header(origin=coord_sys,
+                                 preamble=make_G_header(coord_sys,feed_rate,drill_speed),
+                                 postamble=make_G_footer())
+    return toolpath.Toolpath(header,moves)
+
+##make_drill_files(): writes one G-code file per bit group into out_dir,
+##or one .tp toolpath file per group with binary, returns the list of file
+##names written
+def make_drill_files(filename,out_dir='.',verbose=False,cycle=None,tolerance=None,binary=False):
+    grouped = drill_groups(read_drill_file(filename),tolerance)
+    written = []
+    i=0
+    for item in grouped:
+        written.append(write_drill_group(i,item,out_dir,verbose,cycle,binary))
+        i += 1
+    return written
+
+##drill_groups(): the holes of a parsed Excellon file, deduplicated and
+##grouped by bit in the order of outfiles
+def drill_groups(drill,tolerance=None):
+    if tolerance is None:
+        tolerance = dedupe_tolerance
+    with profiling.stage('group holes'):
+        d_sizes = get_drill_sizes(drill)
+        output2 = split_e_file_by_bit(drill)
+        if tolerance >= 0:
+            output2 = dedupe_holes(d_sizes,output2,tolerance)
+        return group_lines(d_sizes,output2)
+
+##write_drill_group(): orders the holes of bit group i and writes its file
+##into out_dir, returns the file name written; verbose logs every line at
+##debug level
+def write_drill_group(i,item,out_dir='.',verbose=False,cycle=None,binary=False):
+    with profiling.stage('write ' + outfiles[i]):
+        out_name = write_group_file(i,item,out_dir,verbose,cycle,binary)
+        profiling.count_file('bytes written',out_name)
+    return out_name
+
+def write_group_file(i,item,out_dir,verbose,cycle,binary):
+    if cycle is None:
+        cycle = drill_cycle
+    out_name = os.path.join(out_dir,outfiles[i])
+    if binary:
+        item = order_drill_lines(outfiles[i],item,order_time_budget)
+        out_name = os.path.splitext(out_name)[0] + ".tp"
+        path = make_group_toolpath(i,item,cycle)
+        profiling.count('moves written',len(path.moves))
+        return toolpath.save(out_name,path)
+    G_outfile = drill_group_lines(i,item,cycle)
+    profiling.count('lines written',len(G_outfile))
+    echo = verbose and log.isEnabledFor(logging.DEBUG)
+    out_fp = open(out_name,'w')
     for line in G_outfile:
-       print line
+       if echo:
+           log.debug(line)
        out_fp.write(line+'\n')
     out_fp.close()
-    i += 1
+    return out_name
+
+##drill_group_lines(): the G-code lines of bit group i, holes in drilling
+##order, for writing to a file or sending to the mill (see sender.py);
+##words that repeat the modal state are left out (see gcode_emit.py)
+def drill_group_lines(i,item,cycle=None):
+    if cycle is None:
+        cycle = drill_cycle
+    item = order_drill_lines(outfiles[i],item,order_time_budget)
+    G_file = plan_group_lifts(outfiles[i],make_group_G_output(outfiles[i],item,cycle))
+    G_file = schedule_group_feeds(outfiles[i],G_file)
+    return list(gcode_emit.compact(G_file))
+
+##############################################
+#                 MAIN
+##############################################
+def main(argv=None):
+    global r_plane, peck_depth, fixture, tool_table
+    parser = argparse.ArgumentParser(
+        description="Write drill G-code for the #65, #58 and #44 bits from an Excellon drill file.")
+    parser.add_argument('filename',
+        help="the Excellon drill file produced in Eagle")
+    parser.add_argument('--cycle', choices=['plain','canned','expanded'], default=drill_cycle,
+        help="plain moves per hole, G81/G83 canned cycles, or canned cycles "
+             "expanded to plain moves (default " + drill_cycle + ")")
+    parser.add_argument('--r-plane', type=float, default=r_plane, metavar='MM',
+        help="height canned cycles rapid down to and return to (default " + str(r_plane) + ")")
+    parser.add_argument('--peck', type=float, default=peck_depth, metavar='MM',
+        help="G83 peck depth for the #44 bit (default " + str(peck_depth) + ")")
+    parser.add_argument('--dedupe', type=float, default=dedupe_tolerance, metavar='MM',
+        help="drill holes closer than this once, with the larger bit; 0 merges only holes "
+             "in the same place, below 0 keeps every hole (default " + str(dedupe_tolerance) + ")")
+    parser.add_argument('--fixture', default=None, metavar='FILE',
+        help="clearance plane and clamp zones for lowering the lifts between holes "
+             "(see retract_plan.py and fixture.cfg)")
+    parser.add_argument('--tools', default=None, metavar='FILE',
+        help="tool table with the plunge feed of every bit (see feed_plan.py and tools.cfg)")
+    parser.add_argument('--toolpath', action='store_true',
+        help="write binary .tp toolpaths (see toolpath.py) instead of G-code text")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    r_plane = args.r_plane
+    peck_depth = args.peck
+    if args.fixture is not None:
+        try:
+            fixture = retract_plan.read_fixture(args.fixture)
+        except IOError:
+            print("Unable to open fixture file " + str(args.fixture))
+            sys.exit()
+        except ValueError as e:
+            print("Error: " + str(e))
+            sys.exit()
+    if args.tools is not None:
+        try:
+            tool_table = feed_plan.read_tools(args.tools)
+        except IOError:
+            print("Unable to open tool table " + str(args.tools))
+            sys.exit()
+        except ValueError as e:
+            print("Error: " + str(e))
+            sys.exit()
+
+    with profiling.session(args,'drill_G_output'):
+        ##Error catch for file IO issues
+        try:
+            written = make_drill_files(args.filename,verbose=True,cycle=args.cycle,tolerance=args.dedupe,
+                                       binary=args.toolpath)
+        except IOError:
+            print("Unable to open drill file " + str(args.filename))
+            sys.exit()
+        except ValueError as e:
+            print("Error: " + str(e))
+            sys.exit()
+
+        if args.toolpath:
+            print("Drill toolpaths sucessfully written to 65_drill.tp, 58_drill.tp and 44_drill.tp!")
+        else:
+            print("Drill G-code sucessfully written to 65_drill.txt, 58_drill.txt and 44_drill.txt!")
+        print(written)
 
-print("Drill G-code sucessfully written to 65_drill.txt, 58_drill.txt and 44_drill.txt!")
-print(outfiles)
+if __name__ == '__main__':
+    main()
@@ -4,82 +4,69 @@
 #drill_G_output_lite.py
 #
 #This file outputs three separated Excellon files for use with the PCBmill program when
-#fed an Excellon formatted drill file.  The current version assumes a
-#1/10000" scale for the Excellon units and no offset in the excellon file.
-
+#fed an Excellon formatted drill file.  Units and number format are read
+#from the Excellon header (see excellon.py); no offset is applied.
+#
+#Usage: drill_G_output_lite.py [--dedupe MM] [--profile JSON] [--cprofile FILE]
+#                              [--log-level LEVEL] <filename>
+#--dedupe MM splits holes closer than MM into the larger bit's file only; by
+#default only holes in exactly the same place are merged, as in
+#drill_G_output.py (see hole_dedupe.py)
+
+import argparse
+import logging
+import os
 import sys
 
-##Error catch for file IO issues
-if(len(sys.argv) != 2):
-    print("Usage: drill_G_output.py <filename>")
-    print("\t<filename> must point to the Excellon drill file")
-    print("\tproduced in Eagle.")
-    sys.exit()
-
-try:
-    fp = open(sys.argv[1], 'r')
-except IOError:
-    print("Unable to open drill file " + str(sys.argv[1]))
-    sys.exit()
-
-##Read in the file as a list of strings
-lines=fp.readlines()
-
-##Check that loaded file is of excellon type: starts with %\n != '%')
-if(str(lines[0]).strip() != '%' or str(lines[1]).strip() != 'M48'):
-    print("Error: " + str(sys.argv[1]) + " is not an Excellon drill file")
-    sys.exit()
-else:
-    print("Arguments are good")
+import numpy as np
+
+import excellon
+import hole_dedupe
+import profiling
+
+##Settings
+pcbmill_decimals = 3 #PCBmill imports drill positions in 1 mil (0.001") steps
+dedupe_tolerance = 0 #holes closer than this (mm) go in the larger bit's file only; 0 merges only holes in the same place, below 0 keeps all
+
+outfiles = ["65_drill.txt_int","58_drill.txt_int","52_drill.txt_int","44_drill.txt_int"]
+
+log = logging.getLogger(__name__)
+
+##read_drill_file(): reads and parses an Excellon drill file, raises IOError
+##if it cannot be read and ValueError if it is not an Excellon file
+def read_drill_file(filename):
+    with profiling.stage('read drill file'):
+        fp = open(filename, 'r')
+        ##Read in the whole file; it is parsed once into arrays of holes
+        text=fp.read()
+        fp.close()
+        profiling.count('bytes read',len(text))
+        ##Check that loaded file is of excellon type: starts with %\n != '%')
+        if(not excellon.is_excellon(text)):
+            raise ValueError(str(filename) + " is not an Excellon drill file")
+        return excellon.parse_excellon(text)
 
 ##Function definitions
-##get_drill_sizes(): outputs a list of drill bits from the beginning of the
-##Excellon file ordered by size
-def get_drill_sizes():
+##get_drill_sizes(): outputs a list of drill bit sizes in inches, in the
+##order the tools are defined in the Excellon header
+def get_drill_sizes(drill):
     drill_list = []
-    drill_size = 0    
-    ## Drill definitions lines are separated from the drill block by a % sign.
-    ## Definitions are of the form T##C0.####, where the last block of numbers
-    ## is the drill bit size in 1/10000"
-    for line in lines[1:len(lines)]:
-        if(str(line).strip() == '%'):
-            break
-        else:
-            holder = str(line).strip()
-            if(holder[0] == 'T'):
-                tokens = holder[1:len(holder)].split('.')
-                drill_size = float(tokens[1])/10000
-                print("Found a drill bit of size: " + str(drill_size))
-                drill_list.append(drill_size)     
-
+    for tool in drill.tool_ids():
+        drill_size = drill.diameter_in(tool) if tool in drill.tools else 0.0
+        log.debug("Found a drill bit of size: " + str(drill_size))
+        drill_list.append(drill_size)
     return drill_list
 
-##strip_e_file(): removes the bit definition block from the excellon files 
-##lines
-def strip_e_file():
-    sep_in = 1
-    for line in lines[1:len(lines)]:
-        if(str(line) == '%\n'):
-            break
-        sep_in += 1
-    print('Excellon file stripped!')
-    return lines[sep_in+1:len(lines)-1]
-
-##split_file_by_bit(): splits drill pattern part of Excellon file by bit
-##size, returns list of string lists ordered by bit size    
-def split_e_file_by_bit(stripped_file):
+##split_file_by_bit(): splits the holes of the Excellon file by bit, returns
+##a list of (N,2) integer arrays of hole positions in PCBmill units, in the
+##same order as get_drill_sizes()
+def split_e_file_by_bit(drill,decimals):
+    x, y = drill.coords_in_units('INCH',decimals)
     drill_lines = []
-    i = 1
-    while(i <= len(stripped_file)-1 ):
-        holder = []
-        while(stripped_file[i][0] != 'T'):
-            holder.append(stripped_file[i])
-            i += 1
-            if( i == len(stripped_file) ):
-                break         
-        drill_lines.append(holder)
-        i += 1
-    print("Drill file split!")
+    for tool in drill.tool_ids():
+        sel = drill.tool == tool
+        drill_lines.append(np.column_stack((x[sel],y[sel])))
+    log.info("Drill file split!")
     return drill_lines
 
 ##group_lines(): groups lines into three drill bit size categories, depending upon the
@@ -96,44 +83,22 @@ def group_lines(drill_list,drill_lines):
     i = 0
     for bit_vals in drill_list:
         if( drill_list[i] < 0.035 ):
-            for line in drill_lines[i]:
-                D65_lines.append(line)
+            D65_lines.append(drill_lines[i])
         elif( drill_list[i] >= 0.035 and drill_list[i] < 0.042 ):
-            for line in drill_lines[i]:
-                D58_lines.append(line)
+            D58_lines.append(drill_lines[i])
         elif( drill_list[i] >= 0.042 and drill_list[i] <= 0.0625 ):
-            for line in drill_lines[i]:
-                D52_lines.append(line)
+            D52_lines.append(drill_lines[i])
         elif( drill_list[i] > 0.0625 ):
-            for line in drill_lines[i]:
-                D44_lines.append(line)
+            D44_lines.append(drill_lines[i])
         i += 1
-    grouped_lines.append(D65_lines)
-    grouped_lines.append(D58_lines)
-    grouped_lines.append(D52_lines)
-    grouped_lines.append(D44_lines)
-    print("Drill file successfully grouped into #44, #58 and #65 bit groupings!")
+    grouped_lines.append(np.concatenate(D65_lines + [np.zeros((0,2),dtype=np.int64)]))
+    grouped_lines.append(np.concatenate(D58_lines + [np.zeros((0,2),dtype=np.int64)]))
+    grouped_lines.append(np.concatenate(D52_lines + [np.zeros((0,2),dtype=np.int64)]))
+    grouped_lines.append(np.concatenate(D44_lines + [np.zeros((0,2),dtype=np.int64)]))
+    log.info("Drill file successfully grouped into #44, #58 and #65 bit groupings!")
     return grouped_lines
 
 ##Output a '%', the only header/footer character necessary for PCBmill drill files
-def get_x(line):
-    line = line.strip()
-    X_ind = line.find('X')
-    Y_ind = line.find('Y')
-    hold = str(line[X_ind+1:Y_ind])
-    x_val = int(hold)/10
-    print("Found X: " + str(x_val))
-    return x_val
-
-def get_y(line):
-    line = line.strip()
-    X_ind = line.find('X')
-    Y_ind = line.find('Y')
-    hold = str(line[Y_ind+1:len(line)])
-    y_val = int(hold)/10
-    print("Found Y: " + str(y_val))
-    return y_val
-
 def make_header_footer():
     output = '%'
     return output
@@ -146,30 +111,83 @@ def make_xy_pos(x_val,y_val):
 def make_drill_output(grouped_lines):
     drill_file = []
     drill_file.append(make_header_footer())
-    for line in grouped_lines:
-        x_val=get_x(line)
-        y_val=get_y(line)
+    for x_val, y_val in grouped_lines.tolist():
         drill_file.append(make_xy_pos(x_val,y_val))
     drill_file.append(make_header_footer())
     return drill_file
 
-##MAIN Body##
-
-d_sizes = get_drill_sizes() #Parse the drill list
-output = strip_e_file() #Cut the fat from the Excellon file
-output2 = split_e_file_by_bit(output) #Divide the drill positioning elements of the Excellon file by bit
-grouped = group_lines(d_sizes,output2) #Group the divided drill list into three lists
-
-outfiles = ["65_drill.txt_int","58_drill.txt_int","52_drill.txt_int","44_drill.txt_int"]
+##dedupe_holes(): removes holes drilled twice or within tolerance mm of
+##another hole, keeping the larger tool, and reports what was removed; the
+##holes are in PCBmill units
+def dedupe_holes(drill_list,drill_lines,tolerance):
+    units = tolerance / 25.4 * 10 ** pcbmill_decimals
+    drill_lines, stats = hole_dedupe.dedupe_tools(drill_lines,drill_list,units)
+    stats['tolerance'] = tolerance
+    hole_dedupe.report(stats)
+    return drill_lines
 
-i=0
-for item in grouped:
-    G_outfile = make_drill_output(item) #Attach a percent sign header/footer to each bit list
-    out_fp = open(outfiles[i],'w') 
-    for line in G_outfile: #Write each bit list to a separate file
-       print line
-       out_fp.write(line+'\n')
-    out_fp.close()
-    i += 1
-
-print("Drill Excellon file sucessfully split into 65_drill.txt_int, 58_drill.txt_int and 44_drill.txt_int!")
+##split_drill_file(): writes one PCBmill drill file per bit group into
+##out_dir, returns the list of file names written
+def split_drill_file(filename,out_dir='.',verbose=False,tolerance=None):
+    return split_drill(read_drill_file(filename),out_dir,verbose,tolerance)
+
+##split_drill(): split_drill_file() for an Excellon file already parsed;
+##verbose logs every line at debug level
+def split_drill(drill,out_dir='.',verbose=False,tolerance=None):
+    if tolerance is None:
+        tolerance = dedupe_tolerance
+    with profiling.stage('group holes'):
+        d_sizes = get_drill_sizes(drill) #Parse the drill list
+        output2 = split_e_file_by_bit(drill,pcbmill_decimals) #Divide the drill positioning elements of the Excellon file by bit
+        if tolerance >= 0:
+            output2 = dedupe_holes(d_sizes,output2,tolerance)
+        grouped = group_lines(d_sizes,output2) #Group the divided drill list into three lists
+
+    echo = verbose and log.isEnabledFor(logging.DEBUG)
+    written = []
+    i=0
+    for item in grouped:
+        with profiling.stage('write ' + outfiles[i]):
+            G_outfile = make_drill_output(item) #Attach a percent sign header/footer to each bit list
+            out_name = os.path.join(out_dir,outfiles[i])
+            out_fp = open(out_name,'w')
+            for line in G_outfile: #Write each bit list to a separate file
+               if echo:
+                   log.debug(line)
+               out_fp.write(line+'\n')
+            out_fp.close()
+            profiling.count('lines written',len(G_outfile))
+            profiling.count_file('bytes written',out_name)
+        written.append(out_name)
+        i += 1
+    return written
+
+##############################################
+#                 MAIN
+##############################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Split an Excellon drill file into one PCBmill drill file per bit.")
+    parser.add_argument('filename',
+        help="the Excellon drill file produced in Eagle")
+    parser.add_argument('--dedupe', type=float, default=dedupe_tolerance, metavar='MM',
+        help="put holes closer than this in the larger bit's file only; 0 merges only holes "
+             "in the same place, below 0 keeps every hole (default " + str(dedupe_tolerance) + ")")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with profiling.session(args,'drill_G_output_lite'):
+        ##Error catch for file IO issues
+        try:
+            split_drill_file(args.filename,verbose=True,tolerance=args.dedupe)
+        except IOError:
+            print("Unable to open drill file " + str(args.filename))
+            sys.exit()
+        except ValueError:
+            print("Error: " + str(args.filename) + " is not an Excellon drill file")
+            sys.exit()
+
+        print("Drill Excellon file sucessfully split into 65_drill.txt_int, 58_drill.txt_int and 44_drill.txt_int!")
+
+if __name__ == '__main__':
+    main()
@@ -11,53 +11,34 @@
 #   PCBmill free software used to convert eagle cam processor into
 #   G-code require inputs in incremets of 1 mil.
 #
-#   drill_reduce.py divides all x and y axis coordinates by 100 in
-#   order to properly import them into PSBmill
+#   drill_reduce.py rewrites all x and y axis coordinates in 1 mil
+#   steps in order to properly import them into PSBmill.  The input
+#   units and number format are read from the Excellon header (see
+#   excellon.py) rather than assumed.  The output is always inch with
+#   3 decimals and leading zeros suppressed, so the header lines that
+#   say otherwise (METRIC, M71, LZ, a number format, metric tool
+#   sizes) are rewritten to match, and a ;FILE_FORMAT=2:3 comment is
+#   added after M48 when the input gives no format.
 #
 #   drill files from the eagle cam processor should be in Excellon
 #   format.  See www.excellon.com/manuals for file format details
+#
+#   drill_reduce.py [--profile JSON] [--cprofile FILE] [--log-level LEVEL]
+#                   <filename>
 
+import argparse
+import os
+import re
 import sys
 
-# conduct argument checking
-if(len(sys.argv) != 2):
-    print("Usage: drill_reduce.py <filename>")
-    print("\t<filename> must point to the drill file output from the eagle")
-    print("\tcam processor.")
-    sys.exit()
-
-# ensure the argument connects to a file that be opened
-try:
-    fp = open(sys.argv[1], 'r')
-except IOError:
-    print("Error: unable to open file " + str(sys.argv[1]))
-    sys.exit()
-
-# excellon drill formats begin like this:
-#   %
-#   M48
-# ensure the passed file matches this format
-def format_error():
-    print("Error: " + str(sys.argv[1])+ " is not in Excellon format")
-    sys.exit()
-
-lines = fp.readlines()
-if(str(lines[0]).strip() != '%'):
-    format_error()
-if(str(lines[1]).strip() != 'M48'):
-    format_error()  
-
-print ("Arguments are good")
-
-#-------Process an X line---------#
-def process_x_line(line):   #return dict {'x', 'y'}  
-    str_list = line.split('Y')
-    x_val = int(str_list[0].strip('X'))
-    y_val = int(str_list[1])
-    x_val = x_val/10
-    y_val = y_val/10
-    vals = {'x': x_val, 'y': y_val}
-    return vals
+import excellon
+import profiling
+
+pcbmill_decimals = 3    # PCBmill imports drill positions in 1 mil (0.001") steps
+
+_units_line_re = re.compile(r'^(INCH|METRIC|M71|M72)(,(?:LZ|TZ))?(,0*\.0*)?(.*)$', re.S)
+_format_line_re = re.compile(r'^;\s*(?:FILE_)?FORMAT\s*=?', re.I)
+_tool_line_re = re.compile(r'^(T\d+)C([-+]?(?:\d+\.?\d*|\.\d+))(.*)$', re.S)
 
 #------------Write to output-----------#
 # fp is a file handle to the output file
@@ -70,16 +51,109 @@ def write_to_output(fp, line, D):
         output = "X"+str(D['x']).zfill(4)+"Y"+str(D['y']).zfill(4)+'\n'
         fp.write(output)
 
+#------------Reduce a drill file-------#
+# writes the reduced drill file to <filename>_mod, or to the same name
+# in out_dir when one is given; returns the output file name
+# raises IOError if the file cannot be read, ValueError if it is not
+# an Excellon file
+def reduce_file(filename, out_dir=None):
+    with profiling.stage('read drill file'):
+        fp = open(filename, 'r')
+        text = fp.read()
+        fp.close()
+        profiling.count('bytes read', len(text))
+
+        # excellon drill formats begin like this:
+        #   %
+        #   M48
+        # ensure the passed file matches this format
+        if(not excellon.is_excellon(text)):
+            raise ValueError(str(filename) + " is not in Excellon format")
+        drill = excellon.parse_excellon(text)
+
+    outfile_name = filename + "_mod"
+    if out_dir is not None:
+        outfile_name = os.path.join(out_dir, os.path.basename(outfile_name))
+    return write_reduced(text, drill, outfile_name)
+
+#------------Write a reduced file------#
+# text is the Excellon file, drill the parse of it
+# returns the output file name
+def write_reduced(text, drill, outfile_name):
+    with profiling.stage('write reduced file'):
+        write_reduced_lines(text, drill, outfile_name)
+        profiling.count_file('bytes written', outfile_name)
+    return outfile_name
+
+def write_reduced_lines(text, drill, outfile_name):
+    x_vals, y_vals = drill.coords_in_units('INCH', pcbmill_decimals)
+    x_vals = x_vals.tolist()
+    y_vals = y_vals.tolist()
+
+    # state the number format when the input leaves it to the reader
+    stated = any(_format_line_re.match(line) for line in text.splitlines())
+
+    outfile = open(outfile_name, 'w')
+    hole = 0
+    for line in text.splitlines(True):
+        # every line starting with X or Y is one hole, in file order
+        if line[0:1] in ('X', 'Y'):
+            D = {'x': x_vals[hole], 'y': y_vals[hole]}
+            hole += 1
+        else:
+            D = None
+            line = reduced_setup_line(line, drill.units)
+            if not stated and line.strip() == 'M48':
+                line += ';FILE_FORMAT=2:' + str(pcbmill_decimals) + '\n'
+                stated = True
+
+        write_to_output(outfile, line, D)
+    outfile.close()
+    profiling.count('holes written', hole)
+
+#------------Header of the output------#
+# returns line rewritten for the units and number format of the
+# output, inch 2.3 with leading zeros suppressed; units is the units of
+# the input, so metric tool sizes are given in inch
+def reduced_setup_line(line, units):
+    body = line.rstrip('\r\n')
+    end = line[len(body):]
+    m = _units_line_re.match(body)
+    if m:
+        if m.group(1) in ('M71', 'M72'):
+            return 'M72' + m.group(4) + end
+        return ('INCH' + (',TZ' if m.group(2) else '') + (',00.000' if m.group(3) else '') +
+                m.group(4) + end)
+    if _format_line_re.match(body):
+        return ';FILE_FORMAT=2:' + str(pcbmill_decimals) + end
+    m = _tool_line_re.match(body)
+    if m and units == 'METRIC':
+        size = float(m.group(2)) / excellon.MM_PER_INCH
+        return m.group(1) + 'C' + ('%.4f' % size) + m.group(3) + end
+    return line
+
 ##############################################
 #                 MAIN
 ##############################################
-outfile_name = sys.argv[1] + "_mod"
-outfile = open(outfile_name, 'w')
-for line in lines:
-    if line[0] == 'X':
-        D = process_x_line(line)
-    else:
-        D = None
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Round the drill positions of an Excellon file to the 1 mil steps PCBmill reads.")
+    parser.add_argument('filename',
+        help="the drill file output from the eagle cam processor")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with profiling.session(args, 'drill_reduce'):
+        try:
+            outfile_name = reduce_file(args.filename)
+        except IOError:
+            print("Error: unable to open file " + str(args.filename))
+            sys.exit()
+        except ValueError:
+            print("Error: " + str(args.filename)+ " is not in Excellon format")
+            sys.exit()
+
+        print("Drill output stored in: " + outfile_name)
 
-    write_to_output(outfile, line, D)
-print("Drill output stored in: " + outfile_name)        
+if __name__ == '__main__':
+    main()
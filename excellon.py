@@ -0,0 +1,194 @@
+#! /usr/bin/env python
+
+#
+# excellon.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   Reads an Excellon drill file in a single pass and returns the
+#   holes as NumPy arrays (tool id, x, y in the file's integer
+#   units) together with the tool table from the header.
+#
+#   The header decides how coordinates are read:
+#     INCH / METRIC / M72 / M71     units
+#     INCH,LZ / METRIC,TZ           zero suppression
+#     INCH,LZ,00.0000               number format
+#     ;FILE_FORMAT=2:4              number format (Eagle)
+#   Coordinates with a decimal point are read as written.  Files
+#   without format information are read as 2.4 inch (3.3 metric)
+#   with leading zeros suppressed, which is what Eagle writes.
+#
+#   See www.excellon.com/manuals for file format details
+
+import re
+
+import numpy as np
+
+import gcode_lexer
+import profiling
+
+MM_PER_INCH = 25.4
+
+# default (integer digits, decimal digits) for each unit system
+default_digits = {'INCH': (2, 4), 'METRIC': (3, 3)}
+
+_units_re = re.compile(br'^(INCH|METRIC|M71|M72)(?:,(LZ|TZ))?(?:,(0*)\.(0*))?', re.M)
+_format_re = re.compile(br'^;\s*(?:FILE_)?FORMAT\s*=?\s*\{?\s*(\d+)\s*:\s*(\d+)', re.M)
+_header_end_re = re.compile(br'^(?:%|M95)\s*$', re.M)
+_first_hole_re = re.compile(br'^[XY]', re.M)
+_pow10 = 10.0 ** np.arange(-32, 33)
+
+#---------Excellon file check----------------#
+# excellon drill formats begin like this:
+#   %
+#   M48
+def is_excellon(text):
+    head = text.split('\n', 2)
+    return len(head) > 2 and head[0].strip() == '%' and head[1].strip() == 'M48'
+
+#---------Parsed drill file------------------#
+class Excellon(object):
+    # units     'INCH' or 'METRIC'
+    # digits    (integer digits, decimal digits) of the coordinates
+    # zeros     'TZ' if leading zeros are suppressed, 'LZ' if trailing
+    # tools     {tool id: diameter in file units}, in header order
+    # tool      int array, the tool id of every hole
+    # x, y      int64 arrays, coordinates in units of 10**-digits[1]
+    def __init__(self, units, digits, zeros, tools, tool, x, y):
+        self.units = units
+        self.digits = digits
+        self.zeros = zeros
+        self.tools = tools
+        self.tool = tool
+        self.x = x
+        self.y = y
+
+    def __len__(self):
+        return len(self.tool)
+
+    #---------size of one integer unit in mm----#
+    def step_mm(self):
+        unit = MM_PER_INCH if self.units == 'INCH' else 1.0
+        return unit / 10 ** self.digits[1]
+
+    #---------tool diameter in inches------------#
+    def diameter_in(self, tool_id):
+        d = self.tools[tool_id]
+        if self.units == 'METRIC':
+            d = d / MM_PER_INCH
+        return d
+
+    #---------tool ids in header order-----------#
+    # tools selected in the body but never defined are added at the end
+    def tool_ids(self):
+        ids = list(self.tools)
+        for t in np.unique(self.tool).tolist():
+            if t not in self.tools:
+                ids.append(t)
+        return ids
+
+    #---------hole coordinates in mm-------------#
+    # returns an (N, 2) float array, optionally only for one tool
+    def coords_mm(self, tool_id=None):
+        xy = np.column_stack((self.x, self.y)).astype(np.float64) * self.step_mm()
+        if tool_id is not None:
+            xy = xy[self.tool == tool_id]
+        return xy
+
+    #---------hole coordinates in other units----#
+    # returns int64 x and y arrays in units of 10**-decimals inch or mm
+    def coords_in_units(self, units, decimals):
+        scale = self.step_mm() * 10 ** decimals
+        if units == 'INCH':
+            scale = scale / MM_PER_INCH
+        x = np.rint(self.x * scale).astype(np.int64)
+        y = np.rint(self.y * scale).astype(np.int64)
+        return x, y
+
+#---------Parse the drill body--------------#
+# The body is lexed in one pass by gcode_lexer.scan() and turned into
+# holes with array operations, so no per-line Python work is done.
+# returns (tool, x, y) arrays with one entry per hole
+def _parse_body(body, digits, zeros):
+    words = gcode_lexer.scan(body, 0)
+    if len(words) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty.copy(), empty.copy()
+
+    # every word to integer units of the file's number format
+    dotted = words.decimals >= 0
+    place = np.where(dotted, digits[1] - words.decimals, 0)
+    if zeros == 'LZ':
+        # trailing zeros suppressed: pad to the full digit count
+        place = np.where(dotted, place, digits[0] + digits[1] - words.ndigits)
+    place[words.letter == ord('T')] = 0
+    vals = np.rint(words.mantissa * _pow10[np.clip(place, -32, 32) + 32]).astype(np.int64)
+
+    # a line is a hole if it starts with X or Y, a tool select if T
+    line = words.line
+    nlines = line[-1] + 1
+    first = np.ones(len(words), dtype=bool)
+    first[1:] = line[1:] != line[:-1]
+    first &= words.col0
+    kind = np.zeros(nlines, dtype=np.uint8)
+    kind[line[first]] = words.letter[first]
+
+    x = gcode_lexer.fill_modal(*words.per_line('X', nlines, vals))
+    y = gcode_lexer.fill_modal(*words.per_line('Y', nlines, vals))
+    tool_val, tool_has = words.per_line('T', nlines, vals)
+    tool = gcode_lexer.fill_modal(tool_val, tool_has & (kind == ord('T')))
+
+    holes = np.flatnonzero((kind == ord('X')) | (kind == ord('Y')))
+    return tool[holes], x[holes], y[holes]
+
+#---------Parse the text of a drill file------#
+# text may be str or bytes
+# digits overrides the number format when the header does not give one
+def parse_excellon(text, digits=None):
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    header_end = _header_end_re.search(text, 1)
+    if header_end is None:
+        header, body = b'', text
+    else:
+        header, body = text[:header_end.start()], text[header_end.end():]
+
+    # units and zero suppression are taken from the last directive
+    # before the first hole
+    first_hole = _first_hole_re.search(body)
+    setup = header + b'\n' + body[:first_hole.start() if first_hole else len(body)]
+    units = 'INCH'
+    zeros = 'TZ'
+    for m in _units_re.finditer(setup):
+        units = 'METRIC' if m.group(1) in (b'METRIC', b'M71') else 'INCH'
+        if m.group(2):
+            zeros = m.group(2).decode()
+        if m.group(3) is not None:
+            digits = (len(m.group(3)), len(m.group(4)))
+    m = _format_re.search(setup)
+    if m:
+        digits = (int(m.group(1)), int(m.group(2)))
+    if digits is None:
+        digits = default_digits[units]
+
+    # tool definitions are of the form T01C0.0236, possibly with F and S
+    tools = {}
+    for words in gcode_lexer.lex_lines(header.decode('utf-8', 'replace').splitlines(),
+                                       excellon=True):
+        if words and words[0].letter == 'T':
+            size = gcode_lexer.value_of(words, 'C')
+            if size is not None:
+                tools[int(words[0].value)] = float(size)
+
+    tool, x, y = _parse_body(body, digits, zeros)
+    profiling.count('holes parsed', len(x))
+    return Excellon(units, digits, zeros, tools, tool, x, y)
+
+#---------Read a drill file------------------#
+def read_excellon(filename, digits=None):
+    fp = open(filename, 'rb')
+    try:
+        text = fp.read()
+    finally:
+        fp.close()
+    return parse_excellon(text, digits)
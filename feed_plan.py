@@ -0,0 +1,437 @@
+#! /usr/bin/env python
+
+#
+# feed_plan.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   cutline.py cuts every move of the outline at feed_rate (250) and
+#   drill_G_output.py plunges every bit at feed_rate (100), whatever the
+#   tool and whatever the move.  A long straight edge of the outline can
+#   go faster than that, a plunge or a tight corner should go slower,
+#   and the small #65 bit breaks long before the #44 does.
+#
+#   schedule_feeds() gives every feed move of a program the feed of its
+#   kind from a tool table.  The cuts in X/Y are taken in chains that
+#   run on while no cut turns from the one before by more than
+#   corner_angle, and end in a sharper turn or in a stop (a lift, a
+#   plunge, a rapid):
+#     plunge  a move along Z only at feed, and every canned drill cycle
+#     short   a cut shorter than short_segment that is a chain of its
+#             own, with a sharp turn or a stop at both ends
+#     corner  the last corner_distance of a chain; shorter straight cuts
+#             in it are cut at corner whole
+#     long    a cut in a straight run of long_segment or more, cuts that
+#             keep within straight_angle of the way the run set off
+#     cut     every other cut: the short cuts of a flattened curve,
+#             arcs, and moves in X/Y and Z together
+#   A long cut that the corner begins in is split in two lines there.
+#   Rapids and the path itself are left alone; a tool with no cut feed
+#   (a drill bit) keeps the feeds of its cuts.
+#
+#   The tool table is a file, one tool or setting per line, # starts a
+#   comment:
+#       tool outline 0.794 100 250 150 150 400
+#       tool 65 0.889 60
+#       long_segment 10.0
+#   tool gives the name, the diameter in mm and the plunge, cut, short,
+#   corner and long feeds in mm/min; short, corner and long default to
+#   the cut feed.  The drill bits are named by number
+#   (65, 58, 44), the mills by job (iso, outline).  See tools.cfg.
+#
+#   feed_plan.py --tools <file> --tool <name> <in> [<out>]
+#     schedules the feeds of a G-code file, writes <in>_feeds, and
+#     prints the run time before and after (see cycle_time.py)
+#
+#   --profile, --cprofile and --log-level are described in profiling.py.
+
+import argparse
+import collections
+import math
+import re
+import sys
+
+import cycle_time
+import gcode_emit
+import gcode_lexer
+import profiling
+import retract_plan
+
+#--------------SETTINGS----------------------#
+short_segment = 1.0     # mm, shorter cuts take the short feed
+long_segment = 10.0     # mm, longer straight cuts take the long feed
+corner_angle = 45.0     # degrees of turn that slow the cut into it
+straight_angle = 2.0    # degrees a straight run may bend and stay straight
+corner_distance = 2.0   # mm before a corner cut at the corner feed
+
+default_tools_file = 'tools.cfg'
+
+Tool = collections.namedtuple('Tool', 'name diameter plunge cut short corner long')
+Tools = collections.namedtuple('Tools', 'tools short_segment long_segment corner_angle '
+                               'straight_angle corner_distance')
+
+kinds = ('plunge', 'short', 'corner', 'long', 'cut')
+
+_f_re = re.compile(r'\s*F\s*[-+]?(?:\d+\.?\d*|\.\d+)', re.I)
+_move_letters = frozenset('GXYZIJF')
+
+#---------Read a tool table------------------#
+# returns a Tools; raises IOError if the file cannot be read and
+# ValueError, naming the line, if a line cannot be understood
+def read_tools(filename):
+    values = {'short_segment': short_segment, 'long_segment': long_segment,
+              'corner_angle': corner_angle, 'straight_angle': straight_angle,
+              'corner_distance': corner_distance}
+    tools = {}
+    fp = open(filename, 'r')
+    try:
+        for n, line in enumerate(fp, 1):
+            words = line.split('#', 1)[0].split()
+            if not words:
+                continue
+            key = words[0].lower()
+            first = 1
+            if key == 'tool':
+                first = 2
+            try:
+                nums = [float(w) for w in words[first:]]
+            except ValueError:
+                nums = None
+            if key == 'tool' and nums is not None and 2 <= len(nums) <= 6:
+                # the diameter, then the plunge, cut, short, corner and long feeds
+                diameter, plunge, cut, short, corner, long_ = nums + [None] * (6 - len(nums))
+                if short is None:
+                    short = cut
+                if corner is None:
+                    corner = cut
+                if long_ is None:
+                    long_ = cut
+                tools[words[1]] = Tool(words[1], diameter, plunge, cut, short, corner, long_)
+            elif key in values and nums is not None and len(nums) == 1:
+                values[key] = nums[0]
+            else:
+                raise ValueError(str(filename) + " line " + str(n) + ": cannot read '" +
+                                 line.strip() + "'")
+    finally:
+        fp.close()
+    return Tools(tools, values['short_segment'], values['long_segment'],
+                 values['corner_angle'], values['straight_angle'], values['corner_distance'])
+
+#---------Direction of a move----------------#
+# the unit direction (dx, dy) a move sets off in, from state a to state b,
+# or the one it ends in if end; words give the I and J of an arc; None
+# if it does not move in X/Y
+def direction(a, b, words, end=False):
+    if b[0] == 2 or b[0] == 3:
+        i = gcode_lexer.value_of(words, 'I')
+        j = gcode_lexer.value_of(words, 'J')
+        if i is None or j is None:
+            return None
+        # at right angles to the radius from the centre
+        rx, ry = -i, -j
+        if end:
+            rx = b[1] - a[1] - i
+            ry = b[2] - a[2] - j
+        if b[0] == 2:
+            dx, dy = ry, -rx
+        else:
+            dx, dy = -ry, rx
+    else:
+        dx = b[1] - a[1]
+        dy = b[2] - a[2]
+    d = math.hypot(dx, dy)
+    if d == 0:
+        return None
+    return (dx / d, dy / d)
+
+# how far a move from state a to state b goes in X/Y, round the arc for
+# an arc
+def cut_length(a, b, words):
+    chord = math.hypot(b[1] - a[1], b[2] - a[2])
+    if b[0] != 2 and b[0] != 3:
+        return chord
+    i = gcode_lexer.value_of(words, 'I') or 0.0
+    j = gcode_lexer.value_of(words, 'J') or 0.0
+    sweep = (math.atan2(b[2] - a[2] - j, b[1] - a[1] - i) - math.atan2(-j, -i))
+    if b[0] == 2:
+        sweep = -sweep
+    sweep %= 2 * math.pi
+    if sweep == 0:
+        sweep = 2 * math.pi
+    return sweep * math.hypot(i, j)
+
+# the turn in degrees from direction u to direction v
+def turn(u, v):
+    c = max(-1.0, min(1.0, u[0] * v[0] + u[1] * v[1]))
+    return math.degrees(math.acos(c))
+
+#---------Rewrite the feed of a line---------#
+# feed None drops the F word
+def with_feed(text, feed):
+    body = text.rstrip('\r\n')
+    if feed is None:
+        return _f_re.sub('', body) + text[len(body):]
+    return _f_re.sub('', body) + ' F' + gcode_emit.num(feed) + text[len(body):]
+
+def plain_move(words):
+    return bool(words) and all(w.letter in _move_letters for w in words)
+
+# whether a line of words moves at feed from state a to state b
+def feed_move(a, b, words):
+    return (b[0] is not None and b[0] >= 1 and a[0] is not None and
+            None not in b[1:] and None not in a[1:] and b[1:] != a[1:] and plain_move(words))
+
+# the motion mode after a line: 0 to 3, 81 to 89 in a canned cycle,
+# None after G80 until the next motion G code
+def motion_mode(words, mode):
+    for w in words:
+        if w.letter == 'G':
+            g = int(w.value)
+            if g <= 3 or 81 <= g <= 89:
+                mode = g
+            elif g == 80:
+                mode = None
+    return mode
+
+#---------Scheduling statistics--------------#
+def new_stats():
+    stats = {'tool': None, 'split': 0, 'before': None, 'after': None}
+    for kind in kinds:
+        stats[kind] = 0
+    return stats
+
+#---------Schedule the feeds of a program----#
+# lines is any iterable of G-code lines, with or without line endings,
+# tools a Tools and name the tool in it that runs the program
+# returns the list of lines with the feed of every feed move set for its
+# kind, or the lines unchanged if the table has no such tool; stats, a
+# dict from new_stats(), counts the moves of every kind and holds the
+# cycle_time estimates of the program before and after
+def schedule_feeds(lines, tools, name, stats=None):
+    if stats is None:
+        stats = new_stats()
+    lines = list(lines)
+    tool = tools.tools.get(str(name))
+    if tool is None:
+        return lines
+    stats['tool'] = tool.name
+    words = [gcode_lexer.lex_line(line) for line in lines]
+    states = retract_plan.line_states(words)[0]
+    plan = plan_cuts(words, states, tools)
+    n = len(lines)
+    start = (None, None, None, None)
+    out = []
+    feed = None         # the feed in effect as written
+    new_feed = None     # the feed in effect as scheduled
+    mode = None
+    for k in range(n):
+        text = lines[k]
+        ws = words[k]
+        before = states[k - 1] if k else start
+        state = states[k]
+        given = gcode_lexer.value_of(ws, 'F')
+        if given is not None:
+            feed = given
+        last_mode = mode
+        mode = motion_mode(ws, mode)
+        if mode is not None and mode >= 81 and (mode != last_mode or given is not None):
+            # a canned drill cycle plunges at its F at every hole
+            if tool.plunge is not None:
+                text = with_feed(text, tool.plunge)
+                given = tool.plunge
+                stats['plunge'] += 1
+            if given is not None:
+                new_feed = given
+            out.append(text)
+            continue
+        if not feed_move(before, state, ws):
+            if given is not None:
+                new_feed = given
+            elif (new_feed != feed and feed is not None and mode in (1, 2, 3) and
+                  plain_move(ws) and any(w.letter in 'XYZ' for w in ws)):
+                # a feed move the scheduler leaves alone keeps the feed
+                # it had as written
+                text = with_feed(text, feed)
+                new_feed = feed
+            out.append(text)
+            continue
+        if k in plan:
+            kind, length, split, part = plan[k]
+        elif state[0] == 1 and state[1:3] == before[1:3]:
+            kind, split = 'plunge', None
+        else:
+            kind, split = 'cut', None
+        stats[kind] += 1
+        new = getattr(tool, kind)
+        if new is None:
+            new = feed
+        if split is not None and getattr(tool, split) is not None and new is not None:
+            # the cut up to the corner, then the corner at the corner feed
+            stats[split] += 1
+            stats['split'] += 1
+            t = (length - part) / length
+            x = before[1] + t * (state[1] - before[1])
+            y = before[2] + t * (state[2] - before[2])
+            body = text.rstrip('\r\n')
+            first = 'G01 X' + gcode_emit.num(x) + ' Y' + gcode_emit.num(y)
+            if getattr(tool, split) != new_feed:
+                first += ' F' + gcode_emit.num(getattr(tool, split))
+                new_feed = getattr(tool, split)
+            out.append(first + text[len(body):])
+        if new is not None and new != new_feed:
+            text = with_feed(text, new)
+            new_feed = new
+        elif new is not None and given is not None:
+            # the feed is already in effect
+            text = with_feed(text, None)
+        out.append(text)
+    stats['before'] = retract_plan.add_estimate(stats['before'], cycle_time.estimate_lines(lines))
+    stats['after'] = retract_plan.add_estimate(stats['after'], cycle_time.estimate_lines(out))
+    return out
+
+#---------Plan the cuts of a program---------#
+# returns {k: (kind, length, split, part)} for every cut in X/Y of the
+# program, k its line: length is how far it goes in X/Y, split the kind
+# of the part before its corner when it is to be cut in two, else None,
+# and part the length of its corner part
+#
+# The cuts are taken in chains: a chain runs on while every cut follows
+# the one before with a turn of no more than corner_angle, and ends in a
+# sharper turn or a stop.  The last corner_distance of a chain is its
+# corner, and a short cut that is a chain of its own is short.  Within a
+# chain a run of straight cuts that keep within straight_angle of the
+# way the run set off is straight, and takes the long feed when the run
+# is long_segment or more.  So the many short cuts of a flattened curve
+# take the cut feed, and only slow down into the corner that ends it.
+def plan_cuts(words, states, tools):
+    chains = []
+    chain = None
+    heading = None
+    for k in range(1, len(states)):
+        a = states[k - 1]
+        b = states[k]
+        if b[1:] == a[1:] and None not in b[1:]:
+            # does not move: the chain goes on
+            continue
+        u = None
+        if feed_move(a, b, words[k]) and b[3] == a[3]:
+            u = direction(a, b, words[k])
+        if u is None:
+            chain = None
+            continue
+        if chain is None or turn(heading, u) > tools.corner_angle:
+            chain = []
+            chains.append(chain)
+        chain.append(k)
+        heading = direction(a, b, words[k], True)
+    plan = {}
+    for chain in chains:
+        lengths = [cut_length(states[k - 1], states[k], words[k]) for k in chain]
+        # the length of the straight run every cut is in, 0 for an arc
+        runs = []
+        run = []
+        start = None
+        for k, length in zip(chain, lengths):
+            u = None
+            if states[k][0] == 1:
+                u = direction(states[k - 1], states[k], words[k])
+            if run and (u is None or start is None or turn(start, u) > tools.straight_angle):
+                runs.extend([sum(run)] * len(run))
+                run = []
+            if u is None:
+                runs.append(0)
+                continue
+            if not run:
+                start = u
+            run.append(length)
+        runs.extend([sum(run)] * len(run))
+        left = sum(lengths)
+        for k, length, run in zip(chain, lengths, runs):
+            ahead = left
+            left -= length
+            if states[k][0] != 1:
+                plan[k] = ('cut', length, None, 0)
+            elif len(chain) == 1 and length < tools.short_segment:
+                plan[k] = ('short', length, None, 0)
+            else:
+                straight = 'cut'
+                if run >= tools.long_segment:
+                    straight = 'long'
+                if left >= tools.corner_distance:
+                    plan[k] = (straight, length, None, 0)
+                elif ahead - tools.corner_distance > tools.corner_distance:
+                    # the cut up to the corner, then the corner
+                    plan[k] = ('corner', length, straight, tools.corner_distance - left)
+                else:
+                    plan[k] = ('corner', length, None, 0)
+    return plan
+
+#---------Print the scheduling report--------#
+def report(name, stats):
+    if stats['tool'] is None:
+        print(name + ": no such tool in the tool table, feeds unchanged")
+        return
+    before = stats['before'] or cycle_time.Estimate()
+    after = stats['after'] or cycle_time.Estimate()
+    counts = [str(stats[kind]) + " " + kind for kind in kinds if stats[kind]]
+    saved = before.total() - after.total()
+    if saved >= 0:
+        change = "saves " + cycle_time.hms(saved)
+    else:
+        change = "takes " + cycle_time.hms(-saved) + " longer"
+    print(name + ": tool " + stats['tool'] + ", " + (", ".join(counts) or "no feed moves") +
+          ", run time " + cycle_time.hms(before.total()) + " -> " +
+          cycle_time.hms(after.total()) + ", " + change)
+
+##############################################
+#                 MAIN
+##############################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Set the feed of every move of a G-code file for its tool and kind of move.")
+    parser.add_argument('filename', help="the G-code file to schedule")
+    parser.add_argument('out_name', nargs='?',
+        help="the file to write (default <filename>_feeds)")
+    parser.add_argument('--tools', default=default_tools_file, metavar='FILE',
+        help="the tool table (default " + default_tools_file + ")")
+    parser.add_argument('--tool', required=True, metavar='NAME',
+        help="the tool that runs the file, as named in the tool table")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    out_name = args.out_name or args.filename + "_feeds"
+    try:
+        tools = read_tools(args.tools)
+    except IOError:
+        print("Error: unable to open tool table " + str(args.tools))
+        sys.exit(1)
+    except ValueError as e:
+        print("Error: " + str(e))
+        sys.exit(1)
+    if args.tool not in tools.tools:
+        print("Error: no tool " + str(args.tool) + " in " + str(args.tools))
+        sys.exit(1)
+    with profiling.session(args, 'feed_plan'):
+        try:
+            fp = open(args.filename, 'r')
+        except IOError:
+            print("Error: unable to open file " + str(args.filename))
+            sys.exit(1)
+        try:
+            with profiling.stage('schedule feeds'):
+                stats = new_stats()
+                scheduled = schedule_feeds(fp, tools, args.tool, stats)
+                profiling.count('lines scheduled', len(scheduled))
+        finally:
+            fp.close()
+        with profiling.stage('write G-code'):
+            out_fp = open(out_name, 'w', 1 << 20)
+            try:
+                out_fp.writelines(scheduled)
+            finally:
+                out_fp.close()
+            profiling.count_file('bytes written', out_name)
+        report(out_name, stats)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+#! /usr/bin/env python
+
+#
+# gcode_emit.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   Shared writer for the G-code the scripts make.  The motion mode
+#   (G00 to G03), the feed F and the X, Y and Z position are modal: the
+#   controller keeps them from one block to the next, so a word that
+#   repeats the current value only costs bytes on the serial line.
+#
+#   An Emitter tracks that state and writes a move with only the words
+#   that change it:
+#       G01 X90.7722 Y12.3388 F100.0
+#       G01 X90.6723 Y12.5800 F100.0
+#   becomes
+#       G01 X90.7722 Y12.3388 F100.0
+#       X90.6723 Y12.58
+#   Numbers are written with num(): fixed to digits decimals with the
+#   trailing zeros dropped, always with a decimal point (the Roland
+#   reads "Z8" in thousandths of a mm), so 100.39680000000001 is
+#   written as 100.3968.
+#
+#   move() takes numbers, compact() takes the lines of an existing
+#   program.  Lines that are not plain moves (the header, spindle and
+#   tool words, canned drill cycles, comments) are passed through as
+#   written; the words they set are still tracked.  Arcs always keep
+#   X, Y, I and J.  A move that goes nowhere is left out.
+#
+#   gcode_emit.py <in> [<out>]
+#     compacts a G-code file and prints the bytes saved
+
+import argparse
+import os
+import sys
+
+import gcode_lexer
+
+#--------------SETTINGS----------------------#
+default_digits = 4
+
+_formats = ['%.' + str(d) + 'f' for d in range(10)]
+_move_letters = frozenset('GXYZIJF')
+
+#---------Format a number--------------------#
+def num(v, digits=default_digits):
+    s = _formats[digits] % v
+    if digits:
+        s = s.rstrip('0')
+        if s[-1] == '.':
+            s += '0'
+    if s[0] == '-' and s.strip('-0.') == '':
+        s = s[1:]
+    return s
+
+#---------Modal state and writer-------------#
+class Emitter(object):
+    # mode is the motion G code, feed and x, y, z the formatted values
+    # last written; None is not known yet
+    def __init__(self, digits=default_digits):
+        self.digits = digits
+        self.mode = None
+        self.feed = None
+        self.x = None
+        self.y = None
+        self.z = None
+        self.cycle = False      # in a G81 to G89 canned cycle
+        self.relative = False   # G91, positions are not tracked
+
+    #---------set a position without writing it-#
+    def at(self, x=None, y=None, z=None):
+        if x is not None:
+            self.x = num(x, self.digits)
+        if y is not None:
+            self.y = num(y, self.digits)
+        if z is not None:
+            self.z = num(z, self.digits)
+
+    #---------one move---------------------------#
+    # returns the line for the move, or None when it changes nothing
+    # axes that are None are not moved; i and j are only for arcs
+    def move(self, mode, x=None, y=None, z=None, i=None, j=None, f=None):
+        d = self.digits
+        arc = mode == 2 or mode == 3
+        words = []
+        if x is not None:
+            s = num(x, d)
+            if arc or s != self.x:
+                words.append('X' + s)
+                self.x = s
+        if y is not None:
+            s = num(y, d)
+            if arc or s != self.y:
+                words.append('Y' + s)
+                self.y = s
+        if z is not None:
+            s = num(z, d)
+            if s != self.z:
+                words.append('Z' + s)
+                self.z = s
+        if arc:
+            if i is not None:
+                words.append('I' + num(i, d))
+            if j is not None:
+                words.append('J' + num(j, d))
+        if words and mode != self.mode:
+            words.insert(0, 'G%02d' % mode)
+            self.mode = mode
+        if f is not None:
+            s = num(f, d)
+            if s != self.feed:
+                words.append('F' + s)
+                self.feed = s
+        if not words:
+            return None
+        return ' '.join(words)
+
+    #---------track a line passed through--------#
+    def track(self, words):
+        for w in words:
+            if w.letter == 'G':
+                g = int(w.value)
+                if g <= 3:
+                    self.mode = g
+                elif g == 80:
+                    self.cycle = False
+                elif 81 <= g <= 89:
+                    self.cycle = True
+                    self.mode = None
+                elif g == 91:
+                    self.relative = True
+                elif g == 90:
+                    self.relative = False
+                elif g in (28, 30, 53, 92):
+                    self.x = self.y = self.z = None
+            elif w.letter == 'F':
+                self.feed = num(w.value, self.digits)
+            elif w.letter == 'X':
+                self.x = num(w.value, self.digits)
+            elif w.letter == 'Y':
+                self.y = num(w.value, self.digits)
+            elif w.letter == 'Z':
+                self.z = num(w.value, self.digits)
+        if self.relative:
+            self.x = self.y = self.z = None
+        if self.cycle:
+            # the Z of a cycle is the bottom of the hole, not where the
+            # tool stops
+            self.z = None
+
+    #---------one line of a program--------------#
+    # returns the line with the words that change nothing left out, the
+    # line unchanged if it is not a plain move, or None if nothing is left
+    def line(self, text):
+        body = text.rstrip('\r\n')
+        # fast path: space separated words of the move letters only
+        parts = body.split()
+        words = None
+        if parts:
+            try:
+                words = [(p[0], float(p[1:])) for p in parts if p[0] in _move_letters]
+            except ValueError:
+                words = None
+            if words is not None and len(words) != len(parts):
+                words = None
+        if words is None:
+            lexed = gcode_lexer.lex_line(body)
+            if not lexed:
+                return text
+            if any(w.letter not in _move_letters for w in lexed):
+                self.track(lexed)
+                return text
+            words = [(w.letter, w.value) for w in lexed]
+        values = {}
+        modes = []
+        for letter, value in words:
+            if letter == 'G':
+                modes.append(value)
+            elif letter in values:
+                values = None
+                break
+            else:
+                values[letter] = value
+        if (values is None or len(modes) > 1 or (modes and modes[0] > 3) or
+                self.cycle or self.relative or (not modes and self.mode is None)):
+            self.track(gcode_lexer.lex_line(body))
+            return text
+        mode = int(modes[0]) if modes else self.mode
+        out = self.move(mode, values.get('X'), values.get('Y'), values.get('Z'),
+                        values.get('I'), values.get('J'), values.get('F'))
+        if out is None:
+            return None
+        return out + text[len(body):]
+
+#---------Compact a program------------------#
+# lines is any iterable of G-code lines, with or without line endings
+# yields the lines with the words that change nothing left out
+def compact(lines, digits=default_digits, emitter=None):
+    if emitter is None:
+        emitter = Emitter(digits)
+    for text in lines:
+        out = emitter.line(text)
+        if out is not None:
+            yield out
+
+##############################################
+#                 MAIN
+##############################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Leave the words that repeat the modal state out of a G-code file.")
+    parser.add_argument('filename', help="the G-code file to compact")
+    parser.add_argument('out_name', nargs='?',
+        help="the file to write (default <filename>_compact)")
+    parser.add_argument('--digits', type=int, default=default_digits, choices=range(10),
+        help="decimals written (default " + str(default_digits) + ")")
+    args = parser.parse_args(argv)
+
+    out_name = args.out_name or args.filename + "_compact"
+    try:
+        fp = open(args.filename, 'r')
+    except IOError:
+        print("Error: unable to open file " + str(args.filename))
+        sys.exit(1)
+    size_out = 0
+    out_fp = open(out_name, 'w', 1 << 20)
+    try:
+        for line in compact(fp, args.digits):
+            size_out += len(line)
+            out_fp.write(line)
+    finally:
+        out_fp.close()
+        fp.close()
+    size_in = os.path.getsize(args.filename)
+    print(args.filename + " -> " + out_name + ": " + str(size_in) + " -> " + str(size_out) +
+          " bytes (" + str(round(100.0 * (size_in - size_out) / max(size_in, 1), 1)) +
+          "% smaller)")
+
+if __name__ == '__main__':
+    main()
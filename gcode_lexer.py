@@ -0,0 +1,258 @@
+#! /usr/bin/env python
+
+#
+# gcode_lexer.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   Shared tokenizer for the G-code written by PCBmill and our own
+#   scripts, and for Excellon drill files.  A line such as
+#       G01 X100.3968 Y-0.3970 F100.0
+#   becomes the words
+#       Word('G', 1.0, n) Word('X', 100.3968, n) Word('Y', -0.397, n) ...
+#   where n is the source line number.
+#
+#   Lines starting with '%' (tape marks and PCBmill comments), text
+#   after ';' and text in parentheses carry no words.
+#
+#   Excellon numbers are kept as the digits written, because their
+#   meaning depends on the number format in the drill file header
+#   (see excellon.py).
+#
+#   lex_line() is for a line at a time.  scan() lexes a whole file in
+#   one pass over its bytes with NumPy and returns the words as
+#   columns (letter, value, line), which is what the bulk readers use.
+#
+#   gcode_lexer.py <filename>
+#     lexes the file and prints the lexing speed in words/sec
+
+import collections
+import re
+import sys
+import time
+
+import numpy as np
+
+Word = collections.namedtuple('Word', 'letter value line')
+
+_word_re = re.compile(r'([A-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))')
+_comment_re = re.compile(r'\([^)]*\)|;.*')
+_pow10 = 10.0 ** np.arange(-32, 33)
+
+# the lines PCBmill writes for cutting moves: G01 X.. Y.. [F..]
+_feed_move_re = re.compile(r'^G0?1\s*X\s*([-+]?[\d.]+)\s*Y\s*([-+]?[\d.]+)\s*(?:F\s*([\d.]+))?\s*$')
+
+# letters whose values are written as two digit codes, e.g. G00, M05
+CODE_LETTERS = 'GM'
+
+#---------Lex one line-----------------------#
+# return the list of words in text
+# excellon=True keeps numbers as the digits written
+def lex_line(text, line=0, excellon=False):
+    if text[:1] == '%':
+        return []
+    if '(' in text or ';' in text:
+        text = _comment_re.sub('', text)
+    if excellon:
+        return [Word(l, v, line) for l, v in _word_re.findall(text)]
+    return [Word(l, float(v), line) for l, v in _word_re.findall(text)]
+
+#---------Lex many lines---------------------#
+# lines is any iterable of text lines
+# yields the list of words of every line, numbered from start
+def lex_lines(lines, start=1, excellon=False):
+    n = start
+    for text in lines:
+        yield lex_line(text, n, excellon)
+        n += 1
+
+#---------Words of a whole file--------------#
+# one entry per word, in file order
+class WordArrays(object):
+    # letter    uint8 array, ASCII code of the word's letter
+    # line      int array, source line number
+    # mantissa  float64 array, all digits written read as one signed integer
+    # decimals  int array, digits after the decimal point, -1 if none written
+    # ndigits   int array, number of digits written
+    # col0      bool array, True if the word starts its line
+    def __init__(self, letter, line, mantissa, decimals, ndigits, col0):
+        self.letter = letter
+        self.line = line
+        self.mantissa = mantissa
+        self.decimals = decimals
+        self.ndigits = ndigits
+        self.col0 = col0
+
+    def __len__(self):
+        return len(self.letter)
+
+    #---------values as written----------------#
+    def values(self):
+        return self.mantissa * _pow10[32 - np.maximum(self.decimals, 0)]
+
+    #---------one value per line---------------#
+    # returns (val, has) arrays indexed by line number: the value of the
+    # first word with this letter on each line, and whether there was one
+    # values overrides self.values(), where limits the words looked at
+    def per_line(self, letter, nlines, values=None, where=None):
+        if values is None:
+            values = self.values()
+        match = self.letter == ord(letter)
+        if where is not None:
+            match &= where
+        wl = np.flatnonzero(match)
+        lines = self.line[wl]
+        keep = np.ones(len(wl), dtype=bool)
+        keep[1:] = lines[1:] != lines[:-1]
+        val = np.zeros(nlines, dtype=values.dtype)
+        has = np.zeros(nlines, dtype=bool)
+        val[lines[keep]] = values[wl[keep]]
+        has[lines[keep]] = True
+        return val, has
+
+    #---------typed words----------------------#
+    def __iter__(self):
+        letters = [chr(c) for c in self.letter.tolist()]
+        return map(Word, letters, self.values().tolist(), self.line.tolist())
+
+#---------Scan a whole file------------------#
+# data is the text of a file, str or bytes; lines are numbered from start
+# Every letter starts a word, and the digits of all words are summed in
+# one pass over the bytes, so no per-word Python work is done.
+def scan(data, start=1):
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    buf = np.frombuffer(b'\n' + data, dtype=np.uint8)
+    newline = buf == 10
+    line_of = np.cumsum(newline, dtype=np.int32) + (start - 1)
+
+    # text in parentheses, and from ';' or a line-leading '%' to the end
+    # of the line, is comment
+    comment = np.zeros(len(buf), dtype=bool)
+    if b'(' in data:
+        depth = np.cumsum(buf == 40, dtype=np.int32) - np.cumsum(buf == 41, dtype=np.int32)
+        comment |= depth > 0
+    if b';' in data or b'%' in data:
+        marker = buf == 59
+        marker[1:] |= (buf[1:] == 37) & newline[:-1]
+        marks = np.cumsum(marker, dtype=np.int32)
+        at_line_start = np.maximum.accumulate(np.where(newline, marks, 0))
+        comment |= marks > at_line_start
+
+    letter = (buf >= 65) & (buf <= 90) & ~comment
+    boundary = letter | newline | comment
+    is_digit = (buf >= 48) & (buf <= 57) & ~comment
+    starts = np.flatnonzero(boundary)
+    word_of = np.cumsum(boundary, dtype=np.int32) - 1
+    ends = np.append(starts[1:], len(buf)) - 1
+
+    cd = np.cumsum(is_digit, dtype=np.int32)
+    ndigits = cd[ends] - cd[starts]
+    pos = np.flatnonzero(is_digit)
+    w = word_of[pos]
+    place = cd[ends[w]] - cd[pos]
+    weights = (buf[pos] - 48) * _pow10[np.minimum(place, 32) + 32]
+    mantissa = np.bincount(w, weights=weights, minlength=len(starts))
+
+    decimals = np.full(len(starts), -1, dtype=np.int32)
+    dots = np.flatnonzero((buf == 46) & ~comment)
+    decimals[word_of[dots]] = cd[ends[word_of[dots]]] - cd[dots]
+    minus = np.flatnonzero((buf == 45) & ~comment)
+    mantissa[word_of[minus]] *= -1
+
+    # keep letters that carry a number
+    keep = letter[starts] & (ndigits > 0)
+    col0 = newline[starts - 1] if len(starts) else np.zeros(0, dtype=bool)
+    starts_kept = starts[keep]
+    return WordArrays(buf[starts_kept], line_of[starts_kept], mantissa[keep],
+                      decimals[keep], ndigits[keep], col0[keep])
+
+#---------Modal values-----------------------#
+# lines without a value keep the last value before them; lines before
+# the first value get initial
+def fill_modal(val, has, initial=0):
+    last = np.where(has, np.arange(len(has)), 0)
+    np.maximum.accumulate(last, out=last)
+    filled = val[last]
+    filled[~np.maximum.accumulate(has)] = initial
+    return filled
+
+#---------Runs of cutting moves--------------#
+# lines is any iterable of G-code lines
+# Consecutive G01 X Y moves at one feed rate are grouped into runs of
+# at most max_points moves.  yields (pts, lines, feed) for every run,
+# where pts[0] is the position the run starts from and pts[k] the end
+# of lines[k - 1], and (None, line, None) for every other line
+def cutting_runs(lines, max_points=4096):
+    x = 0.0
+    y = 0.0
+    pts = [(x, y)]
+    run = []
+    feed = None
+    for line in lines:
+        m = _feed_move_re.match(line)
+        if run and (m is None or len(run) >= max_points or
+                    (m.group(3) is not None and m.group(3) != feed)):
+            yield pts, run, feed
+            pts = [(x, y)]
+            run = []
+        if m is not None:
+            if not run:
+                feed = m.group(3)
+            x = float(m.group(1))
+            y = float(m.group(2))
+            pts.append((x, y))
+            run.append(line)
+            continue
+        words = lex_line(line)
+        x = value_of(words, 'X', x)
+        y = value_of(words, 'Y', y)
+        pts = [(x, y)]
+        yield None, line, None
+    if run:
+        yield pts, run, feed
+
+#---------Value of a letter------------------#
+# return the value of the first word with this letter, or default
+def value_of(words, letter, default=None):
+    for w in words:
+        if w.letter == letter:
+            return w.value
+    return default
+
+#---------Replace a letter's value-----------#
+# return a copy of words with the value of letter changed
+def replace_value(words, letter, value):
+    return [w._replace(value=value) if w.letter == letter else w for w in words]
+
+#---------Words back to text-----------------#
+# G and M words are written as two digit codes, the rest as str(value)
+def format_word(w):
+    if w.letter in CODE_LETTERS:
+        return w.letter + '%02d' % w.value
+    return w.letter + str(w.value)
+
+def join_words(words):
+    return ' '.join([format_word(w) for w in words])
+
+#---------Lexing speed-----------------------#
+# return (words, seconds) to lex text
+def benchmark(text):
+    t0 = time.time()
+    words = scan(text)
+    return len(words), time.time() - t0
+
+if __name__ == '__main__':
+    if(len(sys.argv) != 2):
+        print("Usage: gcode_lexer.py <filename>")
+        print("\t<filename> must point to a G-code or drill file.")
+        sys.exit()
+    try:
+        fp = open(sys.argv[1], 'r')
+    except IOError:
+        print("Error: unable to open file " + str(sys.argv[1]))
+        sys.exit()
+    count, secs = benchmark(fp.read())
+    fp.close()
+    print(str(count) + " words in " + str(round(secs, 3)) + " s, " +
+          str(int(count / max(secs, 1e-9))) + " words/sec")
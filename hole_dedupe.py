@@ -0,0 +1,174 @@
+#! /usr/bin/env python
+
+#
+# hole_dedupe.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   Merged and panelized Excellon files often drill the same via
+#   twice, or put a hole a few mils from another one.  Once
+#   drill_G_output.py bins the sizes into three bits, holes of
+#   different tools can land on top of each other as well.  Every
+#   such hole is a wasted drill cycle and a chance to break a bit.
+#
+#   dedupe() hashes the holes into square cells one tolerance wide,
+#   so only holes in the same or a neighbouring cell are compared.
+#   Of every group of holes closer than the tolerance the largest is
+#   kept.  Between holes of the same size the one that comes first in
+#   the list wins; dedupe_tools() lists the holes one tool after
+#   another in the order the tools are given, so that is the first
+#   tool, then the first hole of that tool, not the order of the file.
+#   The pairs are found with sorted array lookups, so the time grows
+#   with the number of holes, not its square.  A tolerance of 0 merges
+#   only holes at exactly the same place.
+
+import numpy as np
+
+#--------------SETTINGS----------------------#
+default_tolerance = 0.1     # mm, about 4 mils
+
+# cells compared with each hole's own cell; the other half of the
+# neighbourhood is covered by the pairs seen from the other side
+_neighbours = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+#---------Pairs of close holes---------------#
+# pts is an (N, 2) array of hole positions in mm
+# returns arrays (a, b) of the indexes of every pair of holes no more
+# than tol apart, a < b; with tol 0 or less, of every pair of holes at
+# exactly the same place
+def close_pairs(pts, tol):
+    n = len(pts)
+    none = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    if n < 2:
+        return none
+    if tol <= 0:
+        return same_pairs(pts)
+    cell = np.floor((pts - pts.min(axis=0)) / tol).astype(np.int64)
+    # one number per cell, with a spare row and column for the neighbours
+    rows = int(cell[:, 1].max()) + 3
+    key = (cell[:, 0] + 1) * rows + (cell[:, 1] + 1)
+    order = np.argsort(key, kind='stable')
+    sorted_key = key[order]
+
+    found_a = []
+    found_b = []
+    for dx, dy in _neighbours:
+        target = key + dx * rows + dy
+        lo = np.searchsorted(sorted_key, target, 'left')
+        hi = np.searchsorted(sorted_key, target, 'right')
+        count = hi - lo
+        if not count.any():
+            continue
+        a = np.repeat(np.arange(n), count)
+        # position of every pair in the sorted holes of the target cell
+        first = np.repeat(lo - np.concatenate(([0], np.cumsum(count)[:-1])), count)
+        b = order[first + np.arange(len(a))]
+        if (dx, dy) == (0, 0):
+            keep = a < b
+            a = a[keep]
+            b = b[keep]
+        d = pts[a] - pts[b]
+        near = d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1] <= tol * tol
+        found_a.append(a[near])
+        found_b.append(b[near])
+    if not found_a:
+        return none
+    a = np.concatenate(found_a)
+    b = np.concatenate(found_b)
+    return np.minimum(a, b), np.maximum(a, b)
+
+#---------Pairs of holes in one place--------#
+def same_pairs(pts):
+    order = np.lexsort((pts[:, 1], pts[:, 0]))
+    sp = pts[order]
+    # group number of every hole in sorted order
+    new = np.concatenate(([True], np.any(sp[1:] != sp[:-1], axis=1)))
+    group = np.cumsum(new)
+    found_a = []
+    found_b = []
+    k = 1
+    while k < len(sp):
+        same = group[k:] == group[:-k]
+        if not same.any():
+            break
+        found_a.append(order[:-k][same])
+        found_b.append(order[k:][same])
+        k += 1
+    if not found_a:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    a = np.concatenate(found_a)
+    b = np.concatenate(found_b)
+    return np.minimum(a, b), np.maximum(a, b)
+
+#---------Merge close holes------------------#
+# pts is an (N, 2) array of hole positions, sizes an (N,) array of
+# their diameters
+# returns (keep, merged_into): keep is a boolean array of the holes
+# left, merged_into[i] the hole that replaced hole i, or -1; of holes
+# of the same size the one earlier in pts is kept
+def dedupe(pts, sizes, tol=default_tolerance):
+    n = len(pts)
+    keep = np.ones(n, dtype=bool)
+    merged_into = np.full(n, -1, dtype=np.int64)
+    a, b = close_pairs(np.asarray(pts, dtype=np.float64), tol)
+    if len(a) == 0:
+        return keep, merged_into
+
+    # rank 0 is the hole to keep first: largest, then earliest
+    rank = np.empty(n, dtype=np.int64)
+    rank[np.lexsort((np.arange(n), -np.asarray(sizes, dtype=np.float64)))] = np.arange(n)
+    swap = rank[b] < rank[a]
+    better = np.where(swap, b, a)
+    worse = np.where(swap, a, b)
+
+    # walk the holes that lose a pair in rank order; a hole is removed
+    # when a hole it is close to, and which ranks above it, is kept
+    order = np.lexsort((rank[better], rank[worse]))
+    for w, k in zip(worse[order].tolist(), better[order].tolist()):
+        if keep[w] and keep[k]:
+            keep[w] = False
+            merged_into[w] = k
+    return keep, merged_into
+
+#---------Merge close holes of many tools----#
+# coords is a list of (N, 2) arrays of hole positions, one per tool,
+# sizes the diameter of each tool
+# of holes of the same size the one of the earlier tool in coords is
+# kept, then the earlier hole of that tool
+# returns (coords, stats) with the removed holes left out of coords, in
+# the dtype they were given
+def dedupe_tools(coords, sizes, tol=default_tolerance):
+    counts = [len(c) for c in coords]
+    pts = np.concatenate([np.asarray(c, dtype=np.float64).reshape(-1, 2) for c in coords] +
+                         [np.zeros((0, 2))])
+    hole_sizes = np.repeat(np.asarray(sizes, dtype=np.float64), counts)
+    tool = np.repeat(np.arange(len(coords)), counts)
+    keep, merged_into = dedupe(pts, hole_sizes, tol)
+
+    removed = np.flatnonzero(~keep)
+    into = merged_into[removed]
+    exact = np.all(pts[removed] == pts[into], axis=1)
+    stats = {'holes': len(pts), 'removed': len(removed),
+             'exact': int(np.count_nonzero(exact)),
+             'other_tool': int(np.count_nonzero(tool[removed] != tool[into])),
+             'per_tool': np.bincount(tool[removed], minlength=len(coords)).tolist(),
+             'sizes': list(sizes), 'tolerance': tol}
+    out = []
+    start = 0
+    for c, n in zip(coords, counts):
+        out.append(np.asarray(c).reshape(-1, 2)[keep[start:start + n]])
+        start += n
+    return out, stats
+
+#---------Print the dedupe report------------#
+def report(stats):
+    where = "within " + str(stats['tolerance']) + " mm of"
+    if stats['tolerance'] <= 0:
+        where = "on top of"
+    print("Removed " + str(stats['removed']) + " of " + str(stats['holes']) +
+          " holes " + where + " a larger or earlier hole (" +
+          str(stats['exact']) + " exact duplicates, " + str(stats['other_tool']) +
+          " under a hole of another tool)")
+    for size, n in zip(stats['sizes'], stats['per_tool']):
+        if n:
+            print("  " + str(n) + " holes of size " + str(size))
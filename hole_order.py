@@ -0,0 +1,341 @@
+#! /usr/bin/env python
+
+#
+# hole_order.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   Excellon files list holes in whatever order the CAM processor
+#   wrote them, so the mill spends most of a drill job travelling
+#   between holes at travel height.
+#
+#   hole_order.py finds a short drilling sequence for one group of
+#   holes.  A nearest-neighbour tour is built on a spatial grid and
+#   then refined with 2-opt and Or-opt moves until the time budget
+#   runs out.  The path is open: it starts at the work origin and
+#   ends at the last hole drilled.
+
+import bisect
+import heapq
+import math
+import time
+
+#---------Distance between two points----------#
+def dist(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+#---------Length of a drilling path------------#
+# points is a list of (x, y) tuples, order a list of indexes into points
+# the path starts at start and does not return to it
+def path_length(points, order, start=(0.0, 0.0)):
+    total = 0.0
+    last = start
+    for i in order:
+        total += dist(last, points[i])
+        last = points[i]
+    return total
+
+#---------Spatial grid-------------------------#
+# buckets point indexes into square cells so nearest neighbour
+# lookups only look at the cells around the query point.  The cell
+# size follows the density of the cells that hold points, not of the
+# bounding box, so holes packed into a few small clusters (panels, BGA
+# fields, connector rows) still get about per_cell points a cell.
+class SpatialGrid(object):
+    def __init__(self, points, per_cell=2.0, max_candidates=64):
+        self.points = points
+        self.max_candidates = max_candidates
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        self.x0 = min(xs)
+        self.y0 = min(ys)
+        width = max(xs) - self.x0
+        height = max(ys) - self.y0
+        self.cell = max(width, height) / math.sqrt(max(len(points) / per_cell, 1.0))
+        if self.cell <= 0.0:
+            self.cell = 1.0
+        # shrink the cells until the occupied ones hold per_cell points
+        for _ in range(20):
+            occupied = len(set(self.cell_of(x, y) for x, y in points))
+            cell = math.sqrt(occupied * per_cell / len(points)) * self.cell
+            if cell <= 0.0 or cell > 0.7 * self.cell:
+                break
+            self.cell = cell
+        self.nx = int(width / self.cell) + 1
+        self.ny = int(height / self.cell) + 1
+        self.cells = {}
+        for i, p in enumerate(points):
+            self.cells.setdefault(self.cell_of(p[0], p[1]), []).append(i)
+        self._around = {}
+
+    def cell_of(self, x, y):
+        return (int((x - self.x0) // self.cell), int((y - self.y0) // self.cell))
+
+    def remove(self, i):
+        key = self.cell_of(self.points[i][0], self.points[i][1])
+        bucket = self.cells[key]
+        bucket.remove(i)
+        if not bucket:
+            del self.cells[key]
+        if self._around:
+            self._around = {}
+
+    def ring(self, cx, cy, r):
+        # yields the cells at chebyshev distance r from (cx, cy)
+        if r == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-r, r + 1):
+            yield (cx + dx, cy - r)
+            yield (cx + dx, cy + r)
+        for dy in range(-r + 1, r):
+            yield (cx - r, cy + dy)
+            yield (cx + r, cy + dy)
+
+    def nearest(self, x, y):
+        # return the index of the closest point left in the grid, or None
+        if not self.cells:
+            return None
+        cx, cy = self.cell_of(x, y)
+        # the query point may lie outside the grid, so search far enough
+        # to reach every cell from where it is
+        max_ring = max(abs(cx), abs(cy), abs(self.nx - cx), abs(self.ny - cy)) + 1
+        best = None
+        best_d = float('inf')
+        cells = self.cells
+        points = self.points
+        looked = 0
+        for r in range(max_ring + 1):
+            if looked > len(cells):
+                # the rings cover more empty cells than there are full
+                # ones, as between clusters: look at every full cell
+                return self.nearest_of_all(x, y)
+            for key in self.ring(cx, cy, r):
+                looked += 1
+                bucket = cells.get(key)
+                if bucket:
+                    for i in bucket:
+                        p = points[i]
+                        d = math.hypot(p[0] - x, p[1] - y)
+                        if d < best_d:
+                            best_d = d
+                            best = i
+            # anything in ring r+1 is at least r cells away
+            if best is not None and best_d <= r * self.cell:
+                break
+        return best
+
+    def nearest_of_all(self, x, y):
+        best = None
+        best_d = float('inf')
+        points = self.points
+        for bucket in self.cells.values():
+            for i in bucket:
+                p = points[i]
+                d = math.hypot(p[0] - x, p[1] - y)
+                if d < best_d:
+                    best_d = d
+                    best = i
+        return best
+
+    def around(self, cx, cy):
+        # the points of cell (cx, cy) and the 8 cells around it, and
+        # their x sorted when there are more than max_candidates
+        key = (cx, cy)
+        found = self._around.get(key)
+        if found is None:
+            cells = self.cells
+            near = []
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    near.extend(cells.get((cx + dx, cy + dy), ()))
+            xs = None
+            if len(near) > self.max_candidates:
+                points = self.points
+                near.sort(key=lambda j: points[j][0])
+                xs = [points[j][0] for j in near]
+            found = self._around[key] = (near, xs)
+        return found
+
+    def neighbours(self, i, k):
+        # up to k closest points to point i from its own cell and the 8
+        # cells around it; a crowded cell offers only the max_candidates
+        # points nearest to it in x
+        x, y = self.points[i]
+        near, xs = self.around(*self.cell_of(x, y))
+        if xs is not None:
+            m = bisect.bisect_left(xs, x)
+            half = self.max_candidates // 2
+            near = near[max(m - half, 0):m + half]
+        points = self.points
+        hypot = math.hypot
+        found = heapq.nsmallest(k, ((hypot(points[j][0] - x, points[j][1] - y), j)
+                                    for j in near if j != i))
+        return [j for d, j in found]
+
+    def neighbour_lists(self, k):
+        # the neighbours() of every point
+        neigh = [self.neighbours(i, k) for i in range(len(self.points))]
+        self._around = {}
+        return neigh
+
+#---------Nearest neighbour tour---------------#
+def nearest_neighbour_tour(points, start=(0.0, 0.0)):
+    grid = SpatialGrid(points)
+    order = []
+    x, y = start
+    while True:
+        i = grid.nearest(x, y)
+        if i is None:
+            break
+        grid.remove(i)
+        order.append(i)
+        x, y = points[i]
+    return order
+
+#---------2-opt and Or-opt refinement----------#
+# tour[0] is the start point and never moves.  Only neighbours from
+# the grid are tried, which keeps each pass close to linear.
+class _Refiner(object):
+    def __init__(self, pts, tour, neigh, deadline):
+        self.pts = pts
+        self.tour = tour
+        self.neigh = neigh
+        self.deadline = deadline
+        self.pos = [0] * len(tour)
+        for idx, node in enumerate(tour):
+            self.pos[node] = idx
+
+    def d(self, a, b):
+        if a is None or b is None:
+            # the open end of the path costs nothing
+            return 0.0
+        pa = self.pts[a]
+        pb = self.pts[b]
+        return math.hypot(pa[0] - pb[0], pa[1] - pb[1])
+
+    def at(self, idx):
+        if 0 <= idx < len(self.tour):
+            return self.tour[idx]
+        return None
+
+    def reverse(self, i, j):
+        # reverse tour[i..j] in place
+        tour = self.tour
+        tour[i:j + 1] = tour[i:j + 1][::-1]
+        pos = self.pos
+        for idx in range(i, j + 1):
+            pos[tour[idx]] = idx
+
+    def two_opt(self, a):
+        i = self.pos[a]
+        for c in self.neigh[a]:
+            j = self.pos[c]
+            # join a to c and their successors together
+            b = self.at(i + 1)
+            dn = self.at(j + 1)
+            if b != c and dn != a:
+                gain = self.d(a, b) + self.d(c, dn) - self.d(a, c) - self.d(b, dn)
+                if gain > 1e-9:
+                    if i < j:
+                        self.reverse(i + 1, j)
+                    else:
+                        self.reverse(j + 1, i)
+                    return True
+            # join a to c and their predecessors together
+            if i > 0 and j > 0:
+                p = self.at(i - 1)
+                q = self.at(j - 1)
+                if p != c and q != a:
+                    gain = self.d(p, a) + self.d(q, c) - self.d(a, c) - self.d(p, q)
+                    if gain > 1e-9:
+                        if i < j:
+                            self.reverse(i, j - 1)
+                        else:
+                            self.reverse(j, i - 1)
+                        return True
+        return False
+
+    def or_opt(self, a):
+        tour = self.tour
+        i = self.pos[a]
+        for length in (1, 2, 3):
+            if i + length > len(tour):
+                break
+            seg = tour[i:i + length]
+            p = self.at(i - 1)
+            n = self.at(i + length)
+            removed = self.d(p, seg[0]) + self.d(seg[-1], n) - self.d(p, n)
+            if removed <= 1e-9:
+                continue
+            for c in self.neigh[seg[0]] + self.neigh[seg[-1]]:
+                j = self.pos[c]
+                if i - 1 <= j < i + length:
+                    continue
+                cn = self.at(j + 1)
+                base = self.d(c, cn)
+                fwd = self.d(c, seg[0]) + self.d(seg[-1], cn) - base
+                rev = self.d(c, seg[-1]) + self.d(seg[0], cn) - base
+                if min(fwd, rev) < removed - 1e-9:
+                    if rev < fwd:
+                        seg = seg[::-1]
+                    rest = tour[:i] + tour[i + length:]
+                    k = j if j < i else j - length
+                    tour[:] = rest[:k + 1] + seg + rest[k + 1:]
+                    lo = min(i, k + 1)
+                    hi = max(i + length, k + 1 + length)
+                    for idx in range(lo, min(hi, len(tour))):
+                        self.pos[tour[idx]] = idx
+                    return True
+        return False
+
+    def run(self):
+        queue = list(self.tour[1:])
+        queued = set(queue)
+        while queue:
+            if time.time() > self.deadline:
+                break
+            a = queue.pop()
+            queued.discard(a)
+            if self.two_opt(a) or self.or_opt(a):
+                # look at a and its neighbours again
+                for b in [a] + self.neigh[a]:
+                    if b not in queued:
+                        queued.add(b)
+                        queue.append(b)
+        return self.tour
+
+#---------Order a group of holes---------------#
+# points is a list of (x, y) tuples in mm
+# returns (order, stats) where order is a list of indexes into points
+# and stats holds the path lengths before and after ordering
+def order_holes(points, time_budget=2.0, start=(0.0, 0.0), neighbours=8):
+    stats = {'holes': len(points), 'original': path_length(points, range(len(points)), start)}
+    if len(points) < 3:
+        stats['optimized'] = stats['original']
+        return list(range(len(points))), stats
+
+    order = nearest_neighbour_tour(points, start)
+    stats['nearest'] = path_length(points, order, start)
+
+    # the start point is added as node n so it can sit at tour[0]
+    pts = list(points) + [start]
+    neigh = SpatialGrid(points).neighbour_lists(neighbours)
+    neigh.append([])
+    deadline = time.time() + time_budget
+    tour = [len(points)] + order
+    tour = _Refiner(pts, tour, neigh, deadline).run()
+    order = tour[1:]
+
+    stats['optimized'] = path_length(points, order, start)
+    if stats['optimized'] > stats['original']:
+        # the file was already in a better order than we found
+        order = list(range(len(points)))
+        stats['optimized'] = stats['original']
+    return order, stats
+
+#---------Print the travel report--------------#
+def report(name, stats):
+    print(name + ": " + str(stats['holes']) + " holes, travel " +
+          str(round(stats['original'], 1)) + " mm -> " +
+          str(round(stats['optimized'], 1)) + " mm")
@@ -0,0 +1,488 @@
+#! /usr/bin/env python
+
+#
+# mill_sim.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   Cuts a job in software before it is cut on the mill, so a missed
+#   isolation gap or a gouge is found before the board is ruined.
+#
+#   mill_sim.py [--iso FILE[:MM]] ... [--outline FILE[:MM]]
+#               [--drill FILE[:MM]] ... [--excellon FILE]
+#               [--resolution MM] [--save-map FILE]
+#
+#     --iso        isolation files from G_final.py (or PCBmill), cut
+#                  with an iso_tool mm end mill
+#     --outline    the outline program from cutline.py, cut with an
+#                  outline_tool mm end mill
+#     --drill      drill programs from drill_G_output.py; the bit is
+#                  taken from the file name (65_drill.txt is #65)
+#     --excellon   the Eagle drill file, whose holes must all be cut
+#   :MM after a file name gives its tool diameter instead.  .tp
+#   toolpaths (see toolpath.py) may be given for any of them, and
+#   G81/G83 drill cycles are run as the moves they stand for.
+#
+#   The stock is a height map: one Z per square cell of --resolution
+#   mm, starting at Z0, the top of the stock.  Every move below Z0
+#   sweeps the flat end of the round tool along it, lowering every
+#   cell the tool passes over to the tool's height there.  Long moves
+#   are cut into short pieces and the pieces are swept in batches, a
+#   window of cells per piece, with NumPy.
+#
+#   After the milling programs (isolation and outline) are cut:
+#     cuts deeper than cutline.py's final_depth are reported as
+#     gouges.
+#   After the drill programs are cut as well:
+#     every cutting run of an isolation file is walked along the
+#     tool's centre, and any stretch left above isolation_depth is an
+#     uncut gap.  A run that ends within loop_snap mm of its start is
+#     a closed isolation loop, so the way back to its start is walked
+#     too; a loop that does not quite close leaves a copper bridge.
+#     every hole of the Excellon file must be cut to final_depth
+#     within hole_tolerance mm of its centre, or it is missing.
+#   mill_sim.py exits with status 1 if any of these are found.
+#
+#   An A5 board at 0.02 mm is a map of 78 million cells (300 MB).
+#
+#   --profile, --cprofile and --log-level are described in profiling.py.
+
+import argparse
+import collections
+import os
+import sys
+
+import numpy as np
+
+import cutline
+import cycle_time
+import drill_G_output
+import excellon
+import hole_dedupe
+import profiling
+import toolpath
+
+#--------------SETTINGS----------------------#
+default_resolution = 0.02   # mm per cell
+stock_top = 0.0             # Z of the top of the stock
+iso_tool = 0.396            # mm, fine end mill from the SOP
+outline_tool = 0.794        # mm, cutline.py's offset is half of this
+isolation_depth = -0.6      # PCBmill's Z mill depth from the SOP
+depth_tolerance = 0.05      # mm above or below a depth that still counts
+loop_snap = 2.0             # mm, a run ending this close to its start is a loop
+hole_tolerance = hole_dedupe.default_tolerance
+margin = 1.0                # mm of stock round the job
+cell_budget = 1 << 21       # cells looked at per batch of pieces
+most_listed = 10            # gaps, gouges and holes printed by name
+
+# diameters in inches of the bits of drill_G_output.outfiles
+bit_diameters = [0.035, 0.042, 0.086]
+
+Segments = collections.namedtuple('Segments', 'ax ay az bx by bz')
+
+#---------Stock height map-------------------#
+# z[row, col] is the height of the cell whose centre is at
+# x = x0 + (col + 0.5) * res, y = y0 + (row + 0.5) * res
+class HeightMap(object):
+    def __init__(self, x0, y0, x1, y1, res=default_resolution, top=stock_top):
+        self.res = res
+        self.x0 = x0
+        self.y0 = y0
+        self.nx = int(np.ceil((x1 - x0) / res))
+        self.ny = int(np.ceil((y1 - y0) / res))
+        self.z = np.full((self.ny, self.nx), top, dtype=np.float32)
+
+    #---------cells of points--------------------#
+    # returns (row, col) arrays, clipped to the map
+    def cell(self, x, y):
+        col = np.clip(np.floor((np.asarray(x) - self.x0) / self.res).astype(np.int64), 0, self.nx - 1)
+        row = np.clip(np.floor((np.asarray(y) - self.y0) / self.res).astype(np.int64), 0, self.ny - 1)
+        return row, col
+
+    def centre(self, row, col):
+        return self.x0 + (col + 0.5) * self.res, self.y0 + (row + 0.5) * self.res
+
+    def sample(self, x, y):
+        row, col = self.cell(x, y)
+        return self.z[row, col]
+
+    #---------lowest cell round points-----------#
+    # the lowest Z within radius of every point
+    def lowest_near(self, x, y, radius):
+        k = int(np.ceil(radius / self.res))
+        off = np.arange(-k, k + 1)
+        dr, dc = np.meshgrid(off, off, indexing='ij')
+        near = (dr * dr + dc * dc) * self.res * self.res <= radius * radius
+        dr = dr[near]
+        dc = dc[near]
+        row, col = self.cell(x, y)
+        rows = np.clip(row[:, None] + dr, 0, self.ny - 1)
+        cols = np.clip(col[:, None] + dc, 0, self.nx - 1)
+        return self.z[rows, cols].min(axis=1)
+
+#---------Read a program---------------------#
+# returns (moves, x, y, z): the toolpath moves of a G-code or .tp file
+# and the positions before and after every move
+def read_moves(filename):
+    if toolpath.is_toolpath(filename):
+        path = toolpath.load(filename)
+    else:
+        fp = open(filename, 'rb')
+        try:
+            data = fp.read()
+        finally:
+            fp.close()
+        profiling.count('bytes read', len(data))
+        path = toolpath.from_gcode(cycle_time.expand_cycles(data))
+    if len(path.moves) == 0:
+        return path.moves, np.zeros(1), np.zeros(1), np.full(1, stock_top + 1.0)
+    x, y, z = toolpath.positions(path)
+    profiling.count('moves read', len(path.moves))
+    return path.moves, x, y, z
+
+#---------Straight segments of the moves-----#
+# arcs are flattened to chords no more than tol from the arc, with Z
+# moving evenly along them
+def segments(moves, x, y, z, tol):
+    kind = moves['kind']
+    ci = moves['i'].astype(np.float64)
+    cj = moves['j'].astype(np.float64)
+    sx, sy, sz, ex, ey, ez = x[:-1], y[:-1], z[:-1], x[1:], y[1:], z[1:]
+    is_arc = kind >= toolpath.CW
+    n = np.ones(len(kind), dtype=np.int64)
+    sweep = np.zeros(len(kind))
+    if is_arc.any():
+        cw = kind == toolpath.CW
+        radius = np.hypot(ci, cj)
+        sweep = np.where(is_arc, cycle_time.arc_sweep(sx, sy, ex, ey, ci, cj, cw), 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = 2 * np.arccos(np.clip(1 - tol / radius, 0.0, 1.0))
+            n = np.where(is_arc & (step > 0), np.ceil(sweep / step), 1).astype(np.int64)
+        n = np.maximum(n, 1)
+    move = np.repeat(np.arange(len(kind)), n)
+    first = np.repeat(np.cumsum(n) - n, n)
+    frac0 = (np.arange(n.sum()) - first) / n[move]
+    frac1 = frac0 + 1.0 / n[move]
+
+    def point(frac):
+        px = sx[move] + (ex - sx)[move] * frac
+        py = sy[move] + (ey - sy)[move] * frac
+        arc = is_arc[move]
+        if arc.any():
+            m = move[arc]
+            cx = sx[m] + ci[m]
+            cy = sy[m] + cj[m]
+            r = np.hypot(ci[m], cj[m])
+            sign = np.where(kind[m] == toolpath.CW, -1.0, 1.0)
+            ang = np.arctan2(sy[m] - cy, sx[m] - cx) + sign * sweep[m] * frac[arc]
+            px[arc] = cx + r * np.cos(ang)
+            py[arc] = cy + r * np.sin(ang)
+        return px, py, sz[move] + (ez - sz)[move] * frac
+
+    ax, ay, az = point(frac0)
+    bx, by, bz = point(frac1)
+    last = frac1 >= 1.0
+    bx[last] = ex[move[last]]
+    by[last] = ey[move[last]]
+    bz[last] = ez[move[last]]
+    return Segments(ax, ay, az, bx, by, bz)
+
+#---------Cut segments into pieces-----------#
+# no piece is longer than length, so one window of cells fits any piece
+def pieces(seg, length):
+    dx = seg.bx - seg.ax
+    dy = seg.by - seg.ay
+    n = np.maximum(np.ceil(np.hypot(dx, dy) / length), 1).astype(np.int64)
+    move = np.repeat(np.arange(len(n)), n)
+    k = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    f0 = k / n[move]
+    f1 = (k + 1) / n[move]
+    dz = seg.bz - seg.az
+    return Segments(seg.ax[move] + dx[move] * f0, seg.ay[move] + dy[move] * f0,
+                    seg.az[move] + dz[move] * f0, seg.ax[move] + dx[move] * f1,
+                    seg.ay[move] + dy[move] * f1, seg.az[move] + dz[move] * f1)
+
+#---------Sweep the tool along segments------#
+# lowers every cell within radius of a segment to the segment's Z at
+# the nearest point; segments entirely above the stock are skipped
+def sweep(hmap, seg, radius):
+    below = np.minimum(seg.az, seg.bz) < stock_top
+    seg = Segments(*[a[below] for a in seg])
+    if len(seg.ax) == 0:
+        return 0
+    length = max(2 * radius, 8 * hmap.res)
+    seg = pieces(seg, length)
+    w = int(np.ceil((length + 2 * radius) / hmap.res)) + 2
+    offs = np.arange(w)
+    batch = max(cell_budget // (w * w), 1)
+    flat = hmap.z.reshape(-1)
+    r2 = radius * radius
+    for s in range(0, len(seg.ax), batch):
+        ax, ay, az, bx, by, bz = [a[s:s + batch] for a in seg]
+        col = np.floor((np.minimum(ax, bx) - radius - hmap.x0) / hmap.res).astype(np.int64)
+        row = np.floor((np.minimum(ay, by) - radius - hmap.y0) / hmap.res).astype(np.int64)
+        cols = col[:, None] + offs
+        rows = row[:, None] + offs
+        # cell centres from the start of each piece, (pieces, w)
+        px = (hmap.x0 + (cols + 0.5) * hmap.res - ax[:, None]).astype(np.float32)
+        py = (hmap.y0 + (rows + 0.5) * hmap.res - ay[:, None]).astype(np.float32)
+        ux = (bx - ax).astype(np.float32)[:, None, None]
+        uy = (by - ay).astype(np.float32)[:, None, None]
+        len2 = np.maximum(ux * ux + uy * uy, 1e-12)
+        dx = px[:, None, :]
+        dy = py[:, :, None]
+        t = np.clip((dx * ux + dy * uy) / len2, 0.0, 1.0)
+        ex = dx - t * ux
+        ey = dy - t * uy
+        inside = ex * ex + ey * ey <= r2
+        inside &= ((cols >= 0) & (cols < hmap.nx))[:, None, :]
+        inside &= ((rows >= 0) & (rows < hmap.ny))[:, :, None]
+        z = az.astype(np.float32)[:, None, None] + t * (bz - az).astype(np.float32)[:, None, None]
+        idx = rows[:, :, None] * hmap.nx + cols[:, None, :]
+        np.minimum.at(flat, idx[inside], z[inside])
+    return len(seg.ax)
+
+#---------Bounds of the job------------------#
+def job_bounds(programs, holes):
+    xs = [holes[:, 0]]
+    ys = [holes[:, 1]]
+    for name, kind, diameter, seg in programs:
+        r = diameter / 2.0
+        below = np.minimum(seg.az, seg.bz) < stock_top
+        for a, b, out in ((seg.ax, seg.bx, xs), (seg.ay, seg.by, ys)):
+            out.append(np.concatenate((a[below], b[below])) - r)
+            out.append(np.concatenate((a[below], b[below])) + r)
+    x = np.concatenate(xs)
+    y = np.concatenate(ys)
+    if len(x) == 0:
+        return 0.0, 0.0, 1.0, 1.0
+    return x.min() - margin, y.min() - margin, x.max() + margin, y.max() + margin
+
+#---------Cutting runs of a program----------#
+# returns a list of (N, 2) arrays, the tool centre along every run of
+# moves that stays in the stock, from the bottom of its plunge to its
+# last point
+def cutting_runs(seg):
+    deep = seg.bz < stock_top
+    stays = deep & (seg.az < stock_top)
+    runs = []
+    k = np.flatnonzero(deep)
+    if len(k) == 0:
+        return runs
+    # a run starts at every deep move that does not continue one
+    start = deep & ~np.concatenate(([False], stays[1:] & deep[:-1]))
+    run = np.cumsum(start)[k]
+    for r in np.unique(run).tolist():
+        m = k[run == r]
+        first = m[0]
+        pts = np.column_stack((np.concatenate(([seg.bx[first]], seg.bx[m[1:]])),
+                               np.concatenate(([seg.by[first]], seg.by[m[1:]]))))
+        runs.append(pts)
+    return runs
+
+#---------Points along polylines-------------#
+# returns (x, y, polyline) of points every step along every polyline
+def walk(polylines, step):
+    xs, ys, ids = [], [], []
+    for i, pts in enumerate(polylines):
+        if len(pts) < 2:
+            continue
+        a = pts[:-1]
+        d = np.diff(pts, axis=0)
+        n = np.maximum(np.ceil(np.hypot(d[:, 0], d[:, 1]) / step), 1).astype(np.int64)
+        seg = np.repeat(np.arange(len(n)), n)
+        f = (np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)) / n[seg]
+        xs.append(np.concatenate((a[seg, 0] + d[seg, 0] * f, pts[-1:, 0])))
+        ys.append(np.concatenate((a[seg, 1] + d[seg, 1] * f, pts[-1:, 1])))
+        ids.append(np.full(len(seg) + 1, i))
+    if not xs:
+        return np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int64)
+    return np.concatenate(xs), np.concatenate(ys), np.concatenate(ids)
+
+#---------Uncut isolation gaps---------------#
+# returns a list of (x, y, length) of every stretch of a run left
+# above isolation_depth
+def find_gaps(hmap, runs):
+    paths = []
+    for pts in runs:
+        if len(pts) > 2 and np.hypot(*(pts[-1] - pts[0])) <= loop_snap:
+            pts = np.concatenate((pts, pts[:1]))
+        paths.append(pts)
+    x, y, ids = walk(paths, hmap.res)
+    uncut = hmap.sample(x, y) > isolation_depth + depth_tolerance
+    gaps = []
+    if not uncut.any():
+        return gaps
+    # stretches of uncut points on the same run
+    edge = np.diff(np.concatenate(([0], uncut.astype(np.int8), [0])))
+    starts = np.flatnonzero(edge == 1)
+    ends = np.flatnonzero(edge == -1)
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        while s < e:
+            same = np.flatnonzero(ids[s:e] != ids[s])
+            stop = s + int(same[0]) if len(same) else e
+            length = float(np.sum(np.hypot(np.diff(x[s:stop]), np.diff(y[s:stop]))))
+            mid = (s + stop - 1) // 2
+            gaps.append((float(x[mid]), float(y[mid]), max(length, hmap.res)))
+            s = stop
+    return gaps
+
+#---------Gouges-----------------------------#
+# returns (area in mm^2, deepest Z, x, y of the deepest cell) of the
+# cells cut below final_depth, or None
+def find_gouges(hmap):
+    deep = hmap.z < cutline.final_depth - depth_tolerance
+    count = int(np.count_nonzero(deep))
+    if count == 0:
+        return None
+    flat = int(np.argmin(hmap.z))
+    row, col = divmod(flat, hmap.nx)
+    x, y = hmap.centre(row, col)
+    return count * hmap.res * hmap.res, float(hmap.z[row, col]), x, y
+
+#---------Missing holes----------------------#
+# returns the (N, 2) array of holes not cut to final_depth
+def find_missing_holes(hmap, holes):
+    if len(holes) == 0:
+        return holes
+    lowest = hmap.lowest_near(holes[:, 0], holes[:, 1], hole_tolerance)
+    return holes[lowest > cutline.final_depth + depth_tolerance]
+
+#---------Tool diameter of a file------------#
+# FILE:MM gives the diameter; a drill file is known by its name
+def parse_spec(spec, kind):
+    name, colon, tail = spec.rpartition(':')
+    if colon:
+        try:
+            return name, float(tail)
+        except ValueError:
+            pass
+    if kind == 'iso':
+        return spec, iso_tool
+    if kind == 'outline':
+        return spec, outline_tool
+    base = os.path.basename(spec)
+    for i, out in enumerate(drill_G_output.outfiles):
+        if base.startswith(os.path.splitext(out)[0]):
+            return spec, bit_diameters[i] * excellon.MM_PER_INCH
+    raise ValueError("no bit for " + spec + ", give its diameter as " + spec + ":MM")
+
+#---------Simulate a job---------------------#
+# files is a list of (filename, kind, diameter), kind 'iso', 'outline'
+# or 'drill'; holes an (N, 2) array of the holes that must be cut
+# returns (hmap, report) where report is a dict of what was found
+def simulate(files, holes=None, res=default_resolution):
+    if holes is None:
+        holes = np.zeros((0, 2))
+    programs = []
+    with profiling.stage('read programs'):
+        for filename, kind, diameter in files:
+            moves, x, y, z = read_moves(filename)
+            programs.append((filename, kind, diameter, segments(moves, x, y, z, res / 2.0)))
+    x0, y0, x1, y1 = job_bounds(programs, holes)
+    hmap = HeightMap(x0, y0, x1, y1, res)
+    profiling.count('cells', hmap.nx * hmap.ny)
+
+    report = {}
+    order = [p for p in programs if p[1] != 'drill'] + [p for p in programs if p[1] == 'drill']
+    for filename, kind, diameter, seg in order:
+        if kind == 'drill' and 'gouge' not in report:
+            report['gouge'] = find_gouges(hmap)
+        with profiling.stage('cut ' + os.path.basename(filename)):
+            profiling.count('pieces swept', sweep(hmap, seg, diameter / 2.0))
+    if 'gouge' not in report:
+        report['gouge'] = find_gouges(hmap)
+
+    with profiling.stage('check'):
+        runs = []
+        for filename, kind, diameter, seg in programs:
+            if kind == 'iso':
+                runs.extend(cutting_runs(seg))
+        report['runs'] = len(runs)
+        report['gaps'] = find_gaps(hmap, runs)
+        report['holes'] = len(holes)
+        report['missing'] = find_missing_holes(hmap, holes)
+    return hmap, report
+
+#---------Print the report-------------------#
+def xy(x, y):
+    return "X" + str(round(x, 3)) + " Y" + str(round(y, 3))
+
+def print_report(hmap, report):
+    print("Stock " + str(round(hmap.nx * hmap.res, 1)) + " x " + str(round(hmap.ny * hmap.res, 1)) +
+          " mm at " + str(hmap.res) + " mm, " + str(hmap.nx * hmap.ny) + " cells")
+    gaps = report['gaps']
+    print(str(len(gaps)) + " uncut isolation gaps in " + str(report['runs']) + " cutting runs")
+    for x, y, length in gaps[:most_listed]:
+        print("  " + str(round(length, 3)) + " mm at " + xy(x, y))
+    gouge = report['gouge']
+    if gouge is None:
+        print("No cuts below final_depth " + str(cutline.final_depth))
+    else:
+        area, deepest, x, y = gouge
+        print("Cut below final_depth " + str(cutline.final_depth) + " over " + str(round(area, 3)) +
+              " mm^2, deepest Z" + str(round(deepest, 3)) + " at " + xy(x, y))
+    missing = report['missing']
+    if report['holes']:
+        print(str(len(missing)) + " of " + str(report['holes']) + " holes missing")
+        for x, y in missing[:most_listed].tolist():
+            print("  hole at " + xy(x, y))
+
+def problems(report):
+    return len(report['gaps']) + len(report['missing']) + (report['gouge'] is not None)
+
+##############################################
+#                 MAIN
+##############################################
+def main(argv=None):
+    global isolation_depth
+    parser = argparse.ArgumentParser(
+        description="Cut a job on a height map of the stock and report gaps, gouges "
+                    "and missing holes.")
+    parser.add_argument('--iso', action='append', default=[], metavar='FILE[:MM]',
+        help="isolation program (tool " + str(iso_tool) + " mm), may be repeated")
+    parser.add_argument('--outline', action='append', default=[], metavar='FILE[:MM]',
+        help="outline program from cutline.py (tool " + str(outline_tool) + " mm)")
+    parser.add_argument('--drill', action='append', default=[], metavar='FILE[:MM]',
+        help="drill program from drill_G_output.py, may be repeated")
+    parser.add_argument('--excellon', metavar='FILE',
+        help="the Excellon drill file whose holes must be cut")
+    parser.add_argument('--resolution', type=float, default=default_resolution, metavar='MM',
+        help="size of a cell of the height map (default " + str(default_resolution) + ")")
+    parser.add_argument('--isolation-depth', type=float, default=isolation_depth, metavar='Z',
+        help="depth an isolation cut must reach (default " + str(isolation_depth) + ")")
+    parser.add_argument('--save-map', metavar='FILE',
+        help="save the height map and its origin to FILE (.npz)")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    isolation_depth = args.isolation_depth
+
+    with profiling.session(args, 'mill_sim'):
+        try:
+            files = []
+            for kind in ('iso', 'outline', 'drill'):
+                for spec in getattr(args, kind):
+                    name, diameter = parse_spec(spec, kind)
+                    files.append((name, kind, diameter))
+            if not files:
+                parser.error("give at least one --iso, --outline or --drill program")
+            holes = None
+            if args.excellon is not None:
+                holes = excellon.read_excellon(args.excellon).coords_mm()
+            hmap, report = simulate(files, holes, args.resolution)
+        except IOError as e:
+            print("Error: unable to open file " + str(e.filename))
+            sys.exit(1)
+        except ValueError as e:
+            print("Error: " + str(e))
+            sys.exit(1)
+
+        print_report(hmap, report)
+        if args.save_map is not None:
+            np.savez_compressed(args.save_map, z=hmap.z, origin=np.array([hmap.x0, hmap.y0]),
+                                resolution=hmap.res)
+        if problems(report):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
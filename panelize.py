@@ -0,0 +1,380 @@
+#! /usr/bin/env python
+
+#
+# panelize.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   Lays several boards out on one sheet of stock so they are cut in
+#   a single fixture setup: one origin, one outline job and one drill
+#   program per bit for the whole sheet.
+#
+#   panelize.py --stock WxH [--copies N] [--margin MM] [--bounding-rect]
+#               [-o OUTDIR] <board> [<board> ...]
+#
+#   Each <board> is a directory holding one board's CAM exports, or
+#   its files separated by commas:
+#     the PCBmill outline file     (name matching batch.py's --outline
+#                                   patterns, e.g. board.outline.nc)
+#     PCBmill isolation files      (any other PCBmill file)
+#     an Excellon drill file       (optional)
+#   --copies places every board N times.
+#
+#   The boards are placed in rows from the bottom left corner of the
+#   stock, which must be at the work origin.  Neighbouring boards are
+#   placed so that their outline cut lines fall on top of each other
+#   and one cut separates them.  Boards are cut along the rectangle of
+#   their outline's cut path, with two tabs per side as cutline.py
+#   makes them.  A board whose outline is not a rectangle (rounded
+#   corners, notches) is refused, since cutting its bounding rectangle
+#   would change its shape; --bounding-rect cuts it along the bounding
+#   rectangle anyway, with a warning.
+#
+#   Written to OUTDIR (default panel):
+#     panel_outline.txt            every cut line of the sheet, once
+#     panel_iso_1.txt, ...         the isolation files of all boards,
+#                                  the first of each board in _1 etc.
+#     65_drill.txt, 58_drill.txt, 44_drill.txt
+#                                  the holes of all boards for each bit,
+#                                  ordered across the whole sheet
+#
+#   --profile, --cprofile and --log-level are described in profiling.py.
+
+import argparse
+import collections
+import logging
+import os
+import sys
+
+import numpy as np
+
+import G_final
+import batch
+import cutline
+import cycle_time
+import drill_G_output
+import profiling
+
+#--------------SETTINGS----------------------#
+stock_margin = 5.0      # mm from the stock edge to the nearest cut line
+outline_name = 'panel_outline.txt'
+iso_name = 'panel_iso_'
+rectangle_tolerance = 0.01  # mm^2 an outline may fall short of its bounding rectangle
+
+log = logging.getLogger(__name__)
+
+Board = collections.namedtuple('Board', 'name outline isolation drill corners')
+Placement = collections.namedtuple('Placement', 'board dx dy')
+
+#---------Load a board-----------------------#
+# files is the list of one board's CAM files
+# raises ValueError unless there is exactly one outline file, and if
+# the outline is not a rectangle unless bounding is set
+def load_board(name, files, outline_patterns=batch.default_outline_patterns, bounding=False):
+    outlines = []
+    isolation = []
+    drills = []
+    for f in sorted(files):
+        kind = batch.classify(f, outline_patterns)
+        if kind == 'outline':
+            outlines.append(f)
+        elif kind == 'pcbmill':
+            isolation.append(f)
+        elif kind == 'excellon':
+            drills.append(f)
+    if len(outlines) != 1:
+        raise ValueError("board " + name + " needs one outline file, found " + str(len(outlines)))
+    if len(drills) > 1:
+        raise ValueError("board " + name + " has more than one drill file")
+
+    fp = open(outlines[0], 'r')
+    try:
+        corners = cutline.find_corners(cutline.outline_points(fp))
+    finally:
+        fp.close()
+    if None in corners.values():
+        raise ValueError(str(outlines[0]) + " has no outline moves")
+    if not outline_is_rectangle(outlines[0]):
+        message = ("board " + name + ": the outline in " + str(outlines[0]) +
+                   " is not a rectangle; it is cut along its bounding rectangle")
+        if not bounding:
+            raise ValueError(message + " only with --bounding-rect")
+        log.warning(message)
+    return Board(name, outlines[0], isolation, drills[0] if drills else None, corners)
+
+#---------Is the outline a rectangle----------#
+# True if the polygon cut by the outline file fills its bounding
+# rectangle to within rectangle_tolerance
+def outline_is_rectangle(filename):
+    fp = open(filename, 'r')
+    try:
+        poly = cutline.outline_polygon(fp)
+    finally:
+        fp.close()
+    if len(poly) < 4:
+        return False
+    w, h = poly.max(axis=0) - poly.min(axis=0)
+    return w * h - abs(cutline.polygon_area(poly)) <= rectangle_tolerance
+
+#---------Board from the command line--------#
+# spec is a directory or a comma separated list of files
+def board_from_spec(spec, outline_patterns=batch.default_outline_patterns, bounding=False):
+    if os.path.isdir(spec):
+        files = batch.find_inputs([spec])
+        name = os.path.basename(os.path.normpath(spec))
+    else:
+        files = batch.find_inputs([f for f in spec.split(',') if f])
+        name = batch.board_name(files[0]) if files else spec
+    return load_board(name, files, outline_patterns, bounding)
+
+#---------Size of a board's cut rectangle----#
+def board_size(board):
+    c = board.corners
+    return c['x_max'] - c['x_min'], c['y_max'] - c['y_min']
+
+#---------Lay the boards out-----------------#
+# Boards go left to right in rows, tallest first, each row on top of
+# the one before.  Boards touch along their cut lines, so one cut
+# separates two neighbours.  raises ValueError if a board does not fit
+def layout(boards, stock_w, stock_h, margin=stock_margin):
+    order = sorted(range(len(boards)), key=lambda i: -board_size(boards[i])[1])
+    placements = []
+    x = margin
+    y = margin
+    row_h = 0.0
+    for i in order:
+        w, h = board_size(boards[i])
+        if x + w > stock_w - margin and x > margin:
+            # start the next row
+            x = margin
+            y += row_h
+            row_h = 0.0
+        if x + w > stock_w - margin or y + h > stock_h - margin:
+            raise ValueError("only " + str(len(placements)) + " of " + str(len(boards)) +
+                             " boards fit on " + str(stock_w) + " x " + str(stock_h) + " mm stock")
+        c = boards[i].corners
+        placements.append(Placement(boards[i], x - c['x_min'], y - c['y_min']))
+        x += w
+        row_h = max(row_h, h)
+    return placements
+
+#---------Tabs along one board edge----------#
+# return the tabs of an edge of the given length as (start, end)
+# distances from its low end: two per edge 10mm in from each corner,
+# as cutline.tab_line() leaves them, or one in the middle of a short edge
+def edge_tabs(length):
+    w = cutline.tab_width
+    if length >= 5 * w:
+        return [(w, 2 * w), (length - 2 * w, length - w)]
+    if length >= w + 2 * cutline.tab_corner_clearance:
+        return [((length - w) / 2.0, (length + w) / 2.0)]
+    return []
+
+#---------Merge intervals--------------------#
+# intervals is a list of (start, end); returns the sorted union
+def merge_intervals(intervals):
+    merged = []
+    for a, b in sorted(intervals):
+        if merged and a <= merged[-1][1] + 1e-6:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], b))
+        else:
+            merged.append((a, b))
+    return merged
+
+#---------Cut lines of the sheet-------------#
+# Every board edge is a cut line; edges on the same line that touch or
+# overlap, such as the shared edge of two neighbours, become one cut.
+# returns a list of (p0, p1, tabs) with tabs as distances from p0
+def cut_segments(placements):
+    lines = collections.defaultdict(list)
+    for p in placements:
+        c = p.board.corners
+        x0 = round(c['x_min'] + p.dx, 4)
+        x1 = round(c['x_max'] + p.dx, 4)
+        y0 = round(c['y_min'] + p.dy, 4)
+        y1 = round(c['y_max'] + p.dy, 4)
+        for y in (y0, y1):
+            lines[('H', y)].append((x0, x1, [(x0 + a, x0 + b) for a, b in edge_tabs(x1 - x0)]))
+        for x in (x0, x1):
+            lines[('V', x)].append((y0, y1, [(y0 + a, y0 + b) for a, b in edge_tabs(y1 - y0)]))
+
+    segments = []
+    for (axis, at), edges in sorted(lines.items()):
+        tabs = merge_intervals([t for edge in edges for t in edge[2]])
+        for a, b in merge_intervals([(e[0], e[1]) for e in edges]):
+            seg_tabs = [(t0 - a, t1 - a) for t0, t1 in tabs if t0 >= a - 1e-6 and t1 <= b + 1e-6]
+            if axis == 'H':
+                segments.append(((a, at), (b, at), seg_tabs))
+            else:
+                segments.append(((at, a), (at, b), seg_tabs))
+    return segments
+
+#---------Order the cut lines----------------#
+# nearest line end first, starting from the origin; every line is cut
+# in an odd number of passes, so the cutter finishes at its far end
+# returns a list of (start, end, tabs) with tabs measured from start
+def order_segments(segments):
+    left = list(segments)
+    ordered = []
+    at = (0.0, 0.0)
+    while left:
+        best = None
+        for n, (p0, p1, tabs) in enumerate(left):
+            for start, flip in ((p0, False), (p1, True)):
+                d = np.hypot(start[0] - at[0], start[1] - at[1])
+                if best is None or d < best[0]:
+                    best = (d, n, flip)
+        d, n, flip = best
+        p0, p1, tabs = left.pop(n)
+        if flip:
+            length = np.hypot(p1[0] - p0[0], p1[1] - p0[1])
+            p0, p1 = p1, p0
+            tabs = sorted((length - b, length - a) for a, b in tabs)
+        ordered.append((p0, p1, tabs))
+        at = p1
+    return ordered
+
+#---------Outline program of the sheet-------#
+# every cut line is cut to copper depth, back to FR4 depth leaving the
+# tabs and forward again to the final depth
+def panel_outline(placements):
+    for mv in cutline.header(): yield mv
+    first = True
+    for p0, p1, tabs in order_segments(cut_segments(placements)):
+        if not first:
+            for mv in cutline.lift(): yield mv
+        first = False
+        line = np.array([p0, p1], dtype=float)
+        s = cutline.edge_positions(line)
+        back = [(s[-1] - b, s[-1] - a) for a, b in reversed(tabs)]
+        yield "G00 " + cutline.xy_words(p0[0], p0[1])
+        yield "G00 Z" + str(cutline.z_fast_stop)
+        for mv in cutline.polygon_tab_pass(line, s, [], cutline.copper_depth): yield mv
+        for mv in cutline.polygon_tab_pass(line[::-1], s, back, cutline.fr4_depth): yield mv
+        for mv in cutline.polygon_tab_pass(line, s, tabs, cutline.final_depth): yield mv
+    for mv in cutline.footer(): yield mv
+
+#---------Isolation program of the sheet-----#
+# the k-th isolation file of every board that has one, shifted to its
+# place on the sheet, between one header and footer
+def panel_isolation(placements, k):
+    for mv in cutline.header(): yield mv
+    for p in placements:
+        if k >= len(p.board.isolation):
+            continue
+        fp = open(p.board.isolation[k], 'r')
+        try:
+            lines = fp.read().splitlines()
+        finally:
+            fp.close()
+        for line in lines[cutline.OUTLINE_START:-cutline.OUTLINE_END]:
+            if G_final.is_travel_retract(line):
+                yield "G00 Z" + str(cutline.z_travel_height)
+            else:
+                yield cutline.translate_line(line, p.dx, p.dy)
+    for mv in cutline.footer(): yield mv
+
+#---------Drill groups of the sheet----------#
+# returns one (N, 2) array of hole positions in mm per drill_G_output
+# bit group, holding the holes of every board
+def panel_drills(placements):
+    groups = [[] for name in drill_G_output.outfiles]
+    for p in placements:
+        if p.board.drill is None:
+            continue
+        drill = drill_G_output.read_drill_file(p.board.drill)
+        for tool in drill.tool_ids():
+            size = drill.diameter_in(tool) if tool in drill.tools else 0.0
+            groups[drill_G_output.bit_group(size)].append(drill.coords_mm(tool) + (p.dx, p.dy))
+    return [np.concatenate(g + [np.zeros((0, 2))]) for g in groups]
+
+#---------Write a program--------------------#
+def write_program(program, out_name):
+    out_fp = open(out_name, 'w', 1 << 16)
+    try:
+        cutline.emit(program, out_fp)
+    finally:
+        out_fp.close()
+    return out_name
+
+#---------Make the panel---------------------#
+# writes the panel programs into out_dir; returns the files written
+def make_panel(placements, out_dir='panel'):
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    written = [write_program(panel_outline(placements), os.path.join(out_dir, outline_name))]
+
+    n_iso = max(len(p.board.isolation) for p in placements)
+    for k in range(n_iso):
+        out_name = os.path.join(out_dir, iso_name + str(k + 1) + '.txt')
+        written.append(write_program(panel_isolation(placements, k), out_name))
+
+    if any(p.board.drill is not None for p in placements):
+        d = drill_G_output
+        for name, holes in zip(d.outfiles, panel_drills(placements)):
+            holes = d.order_drill_lines(name, holes, d.order_time_budget)
+            program = d.make_drill_G_output(holes, d.coord_sys, d.feed_rate, d.drill_speed,
+                                            d.travel_height, d.drill_depth)
+            written.append(write_program(program, os.path.join(out_dir, name)))
+    return written
+
+#---------Stock size from the command line---#
+def parse_stock(text):
+    try:
+        w, h = text.lower().split('x')
+        return float(w), float(h)
+    except ValueError:
+        raise argparse.ArgumentTypeError("stock size must be WxH in mm, e.g. 160x100")
+
+##############################################
+#                 MAIN
+##############################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Lay several boards out on one sheet of stock.")
+    parser.add_argument('boards', nargs='+', metavar='board',
+        help="a board's directory, or its files separated by commas")
+    parser.add_argument('--stock', type=parse_stock, required=True,
+        help="stock size WxH in mm, e.g. 160x100")
+    parser.add_argument('--copies', type=int, default=1,
+        help="place every board this many times (default 1)")
+    parser.add_argument('--margin', type=float, default=stock_margin,
+        help="mm from the stock edge to the nearest cut (default " + str(stock_margin) + ")")
+    parser.add_argument('--bounding-rect', action='store_true',
+        help="cut boards whose outline is not a rectangle along their bounding rectangle")
+    parser.add_argument('-o', '--out-dir', default='panel',
+        help="directory for the panel programs (default panel)")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with profiling.session(args, 'panelize'):
+        try:
+            with profiling.stage('load boards'):
+                boards = [board_from_spec(spec, bounding=args.bounding_rect)
+                          for spec in args.boards] * args.copies
+            with profiling.stage('lay out boards'):
+                placements = layout(boards, args.stock[0], args.stock[1], args.margin)
+                profiling.count('boards placed', len(placements))
+            with profiling.stage('write panel'):
+                written = make_panel(placements, args.out_dir)
+                for name in written:
+                    profiling.count_file('bytes written', name)
+        except IOError as e:
+            print("Error: unable to open file " + str(e.filename))
+            sys.exit(1)
+        except ValueError as e:
+            print("Error: " + str(e))
+            sys.exit(1)
+
+        for p in placements:
+            c = p.board.corners
+            print(p.board.name + " at X" + str(round(c['x_min'] + p.dx, 3)) +
+                  " Y" + str(round(c['y_min'] + p.dy, 3)))
+        estimates, total = cycle_time.estimate_job(written)
+        print(str(len(placements)) + " boards, estimated " + cycle_time.hms(total.total()) +
+              " (" + cycle_time.hms(total.total() / len(placements)) + " per board)")
+        for name in written:
+            print("Panel G-code stored in: " + name)
+
+if __name__ == '__main__':
+    main()
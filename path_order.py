@@ -0,0 +1,409 @@
+#! /usr/bin/env python
+
+#
+# path_order.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   PCBmill writes the isolation contours in the order its copper
+#   regions came out, which sends the mill back and forth across the
+#   board at travel height between them.
+#
+#   order_program() reorders the cutting runs of a program.  A run is
+#   the lines from a rapid to its start point down to the next retract
+#   to travel height:
+#       G00 X90.8063 Y12.0800
+#       G00 Z3
+#       G01 Z-0.6 F50
+#       G01 X90.7722 Y12.3388 F100.0
+#       ...
+#       G00 Z8.0
+#   A nearest-neighbour order is built on a spatial grid of the run
+#   end points (see hole_order.py) and refined with 2-opt until the
+#   time budget runs out.  A run may be cut backwards when its far end
+#   is closer: only runs that plunge, cut G01 moves at one depth and
+#   feed, and retract are reversed.  Closed contours are never
+#   reversed, as both ends are the same point.
+#
+#   Lines that are not part of a run (the header, spindle words, the
+#   end of the program) stay where they are, and runs are only moved
+#   between them.  Every run is cut exactly as before apart from its
+#   direction; only the rapids between runs change.  The whole
+#   program is held in memory.
+
+import collections
+import math
+import time
+
+import numpy as np
+
+import gcode_emit
+import gcode_lexer
+import hole_order
+
+#--------------SETTINGS----------------------#
+travel_height = 8.0         # mm, a rapid up to this height or higher ends a run
+default_time_budget = 5.0   # s spent refining the order with 2-opt
+neighbours = 8              # run ends tried as 2-opt moves for each run end
+
+_move_codes = np.frombuffer(b'GXYZIJF', dtype=np.uint8)
+
+# first and last are the line numbers of the rapid to the run's start
+# and of its retract, start and end the (x, y) it is cut from and to
+# cut is the first line of the G01 moves of a run that can be cut
+# backwards, -1 otherwise, feed their feed and has_feed whether they
+# write it
+Run = collections.namedtuple('Run', 'first last start end cut feed has_feed')
+
+#---------Runs of a program------------------#
+# data is the text of a program
+# lines are the lines of the program, ending in newlines, and blocks a
+# (first, last, run) for every block of lines that ends in a retract,
+# and for the lines after the last one; run is None when the block
+# must stay where it is.  The whole program is lexed at once with
+# gcode_lexer.scan().
+class Program(object):
+    def __init__(self, data):
+        pieces = data.split('\n')
+        rest = pieces.pop()
+        self.lines = [p + '\n' for p in pieces]
+        if rest:
+            self.lines.append(rest)
+        n = max(len(self.lines), 1)
+        words = gcode_lexer.scan(data, 0)
+        if len(words) == 0:
+            self.x = self.y = []
+            self.blocks = [(0, n - 1, None, (None, None))]
+            return
+        vals = words.values()
+
+        is_g = words.letter == ord('G')
+        g_val, g_has = words.per_line('G', n, vals, where=is_g & (vals <= 3))
+        mode = gcode_lexer.fill_modal(g_val.astype(np.int8), g_has, initial=-1)
+        dist_val, dist_has = words.per_line('G', n, vals, where=is_g & ((vals == 90) | (vals == 91)))
+        relative = gcode_lexer.fill_modal(dist_val == 91, dist_has, initial=False)
+        x_val, x_has = words.per_line('X', n, vals)
+        y_val, y_has = words.per_line('Y', n, vals)
+        z_val, z_has = words.per_line('Z', n, vals)
+        i_has = words.per_line('I', n, vals)[1]
+        j_has = words.per_line('J', n, vals)[1]
+        f_val, f_has = words.per_line('F', n, vals)
+        x = gcode_lexer.fill_modal(x_val, x_has)
+        y = gcode_lexer.fill_modal(y_val, y_has)
+        feed = gcode_lexer.fill_modal(f_val, f_has)
+
+        # lines with any other word, or a letter twice, cannot be moved
+        count = np.bincount(words.line, minlength=n)
+        other = ~np.isin(words.letter, _move_codes) | (is_g & (vals > 3))
+        bad = np.bincount(words.line[other], minlength=n) > 0
+        for code in _move_codes.tolist():
+            bad |= np.bincount(words.line[words.letter == code], minlength=n) > 1
+        bad |= relative | dist_has
+
+        retract = (count == 2) & g_has & (g_val == 0) & z_has & (z_val >= travel_height)
+        ends = np.flatnonzero(retract)
+        firsts = np.concatenate(([0], ends + 1))
+        lasts = np.concatenate((ends, [n - 1]))
+        if firsts[-1] > n - 1:
+            firsts = firsts[:-1]
+            lasts = lasts[:-1]
+        block_of = np.concatenate(([0], np.cumsum(retract)[:-1]))
+
+        def any_in(flag, lo, hi):
+            # for every block, is flag set on a line from lo to hi
+            cs = np.concatenate(([0], np.cumsum(flag)))
+            return cs[np.maximum(hi + 1, lo)] > cs[lo]
+
+        # a cut that takes its feed from before the run would change
+        # speed when the run is moved
+        cs_f = np.concatenate(([0], np.cumsum(f_has)))
+        feed_in_block = cs_f[1:] > cs_f[firsts[block_of]]
+        feedless = (mode != 0) & (count > g_has) & ~feed_in_block
+
+        movable = (retract[lasts] & (count[firsts] == 3) & g_has[firsts] & (g_val[firsts] == 0) &
+                   x_has[firsts] & y_has[firsts] &
+                   ~any_in(bad | feedless, firsts, lasts))
+
+        # a run can be reversed when it plunges with Z lines and then
+        # cuts G01 moves at one feed up to the retract
+        zline = z_has & ~(x_has | y_has | i_has | j_has)
+        after = np.where(~zline, np.arange(n), n)
+        after = np.minimum.accumulate(after[::-1])[::-1]
+        cut = np.minimum(after[np.minimum(firsts + 1, n - 1)], lasts)
+        cut_ok = (mode == 1) & ~z_has & ~i_has & ~j_has
+        changed = np.concatenate(([False], feed[1:] != feed[:-1]))
+        reversible = (movable & (cut < lasts) &
+                      ~any_in(~cut_ok, cut, lasts - 1) &
+                      ~any_in(changed, cut + 1, lasts - 1))
+        has_feed = any_in(f_has, cut, lasts - 1)
+        moves_x = any_in(x_has, firsts, lasts)
+        moves_y = any_in(y_has, firsts, lasts)
+
+        self.x = x.tolist()
+        self.y = y.tolist()
+        self.blocks = []
+        cut = np.where(reversible, cut, -1)
+        for first, last, can_move, c, fr, hf, mx, my in zip(
+                firsts.tolist(), lasts.tolist(), movable.tolist(), cut.tolist(),
+                feed[np.maximum(cut, 0)].tolist(), has_feed.tolist(),
+                moves_x.tolist(), moves_y.tolist()):
+            run = None
+            if can_move:
+                run = Run(first, last, (self.x[first], self.y[first]),
+                          (self.x[last], self.y[last]), c, fr, hf)
+            # where a fixed block leaves the tool, None for an axis it
+            # does not move
+            end = (self.x[last] if mx else None, self.y[last] if my else None)
+            self.blocks.append((first, last, run, end))
+
+    #---------a run cut backwards---------------#
+    def reversed_lines(self, run):
+        lines = self.lines
+        text = lines[run.first]
+        nl = text[len(text.rstrip('\r\n')):] or '\n'
+        num = gcode_emit.num
+        x, y = run.end
+        out = ['G00 X' + num(x) + ' Y' + num(y) + nl]
+        out.extend(lines[run.first + 1:run.cut])
+        xs = self.x
+        ys = self.y
+        points = [(xs[k], ys[k]) for k in range(run.last - 2, run.cut - 1, -1)]
+        points.append(run.start)
+        first = True
+        for x, y in points:
+            line = 'G01 X' + num(x) + ' Y' + num(y)
+            if first and run.has_feed:
+                line += ' F' + num(run.feed)
+            first = False
+            out.append(line + nl)
+        out.append(lines[run.last])
+        return out
+
+#---------Order statistics-------------------#
+def new_stats():
+    return {'runs': 0, 'reversed': 0, 'original': 0.0, 'optimized': 0.0}
+
+#---------Rapid length of an order-----------#
+# order is a list of (index, flipped), start the tool's (x, y) before it
+def travel(runs, order, start):
+    total = 0.0
+    last = start
+    for k, flipped in order:
+        run = runs[k]
+        a, b = (run.end, run.start) if flipped else (run.start, run.end)
+        total += math.hypot(a[0] - last[0], a[1] - last[1])
+        last = b
+    return total
+
+#---------Neighbours of run ends-------------#
+# the closest run ends to a run end, found in the grid cells around it
+# when first asked for, so 2-opt only pays for the ends it gets to
+class _Neighbours(object):
+    def __init__(self, points, k):
+        self.grid = hole_order.SpatialGrid(points)
+        self.k = k
+        self.found = {}
+
+    def __getitem__(self, i):
+        near = self.found.get(i)
+        if near is not None:
+            return near
+        if i >= len(self.grid.points):
+            return []
+        near = self.found[i] = self.grid.neighbours(i, self.k)
+        return near
+
+#---------2-opt refinement-------------------#
+# Run k has its start point at 2k and end point at 2k + 1; its entry is
+# the point it is cut from.  Reversing tour[p+1..q] and flipping every
+# run in it joins the exit of tour[p] to the exit of tour[q], and the
+# entry of tour[p+1] to the entry of tour[q+1].  Only runs that may be
+# flipped can be in a reversed stretch.  tour[0] is the start point and
+# never moves.
+class _Refiner(object):
+    def __init__(self, pts, tour, flip, flippable, neigh, deadline):
+        self.pts = pts
+        self.tour = tour
+        self.flip = flip
+        self.flippable = flippable
+        self.neigh = neigh
+        self.deadline = deadline
+        self.pos = [0] * len(flip)
+        for idx, k in enumerate(tour):
+            self.pos[k] = idx
+
+    def entry(self, k):
+        return 2 * k + self.flip[k]
+
+    def exit(self, k):
+        return 2 * k + 1 - self.flip[k]
+
+    def d(self, a, b):
+        pa = self.pts[a]
+        pb = self.pts[b]
+        return math.hypot(pa[0] - pb[0], pa[1] - pb[1])
+
+    def gain(self, p, q):
+        tour = self.tour
+        a = self.exit(tour[p])
+        b = self.entry(tour[p + 1])
+        c = self.exit(tour[q])
+        g = self.d(a, b) - self.d(a, c)
+        if q + 1 < len(tour):
+            # the open end of the path costs nothing
+            dn = self.entry(tour[q + 1])
+            g += self.d(c, dn) - self.d(b, dn)
+        return g
+
+    def reverse(self, p, q):
+        tour = self.tour
+        flippable = self.flippable
+        for idx in range(p + 1, q + 1):
+            if not flippable[tour[idx]]:
+                return False
+        tour[p + 1:q + 1] = tour[p + 1:q + 1][::-1]
+        for idx in range(p + 1, q + 1):
+            k = tour[idx]
+            self.flip[k] = 1 - self.flip[k]
+            self.pos[k] = idx
+        return True
+
+    def two_opt(self, k):
+        i = self.pos[k]
+        start = len(self.flip) - 1
+        for own, is_exit in ((self.exit(k), True), (self.entry(k), False)):
+            for c in self.neigh[own]:
+                other = c // 2
+                if other == k or other == start:
+                    continue
+                if (c == self.exit(other)) != is_exit:
+                    continue
+                j = self.pos[other]
+                if is_exit:
+                    p, q = min(i, j), max(i, j)
+                else:
+                    p, q = min(i, j) - 1, max(i, j) - 1
+                if self.gain(p, q) > 1e-9 and self.reverse(p, q):
+                    return True
+        return False
+
+    def run(self):
+        queue = list(self.tour[1:])
+        queued = set(queue)
+        while queue:
+            if time.time() > self.deadline:
+                break
+            k = queue.pop()
+            queued.discard(k)
+            if self.two_opt(k):
+                # look at k and the runs near it again
+                for c in [2 * k, 2 * k + 1] + self.neigh[2 * k] + self.neigh[2 * k + 1]:
+                    other = c // 2
+                    if other < len(self.flip) - 1 and other not in queued:
+                        queued.add(other)
+                        queue.append(other)
+        return self.tour
+
+#---------Order a stretch of runs------------#
+# runs is a list of Runs, start the (x, y) of the tool before them
+# returns a list of (index, flipped) in the order to cut them
+def order_runs(runs, start=(0.0, 0.0), time_budget=default_time_budget, reverse=True):
+    n = len(runs)
+    original = [(k, False) for k in range(n)]
+    if n < 2:
+        return original
+    pts = []
+    for run in runs:
+        pts.append(run.start)
+        pts.append(run.end)
+    closed = [run.start == run.end for run in runs]
+    flippable = [c or (reverse and run.cut >= 0) for c, run in zip(closed, runs)]
+
+    # nearest neighbour: both ends of a run that may be reversed are in
+    # the grid, and either one picks the run
+    grid = hole_order.SpatialGrid(pts)
+    in_grid = [True] * (2 * n)
+    for k in range(n):
+        if closed[k] or not flippable[k]:
+            grid.remove(2 * k + 1)
+            in_grid[2 * k + 1] = False
+    order = []
+    x, y = start
+    while True:
+        e = grid.nearest(x, y)
+        if e is None:
+            break
+        k = e // 2
+        for end in (2 * k, 2 * k + 1):
+            if in_grid[end]:
+                grid.remove(end)
+                in_grid[end] = False
+        flipped = e % 2 == 1
+        order.append((k, flipped))
+        x, y = pts[e ^ 1]
+
+    # 2-opt, with the start point added as run n
+    deadline = time.time() + time_budget
+    neigh = _Neighbours(list(pts), neighbours)
+    pts.append(start)
+    pts.append(start)
+    flip = [0] * (n + 1)
+    for k, flipped in order:
+        flip[k] = int(flipped)
+    tour = [n] + [k for k, flipped in order]
+    tour = _Refiner(pts, tour, flip, flippable + [False], neigh, deadline).run()
+    order = [(k, flip[k] == 1) for k in tour[1:]]
+
+    if travel(runs, order, start) > travel(runs, original, start):
+        # the file was already in a better order than we found
+        return original
+    return order
+
+#---------Reorder a program------------------#
+# lines is any iterable of G-code lines ending in newlines
+# yields the lines with the runs between fixed lines reordered
+# stats, a dict from new_stats(), holds the rapid travel between runs
+# before and after
+def order_program(lines, time_budget=default_time_budget, reverse=True, stats=None):
+    if stats is None:
+        stats = new_stats()
+    program = Program(''.join(lines))
+    blocks = program.blocks
+    deadline = time.time() + time_budget
+    pos = (0.0, 0.0)
+    b = 0
+    while b < len(blocks):
+        first, last, run, end = blocks[b]
+        if run is None:
+            for line in program.lines[first:last + 1]:
+                yield line
+            pos = (pos[0] if end[0] is None else end[0], pos[1] if end[1] is None else end[1])
+            b += 1
+            continue
+        e = b
+        while e < len(blocks) and blocks[e][2] is not None:
+            e += 1
+        runs = [block[2] for block in blocks[b:e]]
+        budget = max(deadline - time.time(), 0.0)
+        order = order_runs(runs, pos, budget, reverse)
+        stats['runs'] += len(runs)
+        stats['original'] += travel(runs, [(k, False) for k in range(len(runs))], pos)
+        stats['optimized'] += travel(runs, order, pos)
+        for k, flipped in order:
+            run = runs[k]
+            if flipped and run.start != run.end:
+                stats['reversed'] += 1
+                for line in program.reversed_lines(run):
+                    yield line
+            else:
+                for line in program.lines[run.first:run.last + 1]:
+                    yield line
+        k, flipped = order[-1]
+        pos = runs[k].start if flipped else runs[k].end
+        b = e
+
+#---------Print the travel report------------#
+def report(name, stats):
+    print(name + ": " + str(stats['runs']) + " runs, " + str(stats['reversed']) +
+          " reversed, rapid travel " + str(round(stats['original'], 1)) + " mm -> " +
+          str(round(stats['optimized'], 1)) + " mm")
@@ -0,0 +1,306 @@
+#! /usr/bin/env python
+
+#
+# pipeline.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   The SOP runs the scripts one after the other, each in its own
+#   Python launch, each reading what the one before it wrote.
+#   pipeline.py runs the steps for one board in one process as a
+#   graph of stages: a stage starts once the stages it needs have
+#   finished, and is handed their results in memory.
+#
+#   pipeline.py [-o OUTDIR] [-j JOBS] [-v] <file> [<file> ...]
+#
+#   The files are the Eagle drill file and the files PCBmill wrote
+#   (sorted as batch.py does, so outline files are found by name):
+#
+#     read_drill ---> drill_reduce          <drill>_mod for PCBmill
+#                |--> drill_split           the *_int files for PCBmill
+#                '--> drill_groups -+-> group:65 --> drill:65_drill.txt
+#                                   |-> group:58 --> drill:58_drill.txt
+#                                   '-> group:44 --> drill:44_drill.txt
+#     G_final:<layer>                       one per PCBmill layer
+#     cutline                               the tabbed outline cut
+#     cycle_time                            after all of the above
+#
+#   The Excellon file is read and parsed once.  Stages with no path
+#   between them (the drill bit groups, every signal layer, the
+#   outline) run at the same time.  The hole ordering of every bit
+#   group keeps the CPU busy, so those stages run in a pool of JOBS
+#   worker processes, since Python threads take turns on one CPU; each
+#   is handed only its own group, picked out by its group: stage, and
+#   the holes are pickled across.  The other stages mostly read and
+#   write files (G_final only streams a layer through when it neither
+#   fits arcs nor reorders) and run on a pool of JOBS threads.  PCBmill
+#   itself is not a Python program, so the PCBmill files are inputs.
+#
+#   A table of when each stage started and how long it took is
+#   printed at the end.  A stage that fails is reported, the stages
+#   that need it are skipped and the others still run.
+#
+#   --profile, --cprofile and --log-level are described in profiling.py;
+#   the profile has the time, memory and counts of the thread stages,
+#   the worker process stages are only in the timing table.  What the
+#   stages print and log is only shown with -v.
+
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import io
+import os
+import sys
+import time
+
+import G_final
+import batch
+import cutline
+import cycle_time
+import drill_G_output
+import drill_G_output_lite
+import drill_reduce
+import excellon
+import profiling
+
+Stage = collections.namedtuple('Stage', 'name func needs process')
+Timing = collections.namedtuple('Timing', 'name start seconds status message')
+
+#---------A graph of stages------------------#
+# func is called with the results of the stages in needs, in order,
+# and its return value is handed on to the stages that need it.  A
+# process stage runs in a worker process, so its func, the results it
+# needs and its own result must pickle: a module level function or a
+# functools.partial of one, not a lambda
+class Pipeline(object):
+    def __init__(self):
+        self.stages = collections.OrderedDict()
+
+    #---------add a stage-----------------------#
+    # the stages it needs must be added first, so there are no cycles
+    def add(self, name, func, needs=(), process=False):
+        if name in self.stages:
+            raise ValueError("stage " + name + " added twice")
+        for need in needs:
+            if need not in self.stages:
+                raise ValueError("stage " + name + " needs unknown stage " + need)
+        self.stages[name] = Stage(name, func, tuple(needs), process)
+
+    #---------run every stage-------------------#
+    # returns (results, timings): results maps the name of every stage
+    # that finished to its return value, timings is in start order
+    # quiet drops what the process stages print; the thread stages print
+    # to sys.stdout, which the caller may redirect
+    def run(self, max_workers=None, quiet=False):
+        results = {}
+        timings = []
+        failed = set()
+        waiting = list(self.stages.values())
+        running = {}
+        t0 = time.time()
+        with contextlib.ExitStack() as stack:
+            threads = stack.enter_context(
+                concurrent.futures.ThreadPoolExecutor(max_workers=max_workers))
+            processes = None
+            if any(stage.process for stage in waiting):
+                processes = stack.enter_context(
+                    concurrent.futures.ProcessPoolExecutor(max_workers=max_workers))
+            while waiting or running:
+                for stage in list(waiting):
+                    if any(n in failed for n in stage.needs):
+                        waiting.remove(stage)
+                        failed.add(stage.name)
+                        timings.append(Timing(stage.name, time.time() - t0, 0.0, 'skipped',
+                                              "needs a stage that failed"))
+                    elif all(n in results for n in stage.needs):
+                        waiting.remove(stage)
+                        args = [results[n] for n in stage.needs]
+                        if stage.process:
+                            future = processes.submit(timed, stage.name, stage.func, args, quiet)
+                        else:
+                            future = threads.submit(timed, stage.name, stage.func, args)
+                        running[future] = (stage, time.time() - t0)
+                if not running:
+                    break
+                done, pending = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    stage, start = running.pop(future)
+                    try:
+                        value, seconds, error = future.result()
+                    except Exception as e:
+                        # the worker process itself died, or the
+                        # stage's result would not pickle
+                        value = None
+                        seconds = time.time() - t0 - start
+                        error = type(e).__name__ + ": " + str(e)
+                    if error is None:
+                        results[stage.name] = value
+                        timings.append(Timing(stage.name, start, seconds, 'ok', ''))
+                    else:
+                        failed.add(stage.name)
+                        timings.append(Timing(stage.name, start, seconds, 'FAILED', error))
+        timings.sort(key=lambda t: t.start)
+        return results, timings
+
+#---------Run one stage----------------------#
+# returns (value, seconds, error message or None); quiet drops what the
+# stage prints
+def timed(name, func, args, quiet=False):
+    t0 = time.time()
+    try:
+        with contextlib.ExitStack() as stack:
+            if quiet:
+                stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+            stack.enter_context(profiling.stage(name))
+            value = func(*args)
+        return value, time.time() - t0, None
+    except Exception as e:
+        return None, time.time() - t0, type(e).__name__ + ": " + str(e)
+
+#---------Read an Excellon file--------------#
+# returns (text, drill), the parse shared by every drill stage
+def read_drill(filename):
+    fp = open(filename, 'r')
+    try:
+        text = fp.read()
+    finally:
+        fp.close()
+    if not excellon.is_excellon(text):
+        raise ValueError(str(filename) + " is not an Excellon drill file")
+    return text, excellon.parse_excellon(text)
+
+#---------The stages of one board------------#
+# drill, outline: file names or None; layers: PCBmill signal layers
+def board_pipeline(drill=None, layers=(), outline=None, out_dir='.'):
+    p = Pipeline()
+    outputs = []
+    if drill is not None:
+        p.add('read_drill', lambda: read_drill(drill))
+        mod_name = os.path.join(out_dir, os.path.basename(drill) + "_mod")
+        p.add('drill_reduce', lambda parsed: [drill_reduce.write_reduced(parsed[0], parsed[1], mod_name)],
+              ['read_drill'])
+        p.add('drill_split', lambda parsed: drill_G_output_lite.split_drill(parsed[1], out_dir),
+              ['read_drill'])
+        p.add('drill_groups', lambda parsed: drill_G_output.drill_groups(parsed[1]), ['read_drill'])
+        for i, name in enumerate(drill_G_output.outfiles):
+            group = 'group:' + name.split('_')[0]
+            p.add(group, functools.partial(pick_group, i), ['drill_groups'])
+            p.add('drill:' + name, functools.partial(write_group, i, out_dir), [group],
+                  process=True)
+            outputs.append('drill:' + name)
+    for layer in layers:
+        name = 'G_final:' + os.path.basename(layer)
+        p.add(name, functools.partial(write_layer, layer, out_dir))
+        outputs.append(name)
+    if outline is not None:
+        out_name = os.path.join(out_dir, os.path.basename(outline) + "_cutline.txt")
+        p.add('cutline', lambda: [cutline.make_cutline_file(outline, out_name)])
+        outputs.append('cutline')
+    if outputs:
+        p.add('cycle_time', job_estimate, outputs)
+    return p
+
+def pick_group(i, groups):
+    return groups[i]
+
+# the process stage: module level, so it pickles to the workers
+def write_group(i, out_dir, group):
+    return [drill_G_output.write_drill_group(i, group, out_dir)]
+
+def write_layer(layer, out_dir):
+    return [G_final.finalize(layer, out_dir)]
+
+#---------Estimate the whole job-------------#
+# every argument is the list of files a stage wrote
+def job_estimate(*written):
+    files = [f for files in written for f in files]
+    return cycle_time.estimate_job(files)
+
+#---------Sort the input files---------------#
+# returns (drill, layers, outline, skipped)
+def sort_inputs(files, outline_patterns):
+    drill = None
+    outline = None
+    layers = []
+    skipped = []
+    for f in files:
+        kind = batch.classify(f, outline_patterns)
+        if kind == 'excellon' and drill is None:
+            drill = f
+        elif kind == 'outline' and outline is None:
+            outline = f
+        elif kind == 'pcbmill':
+            layers.append(f)
+        else:
+            skipped.append(f)
+    return drill, layers, outline, skipped
+
+#---------Timing report----------------------#
+def print_timings(timings, elapsed):
+    rows = [('stage', 'start', 'secs', 'status')]
+    for t in timings:
+        rows.append((t.name, '%.2f' % t.start, '%.2f' % t.seconds, t.status))
+    widths = [max(len(row[i]) for row in rows) for i in range(4)]
+    for row, t in zip(rows, [None] + timings):
+        line = '  '.join(row[i].ljust(widths[i]) for i in range(4))
+        if t is not None and t.message:
+            line += '  ' + t.message
+        print(line)
+    busy = sum(t.seconds for t in timings)
+    print(str(len(timings)) + " stages, " + '%.2f' % busy + " s of work in " +
+          '%.2f' % elapsed + " s")
+
+##############################################
+#                 MAIN
+##############################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the drill, layer and outline steps for one board in one process.")
+    parser.add_argument('files', nargs='+',
+        help="the Excellon drill file and the PCBmill layer and outline files")
+    parser.add_argument('-o', '--out-dir', default='.',
+        help="directory for the outputs (default .)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help="most stages run at once in threads, and in worker processes "
+             "(default: one per CPU plus four threads, one process per CPU)")
+    parser.add_argument('--outline', action='append', default=None, metavar='PATTERN',
+        help="file name pattern of the outline file, may be repeated "
+             "(default: " + ' '.join(batch.default_outline_patterns) + ")")
+    parser.add_argument('-v', '--verbose', action='store_true',
+        help="show what the stages print and log")
+    profiling.add_arguments(parser)
+    parser.set_defaults(log_level='warning')
+    args = parser.parse_args(argv)
+    if args.verbose and args.log_level == 'warning':
+        args.log_level = 'info'
+
+    drill, layers, outline, skipped = sort_inputs(
+        args.files, args.outline or batch.default_outline_patterns)
+    for f in skipped:
+        print("skipped (not Excellon or PCBmill, or a second drill or outline file): " + f)
+    if drill is None and not layers and outline is None:
+        print("Error: no Excellon or PCBmill files found")
+        sys.exit(1)
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    p = board_pipeline(drill, layers, outline, args.out_dir)
+    with profiling.session(args, 'pipeline'):
+        t0 = time.time()
+        if args.verbose:
+            results, timings = p.run(args.jobs)
+        else:
+            with contextlib.redirect_stdout(io.StringIO()):
+                results, timings = p.run(args.jobs, quiet=True)
+        print_timings(timings, time.time() - t0)
+        if 'cycle_time' in results:
+            estimates, total = results['cycle_time']
+            print("Estimated mill time " + cycle_time.hms(total.total()) + " including " +
+                  str(total.changes) + " bit changes")
+        if any(t.status != 'ok' for t in timings):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
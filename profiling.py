@@ -0,0 +1,219 @@
+#! /usr/bin/env python
+
+#
+# profiling.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   Shared --profile, --cprofile and --log-level options for the
+#   scripts.  A script's main() wraps its work in
+#
+#       with profiling.session(args, 'cutline'):
+#
+#   and marks its steps with
+#
+#       with profiling.stage('read outline'):
+#           ...
+#       profiling.count('lines written', n)
+#
+#   With --profile FILE every stage's wall time, CPU time, peak memory
+#   and counts (lines read, holes parsed, moves emitted, bytes
+#   written) are written to FILE as JSON when the script ends, and
+#   --cprofile FILE dumps the cProfile statistics of the main thread
+#   for pstats or snakeviz.
+#
+#   A stage's peak memory includes the stages inside it, which get
+#   their own.  Stages of different threads share one process, so a
+#   stage that runs while a stage of another thread is running has no
+#   peak of its own: its peak_mb is null and only the peak of the
+#   whole process is known.  The peak_mb of the run is the largest
+#   seen over all of it, stages and the time between them.
+#
+#   When neither option is given stage() hands back one shared object
+#   that does nothing and count() returns at once.  Both are called
+#   once per step, never per line or hole, so the cost is nil.
+#
+#   --log-level sets what the scripts log: the per-tool and per-line
+#   messages are at debug, progress at info (the default).
+
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+#--------------SETTINGS----------------------#
+LOG_LEVELS = ['debug', 'info', 'warning', 'error']
+default_log_level = 'info'
+
+_profile = None             # the Profile being recorded, None when off
+_null_stage = contextlib.nullcontext()
+
+#---------Peak memory------------------------#
+# return the peak resident memory in MB since the last reset_peak()
+# VmHWM, as Linux keeps ru_maxrss across exec
+def peak_mb():
+    try:
+        fp = open('/proc/self/status', 'r')
+        try:
+            for line in fp:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+        finally:
+            fp.close()
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+# Linux resets VmHWM to the current size when 5 is written to
+# clear_refs; elsewhere the peak stays the peak of the process
+def reset_peak():
+    try:
+        fp = open('/proc/self/clear_refs', 'w')
+        try:
+            fp.write('5')
+        finally:
+            fp.close()
+    except IOError:
+        pass
+
+#---------A profile being recorded-----------#
+class Profile(object):
+    def __init__(self, program):
+        self.program = program
+        self.stages = []
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.open = []          # the records of the stages running, every thread
+        self.peak = 0.0         # MB, the peak of the run before the last reset_peak()
+        self.t0 = time.time()
+        self.cpu0 = time.process_time()
+
+    #---------time one step---------------------#
+    @contextlib.contextmanager
+    def stage(self, name):
+        record = {'name': name, 'start': time.time() - self.t0, 'counts': {}}
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        with self.lock:
+            others = [r for r in self.open if not any(r is mine for mine in stack)]
+            shared = bool(others)
+            for r in others:
+                r['shared'] = True
+            record['shared'] = shared
+            if not shared:
+                # the stages this one runs inside keep the peak they had
+                # so far, then the peak restarts from here
+                peak = peak_mb()
+                for r in stack:
+                    r['carried'] = max(r.get('carried', 0.0), peak)
+                self.peak = max(self.peak, peak)
+                reset_peak()
+            self.open.append(record)
+        stack.append(record)
+        t0 = time.time()
+        cpu0 = time.thread_time()
+        try:
+            yield record
+        finally:
+            record['wall'] = time.time() - t0
+            record['cpu'] = time.thread_time() - cpu0
+            peak = max(peak_mb(), record.pop('carried', 0.0))
+            stack.pop()
+            with self.lock:
+                self.peak = max(self.peak, peak)
+                self.open = [r for r in self.open if r is not record]
+                if record.pop('shared'):
+                    peak = None
+                record['peak_mb'] = peak
+                self.stages.append(record)
+
+    #---------add to a count--------------------#
+    # counts go to the innermost stage of this thread and the totals
+    def count(self, key, n):
+        stack = getattr(self.local, 'stack', None)
+        if stack:
+            counts = stack[-1]['counts']
+            counts[key] = counts.get(key, 0) + n
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + n
+
+    def results(self):
+        stages = sorted(self.stages, key=lambda s: s['start'])
+        return {'program': self.program, 'argv': sys.argv[1:],
+                'wall': time.time() - self.t0, 'cpu': time.process_time() - self.cpu0,
+                'peak_mb': max(self.peak, peak_mb()), 'counts': self.counts, 'stages': stages}
+
+#---------Time a step------------------------#
+def stage(name):
+    if _profile is None:
+        return _null_stage
+    return _profile.stage(name)
+
+#---------Count items------------------------#
+def count(key, n=1):
+    if _profile is None:
+        return
+    _profile.count(key, n)
+
+# count the size of a file, e.g. the bytes a stage wrote
+def count_file(key, filename):
+    if _profile is None:
+        return
+    _profile.count(key, os.path.getsize(filename))
+
+def enabled():
+    return _profile is not None
+
+#---------Command line options---------------#
+def add_arguments(parser):
+    parser.add_argument('--profile', default=None, metavar='JSON',
+        help="write the time, memory and item counts of every stage to JSON")
+    parser.add_argument('--cprofile', default=None, metavar='FILE',
+        help="write cProfile statistics of the run to FILE")
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default=default_log_level,
+        help="what to log; debug shows every tool and line (default " +
+             default_log_level + ")")
+
+#---------Logging----------------------------#
+def setup_logging(level=default_log_level):
+    logging.basicConfig(stream=sys.stdout, format='%(message)s',
+                        level=getattr(logging, level.upper()))
+
+#---------Profile a whole run----------------#
+# args are the parsed options from add_arguments(); the profile is
+# written when the block ends, also when the script exits early
+@contextlib.contextmanager
+def session(args, program):
+    global _profile
+    setup_logging(getattr(args, 'log_level', default_log_level))
+    profile_name = getattr(args, 'profile', None)
+    cprofile_name = getattr(args, 'cprofile', None)
+    if profile_name is None and cprofile_name is None:
+        yield None
+        return
+
+    _profile = Profile(program)
+    profiler = None
+    if cprofile_name is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield _profile
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(cprofile_name)
+        if profile_name is not None:
+            fp = open(profile_name, 'w')
+            try:
+                json.dump(_profile.results(), fp, indent=1)
+            finally:
+                fp.close()
+        _profile = None
@@ -0,0 +1,324 @@
+#! /usr/bin/env python
+
+#
+# retract_plan.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   drill_G_output.py lifts the bit to travel_height (8 mm) before
+#   every hole, and cutline.py and PCBmill lift to 8 mm between cuts,
+#   so on a flat board held down flat most of a job's Z travel goes up
+#   and straight back down again.
+#
+#   plan_retracts() looks at every hop: a rapid up in Z, rapids in X
+#   and Y, and a move back down.  The lift is lowered to the clearance
+#   plane when the rapids of the hop
+#     are no longer than long_move in all,
+#     stay inside the board area, the points the program cuts or
+#     drills grown by margin on every side,
+#     and do not pass over a clamp zone grown by clamp_margin.
+#   Every other hop keeps its full height.  A lift is never lowered
+#   below the height the hop comes back down to (the R-plane of the
+#   drill programs, z_fast_stop of cutline.py), so the plunges are
+#   cut as before.
+#
+#   The clearance plane, the limits and the clamp zones are read from a
+#   fixture file, one setting per line, # starts a comment:
+#       clearance 3.0
+#       long_move 40.0
+#       margin 2.0
+#       clamp_margin 2.0
+#       clamp -30.0 -10.0 -5.0 110.0
+#   clamp gives the corners X0 Y0 X1 Y1 of a clamp or fixture in the
+#   work coordinates of the jobs, in mm; a file may have any number of
+#   them.  Settings left out keep the defaults below.  See fixture.cfg.
+#
+#   retract_plan.py --fixture <file> <in> [<out>]
+#     lowers the lifts of a G-code file, writes <in>_planned, and
+#     prints the Z travel and time saved (see cycle_time.py)
+#
+#   --profile, --cprofile and --log-level are described in profiling.py.
+
+import argparse
+import collections
+import sys
+
+import cycle_time
+import gcode_emit
+import gcode_lexer
+import profiling
+
+#--------------SETTINGS----------------------#
+clearance_height = 3.0      # mm above the board for short hops
+long_move = 40.0            # mm, longer hops go at full height
+board_margin = 2.0          # mm a short hop may go outside the cut area
+clamp_margin = 2.0          # mm kept clear round every clamp zone
+surface = 0.0               # Z of the top of the board
+
+default_fixture_file = 'fixture.cfg'
+
+Fixture = collections.namedtuple('Fixture', 'clearance long_move margin clamp_margin clamps')
+default_fixture = Fixture(clearance_height, long_move, board_margin, clamp_margin, [])
+
+#---------Read a fixture file----------------#
+# returns a Fixture; raises IOError if the file cannot be read and
+# ValueError, naming the line, if a line cannot be understood
+def read_fixture(filename):
+    values = {'clearance': clearance_height, 'long_move': long_move,
+              'margin': board_margin, 'clamp_margin': clamp_margin}
+    clamps = []
+    fp = open(filename, 'r')
+    try:
+        for n, line in enumerate(fp, 1):
+            words = line.split('#', 1)[0].split()
+            if not words:
+                continue
+            key = words[0].lower()
+            try:
+                nums = [float(w) for w in words[1:]]
+            except ValueError:
+                nums = None
+            if key == 'clamp' and nums is not None and len(nums) == 4:
+                x0, y0, x1, y1 = nums
+                clamps.append((min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)))
+            elif key in values and nums is not None and len(nums) == 1:
+                values[key] = nums[0]
+            else:
+                raise ValueError(str(filename) + " line " + str(n) + ": cannot read '" +
+                                 line.strip() + "'")
+    finally:
+        fp.close()
+    return Fixture(values['clearance'], values['long_move'], values['margin'],
+                   values['clamp_margin'], clamps)
+
+#---------Segment over a rectangle-----------#
+# True if the segment from a to b passes over rect (x0, y0, x1, y1)
+def crosses(a, b, rect):
+    x0, y0, x1, y1 = rect
+    dx = b[0] - a[0]
+    dy = b[1] - a[1]
+    t0 = 0.0
+    t1 = 1.0
+    for p, q in ((-dx, a[0] - x0), (dx, x1 - a[0]), (-dy, a[1] - y0), (dy, y1 - a[1])):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = float(q) / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1:
+            return False
+    return True
+
+#---------Can a hop stay low-----------------#
+# pts are the (x, y) the hop starts from and rapids to, area the board
+# area (x0, y0, x1, y1)
+def short_hop(pts, area, fixture):
+    length = 0.0
+    for a, b in zip(pts[:-1], pts[1:]):
+        length += ((b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2) ** 0.5
+    if length > fixture.long_move:
+        return False
+    for x, y in pts:
+        if not (area[0] <= x <= area[2] and area[1] <= y <= area[3]):
+            return False
+    m = fixture.clamp_margin
+    for x0, y0, x1, y1 in fixture.clamps:
+        rect = (x0 - m, y0 - m, x1 + m, y1 + m)
+        for a, b in zip(pts[:-1], pts[1:]):
+            if crosses(a, b, rect):
+                return False
+    return True
+
+#---------Modal state of every line----------#
+# returns a list with (mode, x, y, z) after every line, None where it
+# is not known, and the board area; positions are not followed through
+# G91 or canned cycles
+def line_states(words):
+    states = []
+    mode = None
+    x = y = z = None
+    relative = False
+    cycle = False
+    lo_x = lo_y = float('inf')
+    hi_x = hi_y = float('-inf')
+    for ws in words:
+        for w in ws:
+            if w.letter == 'G':
+                g = int(w.value)
+                if g <= 3:
+                    mode = g
+                elif g == 91:
+                    relative = True
+                elif g == 90:
+                    relative = False
+                elif 81 <= g <= 89:
+                    cycle = True
+                elif g == 80:
+                    cycle = False
+            elif w.letter == 'X':
+                x = w.value
+            elif w.letter == 'Y':
+                y = w.value
+            elif w.letter == 'Z':
+                z = w.value
+        if relative:
+            x = y = z = None
+        if cycle:
+            # every X/Y of a canned cycle is a hole; Z is its bottom,
+            # not where the bit stops
+            z = None
+        cutting = (cycle or (mode is not None and mode >= 1 and z is not None and z <= surface))
+        if cutting and x is not None and y is not None:
+            lo_x = min(lo_x, x)
+            lo_y = min(lo_y, y)
+            hi_x = max(hi_x, x)
+            hi_y = max(hi_y, y)
+        states.append((None if cycle or relative else mode, x, y, z))
+    area = None
+    if lo_x <= hi_x:
+        area = (lo_x, lo_y, hi_x, hi_y)
+    return states, area
+
+#---------Kinds of line----------------------#
+# words are the words of a line, state its (mode, x, y, z) after it
+def z_move(words):
+    letters = set(w.letter for w in words)
+    return 'Z' in letters and letters <= set('GZF')
+
+def z_rapid(words, state):
+    return state[0] == 0 and z_move(words) and not any(w.letter == 'F' for w in words)
+
+def xy_rapid(words, state):
+    letters = set(w.letter for w in words)
+    return state[0] == 0 and bool(letters & set('XY')) and letters <= set('GXY')
+
+#---------Planning statistics----------------#
+def new_stats():
+    return {'lifts': 0, 'lowered': 0, 'before': None, 'after': None}
+
+#---------Plan the lifts of a program--------#
+# lines is any iterable of G-code lines, with or without line endings
+# returns the list of lines with the lifts of the short hops lowered;
+# stats, a dict from new_stats(), counts the lifts and holds the
+# cycle_time estimates of the program before and after
+def plan_retracts(lines, fixture=None, stats=None):
+    if fixture is None:
+        fixture = default_fixture
+    if stats is None:
+        stats = new_stats()
+    lines = list(lines)
+    words = [gcode_lexer.lex_line(line) for line in lines]
+    states, area = line_states(words)
+    out = list(lines)
+    n = len(lines)
+    if area is not None:
+        m = fixture.margin
+        area = (area[0] - m, area[1] - m, area[2] + m, area[3] + m)
+    k = 0
+    while k < n - 1:
+        k += 1
+        if not z_rapid(words[k], states[k]):
+            continue
+        # a lift is one or more rapids up in Z only
+        first = k
+        before = states[k - 1]
+        while (k + 1 < n and z_rapid(words[k + 1], states[k + 1]) and
+               states[k + 1][3] is not None and states[k + 1][3] >= states[k][3]):
+            k += 1
+        z = states[k][3]
+        if None in before[1:] or z is None or z <= before[3]:
+            continue
+        # then rapids in X and Y
+        pts = [(before[1], before[2])]
+        j = k + 1
+        while j < n and xy_rapid(words[j], states[j]):
+            pts.append((states[j][1], states[j][2]))
+            j += 1
+        if len(pts) < 2 or j >= n:
+            continue
+        # and back down in Z only
+        down = states[j]
+        if not z_move(words[j]) or down[0] is None or down[3] is None or down[3] >= z:
+            continue
+        hop = max(fixture.clearance, before[3])
+        if down[0] == 0:
+            hop = max(hop, down[3])
+        if hop >= z:
+            # no higher than it has to be already
+            continue
+        stats['lifts'] += 1
+        if area is None or not short_hop(pts, area, fixture):
+            continue
+        for m in range(first, k + 1):
+            text = lines[m]
+            out[m] = 'G00 Z' + gcode_emit.num(hop) + text[len(text.rstrip('\r\n')):]
+        stats['lowered'] += 1
+    stats['before'] = add_estimate(stats['before'], cycle_time.estimate_lines(lines))
+    stats['after'] = add_estimate(stats['after'], cycle_time.estimate_lines(out))
+    return out
+
+def add_estimate(total, e):
+    if total is None:
+        return e
+    return total + e
+
+#---------Print the planning report----------#
+def report(name, stats):
+    before = stats['before'] or cycle_time.Estimate()
+    after = stats['after'] or cycle_time.Estimate()
+    print(name + ": " + str(stats['lowered']) + " of " + str(stats['lifts']) +
+          " lifts lowered, Z travel " + str(round(before.z_mm, 1)) + " mm -> " +
+          str(round(after.z_mm, 1)) + " mm, saves " +
+          cycle_time.hms(before.total() - after.total()))
+
+##############################################
+#                 MAIN
+##############################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Lower the lifts of short hops in a G-code file to the clearance plane.")
+    parser.add_argument('filename', help="the G-code file to plan")
+    parser.add_argument('out_name', nargs='?',
+        help="the file to write (default <filename>_planned)")
+    parser.add_argument('--fixture', default=default_fixture_file, metavar='FILE',
+        help="clearance plane and clamp zones (default " + default_fixture_file + ")")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    out_name = args.out_name or args.filename + "_planned"
+    try:
+        fixture = read_fixture(args.fixture)
+    except IOError:
+        print("Error: unable to open fixture file " + str(args.fixture))
+        sys.exit(1)
+    except ValueError as e:
+        print("Error: " + str(e))
+        sys.exit(1)
+    with profiling.session(args, 'retract_plan'):
+        try:
+            fp = open(args.filename, 'r')
+        except IOError:
+            print("Error: unable to open file " + str(args.filename))
+            sys.exit(1)
+        try:
+            with profiling.stage('plan lifts'):
+                stats = new_stats()
+                planned = plan_retracts(fp, fixture, stats)
+                profiling.count('lines planned', len(planned))
+        finally:
+            fp.close()
+        with profiling.stage('write G-code'):
+            out_fp = open(out_name, 'w', 1 << 20)
+            try:
+                out_fp.writelines(planned)
+            finally:
+                out_fp.close()
+            profiling.count_file('bytes written', out_name)
+        report(out_name, stats)
+
+if __name__ == '__main__':
+    main()
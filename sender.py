@@ -0,0 +1,436 @@
+#! /usr/bin/env python
+
+#
+# sender.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   Drip-feeds G-code to the mill over a serial port, so cutting
+#   starts with the first block instead of after the whole job has
+#   been written and copied across.
+#
+#   sender.py --port DEV [--baud N] [--flow {xonxoff,rtscts}] <file>
+#   sender.py --port DEV --cutline <outline file> [--rectangle]
+#   sender.py --port DEV --drill <drill file> --bit {65,58,44}
+#   sender.py --simulate [--sim-rate N] ...
+#
+#   <file> is any G-code file, or a binary toolpath (.tp, see
+#   toolpath.py).  With --cutline and --drill the program is sent as
+#   cutline.py and drill_G_output.py make it, block by block, while
+#   the later passes are still being planned; nothing is written to
+#   disk.  Every program goes out without the words that repeat the
+#   modal state (see gcode_emit.py), so fewer bytes wait on the baud
+#   rate.
+#
+#   The mill's controller holds the blocks it has not run yet in a
+#   small buffer, and says when it is full:
+#     xonxoff   the controller sends XOFF (0x13) when its buffer is
+#               nearly full and XON (0x11) when it has room again.
+#               sender.py reads these itself before every block and
+#               writes no faster than the baud rate, so no more than
+#               max_queued bytes and one block follow an XOFF.
+#     rtscts    the controller drops CTS when its buffer is full and
+#               the serial driver holds the writes until it rises.
+#   Either way, blocks go out only as fast as the mill runs them.
+#
+#   While sending, the number of blocks sent, the blocks/sec over the
+#   last second and the time the controller held the sender off are
+#   shown on stderr.  Ctrl-C stops sending; the mill runs out the
+#   blocks already in its buffer.
+#
+#   --simulate sends to a simulated controller on a pseudo terminal
+#   instead of a serial port.  It runs --sim-rate blocks per second
+#   from a --sim-buffer byte buffer with the chosen flow control,
+#   then checks that every block arrived, in order, and that the
+#   buffer never overflowed; it exits with status 1 if not.  For a
+#   quick run raise both rates, e.g. --baud 115200 --sim-rate 2000.
+#
+#   --profile, --cprofile and --log-level are described in profiling.py;
+#   --log-level debug logs every block sent.
+#
+#   Needs pyserial (pip install pyserial).
+
+import argparse
+import collections
+import logging
+import os
+import select
+import sys
+import threading
+import time
+import tty
+
+import cutline
+import drill_G_output
+import gcode_emit
+import profiling
+import toolpath
+
+#--------------SETTINGS----------------------#
+default_baud = 9600
+flow_control = 'rtscts'     # the MDX-40A's default handshake
+line_end = '\r\n'
+poll_interval = 0.05        # s, longest wait for XON between checks
+max_queued = 64             # bytes written but not yet on the wire
+report_interval = 0.5       # s between updates of the progress line
+
+# simulated controller
+sim_rate = 25.0             # blocks/s, a little under 9600 baud
+sim_buffer = 1024           # bytes
+sim_headroom = 256          # bytes still free when XOFF is sent
+
+XON = b'\x11'
+XOFF = b'\x13'
+
+log = logging.getLogger(__name__)
+
+Totals = collections.namedtuple('Totals', 'blocks bytes seconds held xoffs')
+
+#---------Open the serial port---------------#
+# pyserial is only needed by this script, so it is imported here
+def open_port(device, baud=default_baud, flow=flow_control):
+    try:
+        import serial
+    except ImportError:
+        raise IOError("sender.py needs pyserial: pip install pyserial")
+    # XON/XOFF is handled in send(), not by the driver, so the sender
+    # knows when it is held off
+    return serial.Serial(device, baud, timeout=poll_interval, write_timeout=None,
+                         xonxoff=False, rtscts=(flow == 'rtscts'))
+
+#---------Progress line----------------------#
+class Meter(object):
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+        self.t0 = time.time()
+        self.last = self.t0
+        self.last_blocks = 0
+        self.rate = 0.0
+        self.shown = False
+
+    def update(self, blocks, held, force=False):
+        now = time.time()
+        if now - self.last < report_interval and not force:
+            return
+        if now > self.last:
+            # blocks/sec since the last update, smoothed over about 1 s
+            recent = (blocks - self.last_blocks) / (now - self.last)
+            k = min((now - self.last) / 1.0, 1.0)
+            self.rate += k * (recent - self.rate)
+        self.last = now
+        self.last_blocks = blocks
+        self.stream.write('\r' + str(blocks).rjust(8) + " blocks  " +
+                          ('%.1f' % self.rate).rjust(7) + " blocks/s  held " +
+                          ('%.1f' % held).rjust(6) + " s ")
+        self.stream.flush()
+        self.shown = True
+
+    def close(self):
+        if self.shown:
+            self.stream.write('\n')
+            self.stream.flush()
+
+#---------Stream blocks to the mill----------#
+class Sender(object):
+    def __init__(self, port, flow=flow_control, meter=None):
+        self.port = port
+        self.flow = flow
+        self.meter = meter
+        self.paused = False
+        self.blocks = 0
+        self.bytes = 0
+        self.held = 0.0
+        self.xoffs = 0
+        self.byte_time = 10.0 / port.baudrate
+        self.wire_free = time.time()
+
+    #---------read XON/XOFF from the controller-#
+    def handle(self, data):
+        for b in data:
+            if b == XOFF[0]:
+                if not self.paused:
+                    self.xoffs += 1
+                self.paused = True
+            elif b == XON[0]:
+                self.paused = False
+        other = data.replace(XON, b'').replace(XOFF, b'')
+        if other:
+            log.debug("controller: " + repr(other))
+
+    #---------keep pace with the wire-----------#
+    # the driver queues whatever is written, and an XOFF does not stop
+    # what is in the queue, so hold off until it is nearly empty
+    def pace(self, size):
+        now = time.time()
+        wait = self.wire_free - max_queued * self.byte_time - now
+        if wait > 0:
+            time.sleep(wait)
+            now += wait
+        self.wire_free = max(self.wire_free, now) + size * self.byte_time
+
+    #---------wait until the controller has room#
+    def wait_for_room(self):
+        if self.flow != 'xonxoff':
+            return
+        waiting = self.port.in_waiting
+        if waiting:
+            self.handle(self.port.read(waiting))
+        if not self.paused:
+            return
+        t0 = time.time()
+        while self.paused:
+            self.handle(self.port.read(1))
+            if self.meter is not None:
+                self.meter.update(self.blocks, self.held + time.time() - t0)
+        self.held += time.time() - t0
+
+    #---------send every block-------------------#
+    # lines is any iterable of G-code lines; it is only read as fast as
+    # the mill takes the blocks.  Returns a Totals.
+    def send(self, lines):
+        t0 = time.time()
+        for line in lines:
+            block = (line.rstrip('\r\n') + line_end).encode('ascii')
+            if self.flow == 'xonxoff':
+                self.pace(len(block))
+            self.wait_for_room()
+            t_write = time.time()
+            self.port.write(block)
+            if self.flow == 'rtscts':
+                # a write held by CTS is time the controller held us off
+                self.held += max(time.time() - t_write - len(block) * self.byte_time, 0.0)
+            self.blocks += 1
+            self.bytes += len(block)
+            log.debug(line.rstrip('\r\n'))
+            if self.meter is not None:
+                self.meter.update(self.blocks, self.held)
+        self.port.flush()
+        if self.meter is not None:
+            self.meter.update(self.blocks, self.held, force=True)
+        return Totals(self.blocks, self.bytes, time.time() - t0, self.held, self.xoffs)
+
+#---------Simulated controller---------------#
+# a pseudo terminal whose far end takes blocks like the mill does: it
+# runs rate blocks per second out of a buffer of buffer_size bytes
+# and stops the sender with XOFF or, for rtscts, by not reading, which
+# holds the writes like a low CTS line
+class SimulatedController(object):
+    def __init__(self, rate=sim_rate, buffer_size=sim_buffer, flow=flow_control):
+        self.rate = rate
+        self.buffer_size = buffer_size
+        self.flow = flow
+        self.high = buffer_size - sim_headroom
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.name = os.ttyname(self.slave)
+        self.pending = bytearray()
+        self.received = []
+        self.overflow = 0
+        self.most = 0
+        self.xoff_sent = False
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    #---------take in what the sender wrote------#
+    def receive(self, timeout):
+        room = self.buffer_size - len(self.pending)
+        if self.flow == 'rtscts' and room <= 0:
+            time.sleep(timeout)
+            return False
+        readable = select.select([self.master], [], [], timeout)[0]
+        if not readable:
+            return False
+        try:
+            data = os.read(self.master, room if self.flow == 'rtscts' else 4096)
+        except OSError:
+            return False
+        self.pending += data
+        if len(self.pending) > self.buffer_size:
+            self.overflow += len(self.pending) - self.buffer_size
+        self.most = max(self.most, len(self.pending))
+        return len(data) > 0
+
+    #---------run the blocks that are due--------#
+    def execute(self, now, next_time):
+        while now >= next_time:
+            end = self.pending.find(b'\n')
+            if end < 0:
+                return now
+            self.received.append(self.pending[:end + 1].decode('ascii').rstrip('\r\n'))
+            del self.pending[:end + 1]
+            next_time += 1.0 / self.rate
+        return next_time
+
+    def run(self):
+        next_time = time.time()
+        while True:
+            busy = self.receive(min(0.5 / self.rate, 0.01))
+            now = time.time()
+            if next_time < now - 1.0 / self.rate:
+                next_time = now
+            before = len(self.received)
+            next_time = self.execute(now, next_time)
+            if self.stopping and not (busy or len(self.received) > before or self.pending):
+                return
+            if self.flow == 'xonxoff':
+                if not self.xoff_sent and len(self.pending) >= self.high:
+                    os.write(self.master, XOFF)
+                    self.xoff_sent = True
+                elif self.xoff_sent and len(self.pending) <= self.buffer_size // 2:
+                    os.write(self.master, XON)
+                    self.xoff_sent = False
+
+    #---------wait for the last block to run-----#
+    def finish(self):
+        self.stopping = True
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+#---------Sources of blocks------------------#
+# each yields the lines of a program, reading its input as it goes;
+# cutline, drill_G_output and toolpath write compact G-code themselves
+def file_lines(filename):
+    if toolpath.is_toolpath(filename):
+        for line in toolpath.to_gcode(toolpath.load(filename)):
+            yield line
+        return
+    fp = open(filename, 'r')
+    try:
+        for line in gcode_emit.compact(fp):
+            yield line.rstrip('\r\n')
+    finally:
+        fp.close()
+
+def cutline_lines(filename, rectangle=False):
+    fp = open(filename, 'r')
+    try:
+        for line in cutline.cutline(fp, rectangle=rectangle):
+            yield line
+    finally:
+        fp.close()
+
+def drill_lines(filename, bit):
+    i = drill_G_output.outfiles.index(bit + '_drill.txt')
+    groups = drill_G_output.drill_groups(drill_G_output.read_drill_file(filename))
+    for line in drill_G_output.drill_group_lines(i, groups[i]):
+        yield line
+
+# keeps a copy of every line in sent, to check what the simulator got
+def recorded(lines, sent):
+    for line in lines:
+        sent.append(line.rstrip('\r\n'))
+        yield line
+
+#---------Print the totals-------------------#
+def report(totals):
+    rate = totals.blocks / max(totals.seconds, 1e-9)
+    print("Sent " + str(totals.blocks) + " blocks (" + str(totals.bytes) + " bytes) in " +
+          '%.1f' % totals.seconds + " s, " + '%.1f' % rate + " blocks/s, held off " +
+          '%.1f' % totals.held + " s" +
+          (" by " + str(totals.xoffs) + " XOFF" if totals.xoffs else ""))
+
+##############################################
+#                 MAIN
+##############################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Stream G-code to the mill with flow control.")
+    parser.add_argument('filename', nargs='?',
+        help="a G-code or .tp file to send")
+    parser.add_argument('--cutline', metavar='FILE',
+        help="send the tabbed outline cut of a PCBmill outline file")
+    parser.add_argument('--rectangle', action='store_true',
+        help="with --cutline, cut the bounding rectangle of the outline")
+    parser.add_argument('--drill', metavar='FILE',
+        help="send the drill program of one bit for an Excellon file")
+    parser.add_argument('--bit', choices=['65', '58', '44'],
+        help="with --drill, the bit to send")
+    parser.add_argument('--port', help="serial device of the mill, e.g. /dev/ttyUSB0")
+    parser.add_argument('--baud', type=int, default=default_baud,
+        help="baud rate (default " + str(default_baud) + ")")
+    parser.add_argument('--flow', choices=['xonxoff', 'rtscts'], default=flow_control,
+        help="flow control the controller uses (default " + flow_control + ")")
+    parser.add_argument('--simulate', action='store_true',
+        help="send to a simulated controller on a pseudo terminal and check the result")
+    parser.add_argument('--sim-rate', type=float, default=sim_rate,
+        help="blocks/s the simulated controller runs (default " + str(sim_rate) + ")")
+    parser.add_argument('--sim-buffer', type=int, default=sim_buffer, metavar='BYTES',
+        help="buffer of the simulated controller (default " + str(sim_buffer) + ")")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    sources = [s for s in (args.filename, args.cutline, args.drill) if s is not None]
+    if len(sources) != 1:
+        parser.error("give one of a file, --cutline or --drill")
+    if args.drill is not None and args.bit is None:
+        parser.error("--drill needs --bit")
+    if args.port is None and not args.simulate:
+        parser.error("give --port, or --simulate")
+    if args.sim_buffer < 2 * sim_headroom:
+        parser.error("--sim-buffer must be at least " + str(2 * sim_headroom) + " bytes")
+
+    if args.cutline is not None:
+        lines = cutline_lines(args.cutline, args.rectangle)
+    elif args.drill is not None:
+        lines = drill_lines(args.drill, args.bit)
+    else:
+        lines = file_lines(args.filename)
+
+    with profiling.session(args, 'sender'):
+        sim = None
+        sent = []
+        device = args.port
+        if args.simulate:
+            sim = SimulatedController(args.sim_rate, args.sim_buffer, args.flow).start()
+            device = sim.name
+            lines = recorded(lines, sent)
+        meter = Meter()
+        try:
+            port = open_port(device, args.baud, args.flow)
+        except IOError as e:
+            print("Error: unable to open " + str(device) + ": " + str(e))
+            sys.exit(1)
+        sender = Sender(port, args.flow, meter)
+        try:
+            with profiling.stage('send'):
+                totals = sender.send(lines)
+                profiling.count('blocks sent', totals.blocks)
+                profiling.count('bytes sent', totals.bytes)
+        except IOError as e:
+            meter.close()
+            print("Error: " + str(e))
+            sys.exit(1)
+        except ValueError as e:
+            meter.close()
+            print("Error: " + str(e))
+            sys.exit(1)
+        except KeyboardInterrupt:
+            meter.close()
+            print("Stopped after " + str(sender.blocks) + " blocks")
+            sys.exit(1)
+        finally:
+            port.close()
+        meter.close()
+        report(totals)
+
+        if sim is not None:
+            sim.finish()
+            print("Simulated controller ran " + str(len(sim.received)) + " blocks, buffer " +
+                  "at most " + str(sim.most) + " of " + str(sim.buffer_size) + " bytes")
+            if sim.received != sent or sim.overflow:
+                if sim.overflow:
+                    print("Error: the controller's buffer overflowed by " + str(sim.overflow) +
+                          " bytes")
+                if sim.received != sent:
+                    print("Error: the controller did not get the blocks that were sent")
+                sys.exit(1)
+
+if __name__ == '__main__':
+    main()
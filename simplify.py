@@ -0,0 +1,126 @@
+#! /usr/bin/env python
+
+#
+# simplify.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   PCBmill isolation paths around ground pours are long chains of
+#   G01 moves, many of them zero length or in line with the move
+#   before.  simplify_moves() streams G-code lines and, for every run
+#   of G01 cutting moves:
+#     drops moves that go nowhere,
+#     merges moves that continue in the same direction,
+#     and removes the points Douglas-Peucker finds are within the
+#     chord tolerance of the simplified path.
+#   Rapids, Z moves and every other line pass through untouched, and
+#   the kept moves are written exactly as PCBmill wrote them.
+
+import numpy as np
+
+import gcode_lexer
+
+#--------------SETTINGS----------------------#
+default_tolerance = 0.005   # mm
+max_run_points = 4096       # points held before a run is simplified
+
+#---------Drop and merge moves---------------#
+# pts is an (N, 2) array of a run's points, pts[0] its start
+# return the indexes of the points kept after dropping zero length
+# moves and merging moves that carry on in the same direction
+def merge_collinear(pts):
+    d = np.diff(pts, axis=0)
+    moving = np.hypot(d[:, 0], d[:, 1]) > 1e-9
+    keep = np.concatenate(([0], np.flatnonzero(moving) + 1))
+    if len(keep) < 3:
+        return keep
+    d = np.diff(pts[keep], axis=0)
+    cross = d[:-1, 0] * d[1:, 1] - d[:-1, 1] * d[1:, 0]
+    dot = (d[:-1] * d[1:]).sum(axis=1)
+    # a point between two moves in the same direction is not needed
+    straight = (np.abs(cross) <= 1e-9 * np.hypot(d[:-1, 0], d[:-1, 1]) *
+                np.hypot(d[1:, 0], d[1:, 1])) & (dot > 0)
+    return keep[np.concatenate(([True], ~straight, [True]))]
+
+#---------Distance from a chord---------------#
+# p is an (N, 2) array of points relative to the chord's start, v the
+# chord; returns the distance of every point from the chord
+def chord_distance(p, v):
+    length2 = v[..., 0] * v[..., 0] + v[..., 1] * v[..., 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.clip((p[..., 0] * v[..., 0] + p[..., 1] * v[..., 1]) / length2, 0.0, 1.0)
+    t = np.where(length2 > 1e-24, t, 0.0)
+    return np.hypot(p[..., 0] - t * v[..., 0], p[..., 1] - t * v[..., 1])
+
+#---------Douglas-Peucker---------------------#
+# return the sorted indexes of the points of pts to keep so that no
+# point dropped is further than tol from the path through the kept ones
+# Points further than tol from the chord between their neighbours are
+# kept up front and the runs between them are simplified separately,
+# so paths with no slack cost one array pass instead of one per point.
+def douglas_peucker(pts, tol):
+    n = len(pts)
+    keep = np.ones(n, dtype=bool)
+    if n > 2:
+        keep[1:-1] = chord_distance(pts[1:-1] - pts[:-2], pts[2:] - pts[:-2]) > tol
+    fixed = np.flatnonzero(keep)
+    stack = [(a, b) for a, b in zip(fixed[:-1].tolist(), fixed[1:].tolist()) if b - a > 1]
+    while stack:
+        a, b = stack.pop()
+        dist = chord_distance(pts[a + 1:b] - pts[a], pts[b] - pts[a])
+        k = int(np.argmax(dist))
+        if dist[k] > tol:
+            k += a + 1
+            keep[k] = True
+            if k - a > 1:
+                stack.append((a, k))
+            if b - k > 1:
+                stack.append((k, b))
+    return np.flatnonzero(keep)
+
+#---------Simplify a run of moves------------#
+# pts, lines and feed are a run from gcode_lexer.cutting_runs()
+# yields the kept lines
+def simplify_run(pts, lines, feed, tol, stats):
+    pts = np.array(pts, dtype=np.float64)
+    merged = merge_collinear(pts)
+    stats['merged'] += len(pts) - len(merged)
+    kept = merged[douglas_peucker(pts[merged], tol)]
+    first = True
+    for i in kept[1:].tolist():
+        line = lines[i - 1]
+        if first and feed is not None and 'F' not in line:
+            # the run's first move set the feed and was dropped
+            line = line.rstrip('\n') + " F" + feed + "\n"
+        first = False
+        yield line
+
+#---------Simplification statistics----------#
+def new_stats():
+    return {'lines_in': 0, 'lines_out': 0, 'merged': 0}
+
+#---------Simplify a stream of lines---------#
+# lines is any iterable of G-code lines ending in newlines
+# yields the lines with every run of G01 moves simplified to tol mm
+# stats, a dict from new_stats(), is filled in as the lines go by
+def simplify_moves(lines, tol=default_tolerance, stats=None):
+    if stats is None:
+        stats = new_stats()
+    for pts, run, feed in gcode_lexer.cutting_runs(lines, max_run_points):
+        if pts is None:
+            stats['lines_in'] += 1
+            stats['lines_out'] += 1
+            yield run
+            continue
+        stats['lines_in'] += len(run)
+        for out in simplify_run(pts, run, feed, tol, stats):
+            stats['lines_out'] += 1
+            yield out
+
+#---------Print the simplification report----#
+def report(name, stats):
+    saved = stats['lines_in'] - stats['lines_out']
+    pct = 100.0 * saved / max(stats['lines_in'], 1)
+    print(name + ": " + str(stats['lines_in']) + " lines -> " + str(stats['lines_out']) +
+          " lines (" + str(round(pct, 1)) + "% fewer), " + str(stats['merged']) +
+          " zero length or in-line moves merged")
@@ -0,0 +1,11 @@
+#
+# conftest.py
+# github: https://github.com/NPS-DAZL
+#
+# The scripts are flat modules at the top of the repository; put it on
+# the path so the tests import them as the scripts import each other.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
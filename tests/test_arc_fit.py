@@ -0,0 +1,114 @@
+#
+# test_arc_fit.py
+# github: https://github.com/NPS-DAZL
+#
+# Every point an arc replaces lies within the tolerance of the arc.
+
+import math
+
+import numpy as np
+import pytest
+
+import arc_fit
+import gcode_lexer
+
+def flattened(cx, cy, r, start, sweep, steps, noise=0.0, seed=0):
+    rng = np.random.RandomState(seed)
+    pts = []
+    for k in range(steps + 1):
+        a = start + sweep * k / steps
+        d = r + rng.uniform(-noise, noise)
+        pts.append((round(cx + d * math.cos(a), 4), round(cy + d * math.sin(a), 4)))
+    return pts
+
+def program(pts):
+    lines = ['G00 X' + str(pts[0][0]) + ' Y' + str(pts[0][1]) + '\n', 'G01 Z-0.1 F50\n']
+    lines += ['G01 X' + str(x) + ' Y' + str(y) + ' F100.0\n' for x, y in pts[1:]]
+    return lines + ['G00 Z8.0\n']
+
+# the (start, end, centre, radius) of every arc written
+def arcs(lines):
+    found = []
+    x = y = None
+    for line in lines:
+        ws = gcode_lexer.lex_line(line)
+        nx = gcode_lexer.value_of(ws, 'X')
+        ny = gcode_lexer.value_of(ws, 'Y')
+        i = gcode_lexer.value_of(ws, 'I')
+        if i is not None:
+            j = gcode_lexer.value_of(ws, 'J')
+            c = (x + i, y + j)
+            found.append(((x, y), (nx, ny), c, math.hypot(i, j)))
+        if nx is not None:
+            x = nx
+        if ny is not None:
+            y = ny
+    return found
+
+#---------Deviation bound--------------------#
+@pytest.mark.parametrize('tol, noise', [(0.01, 0.0), (0.01, 0.004), (0.05, 0.02)])
+def test_points_within_tolerance_of_arcs(tol, noise):
+    pts = flattened(20.0, 10.0, 3.0, 0.3, 5.0, 60, noise)
+    stats = arc_fit.new_stats()
+    out = list(arc_fit.fit_arcs(program(pts), tol, stats))
+    found = arcs(out)
+    assert found
+    assert stats['max_deviation'] <= tol
+    # the chain of moves still ends where it did
+    assert gcode_lexer.value_of(gcode_lexer.lex_line(out[-2]), 'X') == pytest.approx(pts[-1][0])
+    position = dict((p, k) for k, p in enumerate(pts))
+    for start, end, c, r in found:
+        for p in pts[position[start]:position[end] + 1]:
+            assert abs(math.hypot(p[0] - c[0], p[1] - c[1]) - r) <= tol + 1e-4
+
+def test_fit_reports_its_worst_point():
+    pts = flattened(0.0, 0.0, 5.0, 0.0, 1.5, 12, 0.003, seed=3)
+    arc = arc_fit.fit(pts, 0, len(pts) - 1, 0.01)
+    assert arc is not None
+    cx, cy, r, ccw, worst = arc
+    assert ccw
+    dev = max(abs(math.hypot(x - cx, y - cy) - r) for x, y in pts)
+    dev = max([dev] + [sagitta(p, q, r) for p, q in zip(pts, pts[1:])])
+    assert worst == pytest.approx(dev)
+    assert worst <= 0.01
+
+# how far the chord from p to q sags inside the circle about c
+def sagitta(p, q, r):
+    return r - math.sqrt(r * r - ((p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2) / 4.0)
+
+def test_chord_sagitta_within_tolerance():
+    pts = flattened(20.0, 10.0, 3.0, 0.3, 5.0, 60, 0.004)
+    stats = arc_fit.new_stats()
+    found = arcs(arc_fit.fit_arcs(program(pts), 0.01, stats))
+    assert found
+    position = dict((p, k) for k, p in enumerate(pts))
+    worst = 0.0
+    for start, end, c, r in found:
+        run = pts[position[start]:position[end] + 1]
+        for p, q in zip(run, run[1:]):
+            worst = max(worst, sagitta(p, q, r))
+    assert worst <= 0.01
+    assert stats['max_deviation'] >= worst
+
+def test_coarse_chords_not_fitted():
+    # a 1.2 mm pad in 12 chords: every point is on the circle, but each
+    # chord sags about 0.02 mm inside it
+    pts = flattened(5.0, 5.0, 0.6, 0.0, 2 * math.pi * 11 / 12, 11)
+    assert arc_fit.fit(pts, 0, 6, 0.01) is None
+    arc = arc_fit.fit(pts, 0, 6, 0.05)
+    assert arc is not None
+    assert arc[4] == pytest.approx(sagitta(pts[0], pts[1], 0.6), abs=1e-3)
+
+def test_points_off_the_circle_are_not_fitted():
+    pts = flattened(0.0, 0.0, 5.0, 0.0, 1.5, 12, 0.05, seed=3)
+    assert arc_fit.fit(pts, 0, len(pts) - 1, 0.01) is None
+    stats = arc_fit.new_stats()
+    out = list(arc_fit.fit_arcs(program(pts), 0.01, stats))
+    for start, end, c, r in arcs(out):
+        for p in pts[pts.index(start):pts.index(end) + 1]:
+            assert abs(math.hypot(p[0] - c[0], p[1] - c[1]) - r) <= 0.01 + 1e-4
+
+def test_straight_run_left_alone():
+    pts = [(float(k), 2.0 * k) for k in range(10)]
+    out = list(arc_fit.fit_arcs(program(pts)))
+    assert out == program(pts)
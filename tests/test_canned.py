@@ -0,0 +1,37 @@
+#
+# test_canned.py
+# github: https://github.com/NPS-DAZL
+#
+# G81/G83 cycles written out as the plain moves they stand for.
+
+import pytest
+
+import canned
+
+def test_g81_each_hole():
+    lines = ['G00 Z8', 'G98 G81 X1 Y2 Z-1.5 R1.0 F100', 'X3', 'G80', 'G00 X0 Y0']
+    assert list(canned.expand_canned(lines)) == [
+        'G00 Z8',
+        'G00 X1 Y2', 'G00 Z1.0', 'G01 Z-1.5 F100', 'G00 Z8',
+        'G00 X3 Y2', 'G00 Z1.0', 'G01 Z-1.5 F100', 'G00 Z8',
+        'G00 X0 Y0']
+
+def test_g99_returns_to_r_plane():
+    lines = ['G00 Z8', 'G99 G81 X1 Y2 Z-1.5 R1.0', 'G80']
+    assert list(canned.expand_canned(lines))[-1] == 'G00 Z1.0'
+
+def test_g83_pecks():
+    lines = ['G00 Z8', 'G98 G83 X0 Y0 Z-1.5 R0.5 Q1.0 F60', 'G80']
+    assert list(canned.expand_canned(lines, 0.2)) == [
+        'G00 Z8',
+        'G00 X0 Y0', 'G00 Z0.5',
+        'G01 Z-0.5 F60', 'G00 Z0.5', 'G00 Z-0.3',
+        'G01 Z-1.5 F60', 'G00 Z8']
+
+def test_other_lines_unchanged():
+    lines = ['%', 'G90', 'G00 X5 Y5 Z8', 'M30']
+    assert list(canned.expand_canned(lines)) == lines
+
+def test_cycle_without_depth():
+    with pytest.raises(ValueError):
+        list(canned.expand_canned(['G81 X1 Y1 R1', 'G80']))
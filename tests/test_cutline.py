@@ -0,0 +1,90 @@
+#
+# test_cutline.py
+# github: https://github.com/NPS-DAZL
+#
+# The polygon outline planner: the board edge found in a PCBmill outline,
+# its corners, and tabs kept clear of them.
+
+import logging
+
+import numpy as np
+import pytest
+
+import cutline
+
+HEADER = ['%~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~',
+          '%        File was created with PCBMill V1.0          ',
+          '%        Date: 2015-04-01',
+          '%~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~',
+          '', '%', 'G90', 'G55', 'G00 Z50.0', 'F600.0 S15000 M03', 'G00 X0.0 Y0.0']
+FOOTER = ['G00 Z50.0', 'M05', 'M30']
+
+def outline(points):
+    lines = HEADER + ['G00 X%.4f Y%.4f' % points[0], 'G01 Z-0.6 F100.0']
+    lines += ['G01 X%.4f Y%.4f' % p for p in points[1:] + points[:1]]
+    return lines + FOOTER
+
+def rounded_square(side, r, steps=9):
+    # counter-clockwise square with every corner an arc of radius r
+    # flattened to steps lines
+    pts = []
+    for cx, cy, a0 in ((side - r, r, -90), (side - r, side - r, 0),
+                       (r, side - r, 90), (r, r, 180)):
+        for k in range(steps + 1):
+            a = np.radians(a0 + 90.0 * k / steps)
+            pts.append((cx + r * np.cos(a), cy + r * np.sin(a)))
+    return cutline.close_polygon(np.array(pts))
+
+#---------Outline polygon--------------------#
+def test_polygon_of_rectangle():
+    poly = cutline.outline_polygon(outline([(0, 0), (60, 0), (60, 40), (0, 40)]))
+    assert poly.tolist() == [[0, 0], [60, 0], [60, 40], [0, 40], [0, 0]]
+    stats = cutline.polygon_stats(poly)
+    assert stats['perimeter'] == pytest.approx(200.0)
+    assert abs(cutline.polygon_area(poly)) == pytest.approx(2400.0)
+
+def test_no_outline_moves():
+    with pytest.raises(ValueError, match="no outline moves"):
+        list(cutline.cutline(HEADER + FOOTER))
+
+#---------Corners----------------------------#
+def test_square_corners():
+    poly = np.array([[0, 0], [50, 0], [50, 50], [0, 50], [0, 0]], dtype=float)
+    s = cutline.edge_positions(poly)
+    assert cutline.corner_positions(poly, s).tolist() == [0, 50, 100, 150, 200]
+
+def test_rounded_corner_is_a_corner():
+    # every vertex of a flattened arc turns only 10 degrees, but the
+    # arcs turn 90 degrees in all
+    poly = rounded_square(50.0, 5.0)
+    s = cutline.edge_positions(poly)
+    corners = cutline.corner_positions(poly, s)
+    assert len(corners) > 4 * 9
+
+#---------Tabs-------------------------------#
+def test_tabs_clear_of_corners():
+    poly = rounded_square(50.0, 5.0)
+    s = cutline.edge_positions(poly)
+    corners = cutline.corner_positions(poly, s)
+    tabs = cutline.polygon_tabs(poly, 4, 5.0)
+    assert len(tabs) == 4
+    for a, b in tabs:
+        assert b - a == pytest.approx(5.0)
+        assert np.abs(corners - a).min() >= cutline.tab_corner_clearance - 1e-6
+        assert np.abs(corners - b).min() >= cutline.tab_corner_clearance - 1e-6
+    for (a0, b0), (a1, b1) in zip(tabs, tabs[1:]):
+        assert a1 - b0 >= 5.0 - 1e-6
+
+def test_tabs_left_out_with_warning(caplog):
+    with caplog.at_level(logging.WARNING, logger='cutline'):
+        tabs = cutline.place_tabs(40.0, np.array([0.0, 40.0]), count=8, width=5.0,
+                                  clearance=2.0)
+    assert 0 < len(tabs) < 8
+    assert "of 8 tabs fit" in caplog.text
+
+def test_program_lifts_over_every_tab():
+    points = [(0, 0), (60, 0), (60, 40), (0, 40)]
+    program = list(cutline.cutline(outline(points), tabs=4, width=5.0))
+    lifts = [line for line in program if line.startswith('G00 Z' + str(cutline.z_fast_stop))]
+    # four tabs on each of the FR4 and through cut passes
+    assert len(lifts) == 8
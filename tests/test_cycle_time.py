@@ -0,0 +1,65 @@
+#
+# test_cycle_time.py
+# github: https://github.com/NPS-DAZL
+#
+# Run time of moves that start and end at rest, split by kind.
+
+import math
+
+import pytest
+
+import cycle_time
+import toolpath
+
+machine = cycle_time.Machine(3000.0, 1800.0, 500.0, 60.0)
+
+def test_straight_cut_trapezoid():
+    # 60 mm at 10 mm/s: 6 s, and 10/500 s more to speed up and slow down
+    e = cycle_time.estimate('G00 X0 Y0 Z0\nG01 X60 F600\n', machine)
+    assert e.cutting == pytest.approx(6.02)
+    assert e.cut_mm == pytest.approx(60.0)
+    assert e.rapid_xy == 0.0
+
+def test_short_move_never_reaches_speed():
+    e = cycle_time.estimate('G00 X0 Y0 Z0\nG01 X0.1 F600\n', machine)
+    assert e.cutting == pytest.approx(2.0 * math.sqrt(0.1 / 500.0))
+
+def test_moves_split_by_kind():
+    e = cycle_time.estimate('G00 X0 Y0 Z5\nG00 X30 Y40\nG01 Z-1 F60\nG00 Z5\n', machine)
+    assert e.rapid_mm == pytest.approx(50.0)
+    assert e.z_mm == pytest.approx(12.0)
+    assert e.cut_mm == 0.0
+    # the plunge at 1 mm/s, the retract at the Z rapid rate
+    assert e.z_moves == pytest.approx(6.0 + 1.0 / 500.0 + 6.0 / 30.0 + 30.0 / 500.0)
+    assert e.total() == pytest.approx(e.rapid_xy + e.z_moves)
+
+def test_full_circle_arc():
+    e = cycle_time.estimate('G00 X0 Y0 Z0\nG02 X0 Y0 I5 J0 F600\n', machine)
+    assert e.cut_mm == pytest.approx(2 * math.pi * 5.0)
+
+def test_canned_cycle_timed_as_its_moves():
+    canned = 'G00 X0 Y0 Z8\nG98 G81 X10 Y0 Z-2 R1 F100\nX20\nG80\n'
+    plain = ('G00 X0 Y0 Z8\nG00 X10 Y0\nG00 Z1\nG01 Z-2 F100\nG00 Z8\n'
+             'G00 X20 Y0\nG00 Z1\nG01 Z-2\nG00 Z8\n')
+    assert (cycle_time.estimate(canned, machine).total() ==
+            pytest.approx(cycle_time.estimate(plain, machine).total()))
+
+def test_toolpath_same_as_gcode():
+    text = 'G00 X0 Y0 Z5\nG00 X10 Y10\nG01 Z-1 F60\nG01 X20 F300\nG03 X30 Y10 I5 J0\nG00 Z5\n'
+    e = cycle_time.estimate(text, machine)
+    t = cycle_time.estimate_toolpath(toolpath.from_gcode(text), machine)
+    assert t.total() == pytest.approx(e.total())
+
+def test_job_adds_tool_changes(tmp_path):
+    names = []
+    for k in range(3):
+        name = tmp_path / (str(k) + '.nc')
+        name.write_text('G00 X0 Y0 Z0\nG01 X60 F600\n')
+        names.append(str(name))
+    estimates, total = cycle_time.estimate_job(names, machine)
+    assert total.changes == 2
+    assert total.total() == pytest.approx(3 * 6.02 + 2 * 60.0)
+
+def test_hms():
+    assert cycle_time.hms(59.6) == '1:00'
+    assert cycle_time.hms(3725) == '1:02:05'
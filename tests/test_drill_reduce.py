@@ -0,0 +1,45 @@
+#
+# test_drill_reduce.py
+# github: https://github.com/NPS-DAZL
+#
+# The reduced file says what its coordinates are: read back, it gives
+# the same holes to within the 1 mil step.
+
+import numpy as np
+import pytest
+
+import drill_reduce
+import excellon
+
+def reduce_text(tmp_path, text):
+    name = tmp_path / 'board.drd'
+    name.write_text(text)
+    out = drill_reduce.reduce_file(str(name))
+    fp = open(out, 'r')
+    try:
+        return fp.read()
+    finally:
+        fp.close()
+
+@pytest.mark.parametrize('header, body', [
+    ('M72\nT01C0.0236', 'T01\nX5402Y19651\nX28768Y3067'),
+    ('METRIC,LZ\nT01C0.800', 'T01\nX01234Y00567\nX0789Y125'),
+    ('M71\n;FILE_FORMAT=3:3\nT1C1.000', 'T1\nX12345Y500'),
+    ('INCH,LZ,00.0000\nT2C0.040', 'T2\nX0054Y012'),
+])
+def test_reduced_file_reads_back(tmp_path, header, body):
+    text = '%\nM48\n' + header + '\n%\n' + body + '\nM30\n'
+    before = excellon.parse_excellon(text)
+    out = reduce_text(tmp_path, text)
+    after = excellon.parse_excellon(out)
+    assert after.units == 'INCH'
+    assert after.digits == (2, 3)
+    assert after.zeros == 'TZ'
+    assert np.allclose(after.coords_mm(), before.coords_mm(), atol=0.0254 / 2 + 1e-9)
+    for t in before.tools:
+        assert after.diameter_in(t) == pytest.approx(before.diameter_in(t), abs=1e-4)
+
+def test_eagle_header_gets_format(tmp_path):
+    text = '%\nM48\nM72\nT01C0.0236\n%\nT01\nX5402Y19651\nM30\n'
+    assert reduce_text(tmp_path, text) == ('%\nM48\n;FILE_FORMAT=2:3\nM72\nT01C0.0236\n%\n'
+                                           'T01\nX0540Y1965\nM30\n')
@@ -0,0 +1,69 @@
+#
+# test_excellon.py
+# github: https://github.com/NPS-DAZL
+#
+# Units, zero suppression and number formats of Excellon headers.
+
+import numpy as np
+import pytest
+
+import excellon
+
+def drill_file(header, body):
+    return '%\nM48\n' + header + '\n%\n' + body + '\nM30\n'
+
+#---------Inch files-------------------------#
+def test_inch_default_format():
+    e = excellon.parse_excellon(drill_file('M72\nT01C0.0236', 'T01\nX5402Y19651\nX100Y2'))
+    assert e.units == 'INCH'
+    assert e.digits == (2, 4)
+    assert e.tools == {1: 0.0236}
+    assert e.x.tolist() == [5402, 100]
+    assert e.y.tolist() == [19651, 2]
+    mm = e.coords_mm()
+    assert mm[0] == pytest.approx((0.5402 * 25.4, 1.9651 * 25.4))
+    assert e.diameter_in(1) == pytest.approx(0.0236)
+
+def test_inch_trailing_zeros_suppressed():
+    # INCH,LZ keeps the leading zeros: 0054 is 00.54 in
+    e = excellon.parse_excellon(drill_file('INCH,LZ\nT1C0.035', 'T1\nX0054Y012'))
+    assert e.zeros == 'LZ'
+    assert e.coords_mm()[0] == pytest.approx((0.54 * 25.4, 1.2 * 25.4))
+
+#---------Metric files-----------------------#
+def test_metric_default_format():
+    e = excellon.parse_excellon(drill_file('METRIC\nT01C0.800', 'T01\nX12345Y500'))
+    assert e.units == 'METRIC'
+    assert e.digits == (3, 3)
+    assert e.coords_mm()[0] == pytest.approx((12.345, 0.5))
+    assert e.diameter_in(1) == pytest.approx(0.8 / 25.4)
+
+def test_metric_m71_and_number_format():
+    e = excellon.parse_excellon(drill_file('M71\nMETRIC,TZ,000.00\nT02C1.0', 'T02\nX1234Y5'))
+    assert e.digits == (3, 2)
+    assert e.coords_mm()[0] == pytest.approx((12.34, 0.05))
+
+def test_eagle_file_format_comment():
+    e = excellon.parse_excellon(drill_file(';FILE_FORMAT=3:3\nMETRIC\nT1C0.6', 'T1\nX1Y20000'))
+    assert e.digits == (3, 3)
+    assert e.coords_mm()[0] == pytest.approx((0.001, 20.0))
+
+def test_decimal_point_read_as_written():
+    e = excellon.parse_excellon(drill_file('METRIC\nT1C0.6', 'T1\nX1.5Y-2.25'))
+    assert e.coords_mm()[0] == pytest.approx((1.5, -2.25))
+
+#---------Tools and units between files------#
+def test_tools_per_hole_and_units():
+    e = excellon.parse_excellon(drill_file('INCH\nT1C0.02\nT2C0.04',
+                                           'T1\nX10000Y10000\nT2\nX20000Y10000\nX30000'))
+    assert e.tool.tolist() == [1, 2, 2]
+    assert e.y.tolist() == [10000, 10000, 10000]
+    assert e.tool_ids() == [1, 2]
+    x, y = e.coords_in_units('METRIC', 2)
+    assert x.tolist() == [2540, 5080, 7620]
+    assert e.coords_mm(2).shape == (2, 2)
+
+def test_same_holes_in_inch_and_metric():
+    inch = excellon.parse_excellon(drill_file('INCH\nT1C0.02', 'T1\nX10000Y5000'))
+    metric = excellon.parse_excellon(drill_file('METRIC\nT1C0.5', 'T1\nX25400Y12700'))
+    assert np.allclose(inch.coords_mm(), metric.coords_mm())
@@ -0,0 +1,94 @@
+#
+# test_feed_plan.py
+# github: https://github.com/NPS-DAZL
+#
+# Feeds by kind of move: long straight runs, the corner into a sharp
+# turn, smooth curves at the cut feed, and F only where it changes.
+
+import math
+
+import pytest
+
+import feed_plan
+import gcode_lexer
+
+tool = feed_plan.Tool('outline', 0.794, 100.0, 250.0, 150.0, 120.0, 400.0)
+tools = feed_plan.Tools({'outline': tool}, 1.0, 10.0, 45.0, 2.0, 2.0)
+
+def schedule(moves):
+    lines = ['G00 X0 Y0\n', 'G00 Z1\n', 'G01 Z-1 F100\n']
+    lines += ['G01 X%.4f Y%.4f F250\n' % p for p in moves]
+    lines += ['G00 Z8\n']
+    stats = feed_plan.new_stats()
+    return feed_plan.schedule_feeds(lines, tools, 'outline', stats), stats
+
+# the (x, y, feed in effect) after every line
+def feeds(lines):
+    out = []
+    x = y = f = None
+    for line in lines:
+        ws = gcode_lexer.lex_line(line)
+        x = gcode_lexer.value_of(ws, 'X') if gcode_lexer.value_of(ws, 'X') is not None else x
+        y = gcode_lexer.value_of(ws, 'Y') if gcode_lexer.value_of(ws, 'Y') is not None else y
+        f = gcode_lexer.value_of(ws, 'F') if gcode_lexer.value_of(ws, 'F') is not None else f
+        out.append((x, y, f))
+    return out
+
+def test_long_edge_slows_into_corner():
+    out, stats = schedule([(30.0, 0.0), (30.0, 20.0)])
+    assert stats['plunge'] == 1
+    assert stats['long'] == 2
+    assert stats['corner'] == 2
+    assert stats['split'] == 2
+    f = feeds(out)
+    # the plunge, then the edge up to 2 mm before the turn at the long
+    # feed, and the last 2 mm at the corner feed
+    assert f[2][2] == 100.0
+    assert f[3] == (28.0, 0.0, 400.0)
+    assert f[4] == (30.0, 0.0, 120.0)
+    assert f[5] == (30.0, 18.0, 400.0)
+    assert f[6] == (30.0, 20.0, 120.0)
+
+def test_curve_cut_at_cut_feed():
+    # a quarter circle of radius 10 in 9 degree steps, then a straight
+    # run on along its end
+    r = 10.0
+    pts = [(r * math.sin(math.radians(a)), r - r * math.cos(math.radians(a)))
+           for a in range(9, 91, 9)]
+    out, stats = schedule(pts + [(10.0, 30.0)])
+    assert stats['short'] == 0
+    assert stats['cut'] == 10
+    assert stats['long'] == 1
+    assert stats['corner'] == 1
+
+def test_isolated_short_cut():
+    out, stats = schedule([(10.0, 0.0), (10.0, 0.5), (20.0, 0.5)])
+    assert stats['short'] == 1
+    f = feeds(out)
+    assert f[5][2] == 150.0
+
+def test_feed_written_only_when_it_changes():
+    r = 10.0
+    pts = [(r * math.sin(math.radians(a)), r - r * math.cos(math.radians(a)))
+           for a in range(9, 91, 9)]
+    out, stats = schedule(pts)
+    written = [gcode_lexer.value_of(gcode_lexer.lex_line(l), 'F') for l in out]
+    written = [w for w in written if w is not None]
+    # the plunge, the curve, the corner into the stop
+    assert written == [100.0, 250.0, 120.0]
+
+def test_unknown_tool_leaves_lines():
+    lines = ['G01 X1 Y1 F250\n']
+    assert feed_plan.schedule_feeds(lines, tools, 'iso') == lines
+
+def test_read_tools(tmp_path):
+    name = tmp_path / 'tools.cfg'
+    name.write_text('tool 65 0.889 60  # a drill\ntool iso 0.396 50 50 40\nstraight_angle 1.5\n')
+    table = feed_plan.read_tools(str(name))
+    assert table.tools['65'].cut is None
+    assert table.tools['iso'].short == 40.0
+    assert table.tools['iso'].corner == 50.0
+    assert table.straight_angle == 1.5
+    name.write_text('tool iso\n')
+    with pytest.raises(ValueError):
+        feed_plan.read_tools(str(name))
@@ -0,0 +1,75 @@
+#
+# test_hole_dedupe.py
+# github: https://github.com/NPS-DAZL
+#
+# Which hole of a close group is kept, and how far apart holes may be.
+
+import numpy as np
+
+import hole_dedupe
+
+#---------Rank of the holes------------------#
+def test_largest_hole_kept():
+    pts = np.array([[0.0, 0.0], [0.05, 0.0], [5.0, 5.0]])
+    keep, into = hole_dedupe.dedupe(pts, np.array([0.8, 1.0, 0.8]), 0.1)
+    assert keep.tolist() == [False, True, True]
+    assert into.tolist() == [1, -1, -1]
+
+def test_earlier_hole_kept_between_equal_sizes():
+    pts = np.array([[1.0, 1.0], [1.0, 1.05], [1.05, 1.0]])
+    keep, into = hole_dedupe.dedupe(pts, np.ones(3), 0.1)
+    assert keep.tolist() == [True, False, False]
+    assert into.tolist() == [-1, 0, 0]
+
+def test_removed_hole_does_not_remove_others():
+    # 1 is close to 0 and 2, but 0 and 2 are not close: only 1 goes
+    pts = np.array([[0.0, 0.0], [0.08, 0.0], [0.16, 0.0]])
+    keep, into = hole_dedupe.dedupe(pts, np.ones(3), 0.1)
+    assert keep.tolist() == [True, False, True]
+
+def test_first_tool_wins_then_first_hole():
+    coords = [np.array([[3.0, 3.0], [0.0, 0.0]]), np.array([[0.0, 0.0], [3.0, 3.0]])]
+    out, stats = hole_dedupe.dedupe_tools(coords, [1.0, 1.0], 0.1)
+    assert out[0].tolist() == [[3.0, 3.0], [0.0, 0.0]]
+    assert len(out[1]) == 0
+    assert stats['removed'] == 2
+    assert stats['exact'] == 2
+    assert stats['other_tool'] == 2
+    assert stats['per_tool'] == [0, 2]
+
+def test_larger_tool_wins_and_dtype_kept():
+    coords = [np.array([[10, 10], [20, 20]], dtype=np.int64), np.array([[10, 10]], dtype=np.int64)]
+    out, stats = hole_dedupe.dedupe_tools(coords, [0.6, 1.1], 0.1)
+    assert out[0].tolist() == [[20, 20]]
+    assert out[1].tolist() == [[10, 10]]
+    assert out[0].dtype == np.int64
+
+#---------Tolerance--------------------------#
+def test_tolerance_is_inclusive_distance():
+    pts = np.array([[0.0, 0.0], [0.06, 0.08], [2.0, 0.0], [2.0, 0.11]])
+    a, b = hole_dedupe.close_pairs(pts, 0.1)
+    assert sorted(zip(a.tolist(), b.tolist())) == [(0, 1)]
+
+def test_pairs_across_cells():
+    # holes either side of a cell boundary are still found
+    rng = np.random.RandomState(1)
+    pts = rng.uniform(0, 5, size=(400, 2))
+    tol = 0.2
+    a, b = hole_dedupe.close_pairs(pts, tol)
+    d = np.hypot(*(pts[:, None, :] - pts[None, :, :]).transpose(2, 0, 1))
+    want = set(zip(*np.nonzero(np.triu(d <= tol, 1))))
+    assert set(zip(a.tolist(), b.tolist())) == set((int(i), int(j)) for i, j in want)
+
+def test_zero_tolerance_merges_exact_duplicates_only():
+    pts = np.array([[1.0, 2.0], [1.0, 2.0], [1.0, 2.001], [1.0, 2.0], [4.0, 4.0]])
+    a, b = hole_dedupe.close_pairs(pts, 0)
+    assert sorted(zip(a.tolist(), b.tolist())) == [(0, 1), (0, 3), (1, 3)]
+    keep, into = hole_dedupe.dedupe(pts, np.ones(5), 0)
+    assert keep.tolist() == [True, False, True, False, True]
+    assert into.tolist() == [-1, 0, -1, 0, -1]
+
+def test_nothing_to_merge():
+    keep, into = hole_dedupe.dedupe(np.array([[0.0, 0.0]]), np.ones(1), 0.1)
+    assert keep.tolist() == [True]
+    out, stats = hole_dedupe.dedupe_tools([np.zeros((0, 2))], [1.0], 0.1)
+    assert stats['removed'] == 0
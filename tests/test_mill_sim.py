@@ -0,0 +1,68 @@
+#
+# test_mill_sim.py
+# github: https://github.com/NPS-DAZL
+#
+# The simulator finds uncut isolation gaps, gouges and missing holes,
+# and nothing in a job cut as it should be.
+
+import numpy as np
+
+import mill_sim
+
+res = 0.05
+
+def program(tmp_path, name, runs, depth):
+    lines = ['G90', 'G00 Z8', 'G00 X0 Y0']
+    for pts in runs:
+        lines += ['G00 X%.4f Y%.4f' % pts[0], 'G00 Z1', 'G01 Z%.3f F100' % depth]
+        lines += ['G01 X%.4f Y%.4f' % p for p in pts[1:]]
+        lines += ['G00 Z8']
+    path = tmp_path / name
+    path.write_text('\n'.join(lines) + '\n')
+    return str(path)
+
+def square(x, y, size):
+    return [(x, y), (x + size, y), (x + size, y + size), (x, y + size), (x, y)]
+
+def test_clean_job(tmp_path):
+    iso = program(tmp_path, 'iso.nc', [square(1, 1, 3)], -0.6)
+    drill = program(tmp_path, '65_drill.txt', [[(6, 6)]], -2.4)
+    hmap, report = mill_sim.simulate([(iso, 'iso', 0.396), (drill, 'drill', 0.889)],
+                                     np.array([[6.0, 6.0]]), res)
+    assert report['runs'] == 1
+    assert report['gaps'] == []
+    assert report['gouge'] is None
+    assert len(report['missing']) == 0
+    assert not mill_sim.problems(report)
+
+def test_shallow_run_is_a_gap(tmp_path):
+    iso = program(tmp_path, 'iso.nc', [square(1, 1, 3), [(6, 1), (9, 1)]], -0.6)
+    shallow = program(tmp_path, 'shallow.nc', [[(1, 6), (4, 6)]], -0.2)
+    hmap, report = mill_sim.simulate([(iso, 'iso', 0.396), (shallow, 'iso', 0.396)],
+                                     None, res)
+    assert len(report['gaps']) == 1
+    x, y, length = report['gaps'][0]
+    assert abs(y - 6.0) < res
+    assert abs(length - 3.0) < 0.2
+    assert mill_sim.problems(report)
+
+def test_open_loop_leaves_a_bridge(tmp_path):
+    loop = square(1, 1, 3)[:-1] + [(1.0, 2.0)]
+    iso = program(tmp_path, 'iso.nc', [loop], -0.6)
+    hmap, report = mill_sim.simulate([(iso, 'iso', 0.396)], None, res)
+    assert len(report['gaps']) == 1
+    x, y, length = report['gaps'][0]
+    assert abs(x - 1.0) < res and 1.0 < y < 2.0
+
+def test_gouge(tmp_path):
+    outline = program(tmp_path, 'outline.nc', [[(1, 1), (5, 1)]], -3.0)
+    hmap, report = mill_sim.simulate([(outline, 'outline', 0.794)], None, res)
+    area, deepest, x, y = report['gouge']
+    assert deepest == -3.0
+    assert area > 3.0
+
+def test_missing_hole(tmp_path):
+    drill = program(tmp_path, '65_drill.txt', [[(2, 2)], [(4, 2)]], -2.4)
+    holes = np.array([[2.0, 2.0], [4.0, 2.0], [6.0, 2.0]])
+    hmap, report = mill_sim.simulate([(drill, 'drill', 0.889)], holes, res)
+    assert report['missing'].tolist() == [[6.0, 2.0]]
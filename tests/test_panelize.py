@@ -0,0 +1,75 @@
+#
+# test_panelize.py
+# github: https://github.com/NPS-DAZL
+#
+# Boards laid out in rows, neighbours sharing one cut line, and only
+# rectangular outlines accepted.
+
+import pytest
+
+import panelize
+
+def board(name, w, h, x0=0.0, y0=0.0):
+    corners = {'x_min': x0, 'y_min': y0, 'x_max': x0 + w, 'y_max': y0 + h}
+    return panelize.Board(name, name + '.outline.nc', [], None, corners)
+
+def outline_file(tmp_path, name, points):
+    lines = ['%~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~',
+             '%        File was created with PCBMill V1.0          ',
+             '%        Date: 2015-04-01',
+             '%~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~',
+             '', '%', 'G90', 'G55', 'G00 Z50.0', 'F600.0 S15000 M03', 'G00 X0.0 Y0.0', 'G00 Z8',
+             'G00 X%.4f Y%.4f' % points[0], 'G00 Z3', 'G01 Z-0.6 F100.0']
+    lines += ['G01 X%.4f Y%.4f' % p for p in points[1:] + points[:1]]
+    lines += ['G00 Z8', 'G00 Z50.0', 'M05', 'M30']
+    path = tmp_path / name
+    path.write_text('\n'.join(lines) + '\n')
+    return str(path)
+
+#---------Layout-----------------------------#
+def test_rows_from_bottom_left():
+    boards = [board('a', 40, 30, 2.0, 3.0), board('b', 40, 20), board('c', 40, 30)]
+    placements = panelize.layout(boards, 100.0, 100.0, 5.0)
+    # tallest first, left to right, then a new row on top of the first
+    where = [(p.board.name, p.dx + p.board.corners['x_min'], p.dy + p.board.corners['y_min'])
+             for p in placements]
+    assert where == [('a', 5.0, 5.0), ('c', 45.0, 5.0), ('b', 5.0, 35.0)]
+
+def test_too_many_boards():
+    with pytest.raises(ValueError):
+        panelize.layout([board('a', 60, 60), board('b', 60, 60)], 100.0, 100.0, 5.0)
+
+#---------Shared cut lines-------------------#
+def test_neighbours_share_one_cut():
+    placements = panelize.layout([board('a', 40, 30), board('b', 40, 30)], 100.0, 100.0, 5.0)
+    segments = panelize.cut_segments(placements)
+    lines = sorted((p0, p1) for p0, p1, tabs in segments)
+    assert lines == [((5.0, 5.0), (5.0, 35.0)), ((5.0, 5.0), (85.0, 5.0)),
+                     ((5.0, 35.0), (85.0, 35.0)), ((45.0, 5.0), (45.0, 35.0)),
+                     ((85.0, 5.0), (85.0, 35.0))]
+    # a joined edge keeps the tab of each board, and the shared edge
+    # the one tab both boards put in its middle
+    tabs = dict(((p0, p1), t) for p0, p1, t in segments)
+    assert tabs[((5.0, 5.0), (85.0, 5.0))] == [(15.0, 25.0), (55.0, 65.0)]
+    assert tabs[((45.0, 5.0), (45.0, 35.0))] == [(10.0, 20.0)]
+
+def test_every_line_cut_once():
+    placements = panelize.layout([board('a', 40, 30)] * 4, 100.0, 100.0, 5.0)
+    ordered = panelize.order_segments(panelize.cut_segments(placements))
+    assert len(ordered) == len(panelize.cut_segments(placements))
+    assert ordered[0][0] == (5.0, 5.0)
+
+def test_merge_intervals():
+    assert panelize.merge_intervals([(3, 4), (0, 1), (1, 2)]) == [(0, 2), (3, 4)]
+
+#---------Rectangular outlines only----------#
+def test_outline_is_rectangle(tmp_path):
+    square = outline_file(tmp_path, 'a.outline.nc', [(0.0, 0.0), (40.0, 0.0), (40.0, 30.0),
+                                                     (0.0, 30.0)])
+    notched = outline_file(tmp_path, 'b.outline.nc', [(0.0, 0.0), (40.0, 0.0), (40.0, 30.0),
+                                                      (20.0, 30.0), (20.0, 20.0), (0.0, 20.0)])
+    assert panelize.outline_is_rectangle(square)
+    assert not panelize.outline_is_rectangle(notched)
+    with pytest.raises(ValueError):
+        panelize.load_board('b', [notched])
+    assert panelize.load_board('b', [notched], bounding=True).corners['y_max'] == 30.0
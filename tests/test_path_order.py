@@ -0,0 +1,91 @@
+#
+# test_path_order.py
+# github: https://github.com/NPS-DAZL
+#
+# Reordering the runs of a program changes only the rapids between them:
+# every cut segment is still cut, once, at its depth.
+
+import collections
+import math
+
+import numpy as np
+
+import gcode_lexer
+import path_order
+
+header = ['%\n', 'G90\n', 'G55\n', 'G00 Z50.0\n', 'F600.0 S15000 M03\n', 'G00 X0.0 Y0.0\n',
+          'G00 Z8\n']
+footer = ['G00 Z50.0\n', 'M05\n', 'M30\n']
+
+def num(v):
+    return '%.4f' % v
+
+# one run: a rapid to its start, a plunge, G01 cuts and a retract
+def run_lines(pts, depth=-0.6):
+    lines = ['G00 X' + num(pts[0][0]) + ' Y' + num(pts[0][1]) + '\n', 'G00 Z3\n',
+             'G01 Z' + str(depth) + ' F50\n']
+    lines += ['G01 X' + num(x) + ' Y' + num(y) + ' F100.0\n' for x, y in pts[1:]]
+    return lines + ['G00 Z8.0\n']
+
+def random_program(seed, runs=60):
+    rng = np.random.RandomState(seed)
+    lines = list(header)
+    for k in range(runs):
+        cx, cy = rng.uniform(0, 100, 2)
+        if k % 3 == 0:
+            # a closed pad contour
+            a = np.linspace(0, 2 * math.pi, 13)
+            pts = [(cx + math.cos(t), cy + math.sin(t)) for t in a]
+            pts[-1] = pts[0]
+        else:
+            # an open trace
+            steps = rng.uniform(-3, 3, size=(rng.randint(1, 6), 2))
+            pts = [(cx, cy)] + [tuple(p) for p in np.cumsum(steps, axis=0) + (cx, cy)]
+        lines += run_lines(pts, -0.6 if k % 5 else -0.3)
+    return lines + footer
+
+# the multiset of cut segments, (depth, unordered ends), and the number
+# of plunges
+def cuts(lines):
+    found = collections.Counter()
+    plunges = 0
+    x = y = z = None
+    for line in lines:
+        ws = gcode_lexer.lex_line(line)
+        g = gcode_lexer.value_of(ws, 'G')
+        nx = gcode_lexer.value_of(ws, 'X')
+        ny = gcode_lexer.value_of(ws, 'Y')
+        nz = gcode_lexer.value_of(ws, 'Z')
+        nx = x if nx is None else round(nx, 4)
+        ny = y if ny is None else round(ny, 4)
+        nz = z if nz is None else nz
+        if g == 1 and nz != z:
+            plunges += 1
+        elif g == 1 and nz < 0 and (nx, ny) != (x, y):
+            found[(nz, frozenset(((x, y), (nx, ny))))] += 1
+        x, y, z = nx, ny, nz
+    return found, plunges
+
+def test_cut_segments_kept():
+    for seed in range(3):
+        lines = random_program(seed)
+        stats = path_order.new_stats()
+        out = list(path_order.order_program(lines, 0.5, True, stats))
+        assert cuts(out) == cuts(lines)
+        assert stats['runs'] == 60
+        assert stats['reversed'] > 0
+        assert stats['optimized'] <= stats['original']
+
+def test_header_and_footer_stay():
+    lines = random_program(7)
+    out = list(path_order.order_program(lines, 0.2))
+    assert out[:len(header)] == header
+    assert out[-len(footer):] == footer
+    assert len(out) == len(lines)
+
+def test_nothing_reversed_without_reverse():
+    lines = random_program(11)
+    stats = path_order.new_stats()
+    out = list(path_order.order_program(lines, 0.2, False, stats))
+    assert stats['reversed'] == 0
+    assert sorted(out) == sorted(lines)
@@ -0,0 +1,72 @@
+#
+# test_pipeline.py
+# github: https://github.com/NPS-DAZL
+#
+# Stages run once the stages they need are done, get their results,
+# and a failed stage skips only the stages that need it.
+
+import functools
+import operator
+
+import pytest
+
+import pipeline
+
+def fail():
+    raise ValueError("bad input")
+
+def test_results_handed_on():
+    p = pipeline.Pipeline()
+    p.add('a', lambda: 2)
+    p.add('b', lambda: 3)
+    p.add('sum', operator.add, ['a', 'b'])
+    p.add('twice', lambda s: 2 * s, ['sum'])
+    results, timings = p.run(2)
+    assert results == {'a': 2, 'b': 3, 'sum': 5, 'twice': 10}
+    assert all(t.status == 'ok' for t in timings)
+    start = dict((t.name, t.start) for t in timings)
+    assert start['twice'] >= start['sum'] >= max(start['a'], start['b'])
+
+def test_failed_stage_skips_only_its_dependents():
+    p = pipeline.Pipeline()
+    p.add('bad', fail)
+    p.add('after', lambda v: v, ['bad'])
+    p.add('later', lambda v: v, ['after'])
+    p.add('other', lambda: 1)
+    results, timings = p.run(2)
+    assert results == {'other': 1}
+    status = dict((t.name, t.status) for t in timings)
+    assert status == {'bad': 'FAILED', 'after': 'skipped', 'later': 'skipped', 'other': 'ok'}
+    message = [t.message for t in timings if t.name == 'bad'][0]
+    assert message == "ValueError: bad input"
+
+def test_process_stage():
+    p = pipeline.Pipeline()
+    p.add('groups', lambda: [[1, 2], [3, 4, 5]])
+    p.add('group:1', functools.partial(pipeline.pick_group, 1), ['groups'])
+    p.add('len', len, ['group:1'], process=True)
+    results, timings = p.run(2, quiet=True)
+    assert results['group:1'] == [3, 4, 5]
+    assert results['len'] == 3
+
+def test_stages_added_in_order():
+    p = pipeline.Pipeline()
+    p.add('a', lambda: 1)
+    with pytest.raises(ValueError):
+        p.add('b', lambda v: v, ['c'])
+    with pytest.raises(ValueError):
+        p.add('a', lambda: 2)
+
+def test_board_stages(tmp_path):
+    p = pipeline.board_pipeline('board.drd', ['iso.nc'], 'outline.nc', str(tmp_path))
+    stages = p.stages
+    for name in ('65_drill.txt', '58_drill.txt', '44_drill.txt'):
+        stage = stages['drill:' + name]
+        # each worker gets its own bit group, not all of them
+        assert stage.process
+        assert stage.needs == ('group:' + name.split('_')[0],)
+        assert stages[stage.needs[0]].needs == ('drill_groups',)
+    assert not stages['G_final:iso.nc'].process
+    assert set(stages['cycle_time'].needs) == set(
+        ['drill:65_drill.txt', 'drill:58_drill.txt', 'drill:44_drill.txt', 'G_final:iso.nc',
+         'cutline'])
@@ -0,0 +1,41 @@
+#
+# test_profiling.py
+# github: https://github.com/NPS-DAZL
+#
+# Peak memory of the stages and of the whole run.
+
+import numpy as np
+
+import profiling
+
+def test_run_peak_covers_every_stage():
+    profile = profiling.Profile('test')
+    with profile.stage('big'):
+        block = np.ones(80 * 1024 * 1024 // 8)
+        block[::512] = 2.0
+        del block
+    with profile.stage('empty'):
+        pass
+    results = profile.results()
+    stages = dict((s['name'], s) for s in results['stages'])
+    assert stages['big']['peak_mb'] >= stages['empty']['peak_mb']
+    assert results['peak_mb'] >= max(s['peak_mb'] for s in results['stages'])
+
+def test_nested_stage_peak_in_outer():
+    profile = profiling.Profile('test')
+    with profile.stage('outer'):
+        with profile.stage('inner'):
+            block = np.ones(40 * 1024 * 1024 // 8)
+            block[::512] = 2.0
+            del block
+    stages = dict((s['name'], s) for s in profile.results()['stages'])
+    assert stages['outer']['peak_mb'] >= stages['inner']['peak_mb']
+
+def test_counts_go_to_stage_and_totals():
+    profile = profiling.Profile('test')
+    with profile.stage('read'):
+        profile.count('lines', 3)
+    profile.count('lines', 2)
+    results = profile.results()
+    assert results['counts'] == {'lines': 5}
+    assert results['stages'][0]['counts'] == {'lines': 3}
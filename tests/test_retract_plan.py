@@ -0,0 +1,65 @@
+#
+# test_retract_plan.py
+# github: https://github.com/NPS-DAZL
+#
+# Only short hops over the board and clear of the clamps stay low.
+
+import pytest
+
+import retract_plan
+
+def drill(holes):
+    lines = ['G90\n', 'G00 Z8\n', 'G00 X0 Y0\n']
+    for x, y in holes:
+        lines += ['G00 Z8\n', 'G00 X' + str(x) + ' Y' + str(y) + '\n', 'G00 Z1\n',
+                  'G01 Z-1.5 F100\n']
+    return lines + ['G00 Z8\n', 'M30\n']
+
+# the height of every rapid in Z, the lifts and the drops to the R-plane
+def heights(lines):
+    return [float(line.split('Z')[1]) for line in lines if line.startswith('G00 Z')]
+
+def test_short_hops_lowered():
+    holes = [(0, 0), (5, 0), (10, 0), (10, 5)]
+    stats = retract_plan.new_stats()
+    out = retract_plan.plan_retracts(drill(holes), retract_plan.default_fixture, stats)
+    assert stats['lifts'] == 3
+    assert stats['lowered'] == 3
+    # the hops between holes at the clearance plane, the first and last
+    # lifts as they were
+    assert heights(out) == [8, 8, 1, 3, 1, 3, 1, 3, 1, 8]
+    assert stats['after'].total() < stats['before'].total()
+    assert len(out) == len(drill(holes))
+
+def test_long_hop_kept_high():
+    fixture = retract_plan.default_fixture._replace(long_move=20.0)
+    out = retract_plan.plan_retracts(drill([(0, 0), (5, 0), (50, 0)]), fixture)
+    assert heights(out) == [8, 8, 1, 3, 1, 8, 1, 8]
+
+def test_hop_over_clamp_kept_high():
+    fixture = retract_plan.default_fixture._replace(clamps=[(9.0, -1.0, 11.0, 1.0)])
+    stats = retract_plan.new_stats()
+    out = retract_plan.plan_retracts(drill([(0, 0), (5, 0), (20, 0), (20, 5)]), fixture, stats)
+    assert heights(out) == [8, 8, 1, 3, 1, 8, 1, 3, 1, 8]
+    assert stats['lowered'] == 2
+
+def test_never_below_return_height():
+    fixture = retract_plan.default_fixture._replace(clearance=0.5)
+    out = retract_plan.plan_retracts(drill([(0, 0), (5, 0)]), fixture)
+    assert heights(out) == [8, 8, 1, 1, 1, 8]
+
+def test_crosses():
+    rect = (0.0, 0.0, 1.0, 1.0)
+    assert retract_plan.crosses((-1.0, 0.5), (2.0, 0.5), rect)
+    assert not retract_plan.crosses((-1.0, 2.0), (2.0, 2.0), rect)
+    assert not retract_plan.crosses((-1.0, 0.0), (0.0, -1.0), rect)
+
+def test_read_fixture(tmp_path):
+    name = tmp_path / 'fixture.cfg'
+    name.write_text('clearance 2.5  # mm\nclamp 10 5 0 0\n')
+    fixture = retract_plan.read_fixture(str(name))
+    assert fixture.clearance == 2.5
+    assert fixture.clamps == [(0.0, 0.0, 10.0, 5.0)]
+    name.write_text('clamp 1 2 3\n')
+    with pytest.raises(ValueError):
+        retract_plan.read_fixture(str(name))
@@ -0,0 +1,41 @@
+#
+# test_sender.py
+# github: https://github.com/NPS-DAZL
+#
+# Blocks sent to the simulated controller arrive whole and in order,
+# and its buffer never overflows, with either kind of flow control.
+
+import pytest
+
+import sender
+
+pytest.importorskip('serial')
+
+def blocks(n):
+    return ['G01 X' + str(k % 100) + '.25 Y' + str(k // 100) + '.5 F100' for k in range(n)]
+
+# sends n blocks to a controller running rate blocks/s, a good deal
+# slower than the baud rate, so it holds the sender off
+def round_trip(flow, n=300, rate=300.0):
+    sim = sender.SimulatedController(rate, 512, flow).start()
+    sent = []
+    port = sender.open_port(sim.name, 115200, flow)
+    try:
+        totals = sender.Sender(port, flow).send(sender.recorded(blocks(n), sent))
+    finally:
+        port.close()
+    sim.finish()
+    return sim, sent, totals
+
+@pytest.mark.parametrize('flow', ['xonxoff', 'rtscts'])
+def test_round_trip(flow):
+    sim, sent, totals = round_trip(flow)
+    assert sent == blocks(300)
+    assert sim.received == sent
+    assert sim.overflow == 0
+    assert sim.most <= sim.buffer_size
+    assert totals.blocks == 300
+    assert totals.bytes == sum(len(b) + len(sender.line_end) for b in sent)
+    if flow == 'xonxoff':
+        assert totals.xoffs > 0
+        assert totals.held > 0
@@ -0,0 +1,76 @@
+#
+# test_toolpath.py
+# github: https://github.com/NPS-DAZL
+#
+# A toolpath saved and loaded again, and G-code through a toolpath.
+
+import numpy as np
+import pytest
+
+import gcode_lexer
+import toolpath
+
+program = '''%
+G90
+G55
+M03
+G00 X10.0 Y5.0 Z3.0
+G01 Z-0.1 F50
+G01 X12.5 Y5.0 F100.0
+G02 X15.0 Y7.5 I0 J2.5
+G03 X12.5 Y10.0 I-2.5 J0 F120
+G00 Z8.0
+G00 X0 Y0
+M05
+M30
+'''
+
+#---------Save and load----------------------#
+@pytest.mark.parametrize('mmap', [True, False])
+def test_save_load_round_trip(tmp_path, mmap):
+    path = toolpath.from_gcode(program)
+    name = str(tmp_path / 'job.tp')
+    toolpath.save(name, path)
+    assert toolpath.is_toolpath(name)
+    back = toolpath.load(name, mmap=mmap)
+    assert back.moves.dtype == toolpath.MOVE_DTYPE
+    assert back.moves.tobytes() == path.moves.tobytes()
+    for key in ('units', 'origin', 'start', 'tools', 'preamble', 'postamble'):
+        assert back.header[key] == path.header[key]
+    assert back.header['moves'] == len(path.moves)
+    assert toolpath.read(name).moves.tobytes() == path.moves.tobytes()
+
+def test_empty_toolpath(tmp_path):
+    name = str(tmp_path / 'empty.tp')
+    toolpath.save(name, toolpath.Toolpath(toolpath.new_header(), np.zeros(0, toolpath.MOVE_DTYPE)))
+    assert len(toolpath.load(name).moves) == 0
+
+def test_not_a_toolpath(tmp_path):
+    name = tmp_path / 'job.nc'
+    name.write_text(program)
+    assert not toolpath.is_toolpath(str(name))
+    with pytest.raises(ValueError):
+        toolpath.load(str(name))
+
+#---------G-code through a toolpath----------#
+def test_moves_from_gcode():
+    path = toolpath.from_gcode(program)
+    moves = path.moves
+    assert moves['kind'].tolist() == [0, 1, 1, 2, 3, 0, 0]
+    assert moves['x'].tolist() == [10.0, 10.0, 12.5, 15.0, 12.5, 12.5, 0.0]
+    assert moves['z'].tolist() == [3.0, -0.1, -0.1, -0.1, -0.1, 8.0, 8.0]
+    assert moves['j'].tolist() == [0.0, 0.0, 0.0, 2.5, 0.0, 0.0, 0.0]
+    assert moves['feed'].tolist() == [0.0, 50.0, 100.0, 100.0, 120.0, 120.0, 120.0]
+    assert path.header['preamble'] == ['%', 'G90', 'G55', 'M03']
+    assert path.header['postamble'] == ['M05', 'M30']
+
+def test_gcode_round_trip(tmp_path):
+    path = toolpath.from_gcode(program)
+    name = str(tmp_path / 'job.tp')
+    toolpath.save(name, path)
+    text = '\n'.join(toolpath.to_gcode(toolpath.load(name))) + '\n'
+    again = toolpath.from_gcode(text)
+    assert again.moves.tobytes() == path.moves.tobytes()
+    assert again.header['postamble'] == path.header['postamble']
+    # the first move goes to the first height, whatever the start was
+    assert gcode_lexer.value_of(gcode_lexer.lex_line(text.splitlines()[4]), 'Z') == 3.0
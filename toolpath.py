@@ -0,0 +1,294 @@
+#! /usr/bin/env python
+
+#
+# toolpath.py
+# github: https://github.com/NPS-DAZL
+#
+# Usage:
+#   toolpath.py <in> <out>
+#     G-code in, a .tp file out, or a .tp file in and G-code out
+#   toolpath.py --info <file.tp>
+#
+#   A binary toolpath the scripts can hand to each other instead of
+#   G-code text, so a stage does not have to format numbers for the
+#   next stage to parse again.  Text is only written by the last step.
+#
+#   A .tp file is
+#     MAGIC                 8 bytes
+#     header length         8 bytes, little endian
+#     header                JSON, padded with spaces so the moves start
+#                           on a 64 byte boundary
+#     moves                 one MOVE_DTYPE record per move
+#   The header holds the units, the origin, the position before the
+#   first move, the tool table and the lines written before the first
+#   and after the last move (the PCBmill banner, G90/G55, spindle on
+#   and off).  load() maps the moves straight from the file, so a
+#   job of a million moves opens without being read or copied.
+#
+#   Lines between two moves that do not move the cutter (spindle and
+#   coolant words, comments) are not kept.
+#
+#   --profile, --cprofile and --log-level are described in profiling.py.
+
+import argparse
+import collections
+import json
+import os
+import sys
+
+import numpy as np
+
+import gcode_emit
+import gcode_lexer
+import profiling
+
+#--------------SETTINGS----------------------#
+MAGIC = b'PCBTP\x00\x01\n'
+ALIGN = 64
+
+# move kinds, the G code of the move
+RAPID = 0
+FEED = 1
+CW = 2
+CCW = 3
+
+MOVE_DTYPE = np.dtype([('kind', 'u1'), ('tool', 'u1'),
+                       ('x', '<f8'), ('y', '<f8'), ('z', '<f8'),
+                       ('i', '<f8'), ('j', '<f8'), ('feed', '<f4')])
+
+# header: dict of the settings below; moves: array of MOVE_DTYPE
+Toolpath = collections.namedtuple('Toolpath', 'header moves')
+
+#---------New header-------------------------#
+# start is the (x, y, z) position before the first move, z may be None
+def new_header(units='mm', origin='G55', start=(0.0, 0.0, None), tools=None,
+               preamble=None, postamble=None):
+    return {'version': 1, 'units': units, 'origin': origin,
+            'start': list(start), 'tools': tools or {},
+            'preamble': preamble or [], 'postamble': postamble or []}
+
+#---------Is this a toolpath file------------#
+def is_toolpath(filename):
+    fp = open(filename, 'rb')
+    try:
+        return fp.read(len(MAGIC)) == MAGIC
+    finally:
+        fp.close()
+
+#---------Write a toolpath-------------------#
+def save(filename, path):
+    moves = np.ascontiguousarray(path.moves, dtype=MOVE_DTYPE)
+    header = dict(path.header)
+    header['moves'] = len(moves)
+    text = json.dumps(header).encode('utf-8')
+    used = len(MAGIC) + 8 + len(text)
+    text += b' ' * (-used % ALIGN)
+    fp = open(filename, 'wb')
+    try:
+        fp.write(MAGIC)
+        fp.write(np.array([len(text)], dtype='<u8').tobytes())
+        fp.write(text)
+        fp.write(moves.tobytes())
+    finally:
+        fp.close()
+    return filename
+
+#---------Read a toolpath--------------------#
+# raises ValueError if filename is not a toolpath file
+# with mmap the moves are a read-only view of the file
+def load(filename, mmap=True):
+    fp = open(filename, 'rb')
+    try:
+        if fp.read(len(MAGIC)) != MAGIC:
+            raise ValueError(str(filename) + " is not a toolpath file")
+        size = int(np.frombuffer(fp.read(8), dtype='<u8')[0])
+        header = json.loads(fp.read(size).decode('utf-8'))
+        offset = len(MAGIC) + 8 + size
+        count = header['moves']
+        if count == 0:
+            return Toolpath(header, np.zeros(0, dtype=MOVE_DTYPE))
+        if mmap:
+            moves = np.memmap(filename, dtype=MOVE_DTYPE, mode='r', offset=offset, shape=(count,))
+        else:
+            moves = np.fromfile(fp, dtype=MOVE_DTYPE, count=count)
+    finally:
+        fp.close()
+    return Toolpath(header, moves)
+
+#---------Positions of the moves-------------#
+# returns x, y, z arrays one longer than the moves: the start position
+# and the end of every move.  An unknown start Z is taken to be the
+# first Z moved to.
+def positions(path):
+    moves = path.moves
+    sx, sy, sz = path.header['start']
+    if sz is None:
+        sz = float(moves['z'][0]) if len(moves) else 0.0
+    return (np.concatenate(([sx], moves['x'])), np.concatenate(([sy], moves['y'])),
+            np.concatenate(([sz], moves['z'])))
+
+#---------G-code to a toolpath---------------#
+# data is the text of a G-code file, str or bytes
+# every line that moves the cutter becomes one move; T words set the
+# tool of the moves after them, tool is used before the first
+def from_gcode(data, tool=0, units='mm', origin='G55'):
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    words = gcode_lexer.scan(data, 0)
+    if len(words) == 0:
+        return Toolpath(new_header(units, origin, preamble=data.decode('utf-8').splitlines()),
+                        np.zeros(0, dtype=MOVE_DTYPE))
+    nlines = words.line[-1] + 1
+    vals = words.values()
+
+    motion_val, motion_has = words.per_line('G', nlines, vals, where=vals <= 3)
+    mode = gcode_lexer.fill_modal(motion_val.astype(np.int8), motion_has)
+    feed = gcode_lexer.fill_modal(*words.per_line('F', nlines, vals), initial=0.0)
+    tools = gcode_lexer.fill_modal(*words.per_line('T', nlines, vals), initial=tool)
+    x = gcode_lexer.fill_modal(*words.per_line('X', nlines, vals))
+    y = gcode_lexer.fill_modal(*words.per_line('Y', nlines, vals))
+    z_val, z_has = words.per_line('Z', nlines, vals)
+    z0 = float(z_val[np.argmax(z_has)]) if z_has.any() else 0.0
+    z = gcode_lexer.fill_modal(z_val, z_has, initial=z0)
+    i_val, i_has = words.per_line('I', nlines, vals)
+    j_val, j_has = words.per_line('J', nlines, vals)
+
+    # the cutter starts at X0 Y0 and at the first height it is sent to
+    moved = ((x != np.concatenate(([0.0], x[:-1]))) | (y != np.concatenate(([0.0], y[:-1]))) |
+             (z != np.concatenate(([z0], z[:-1]))))
+    arc = ((mode == 2) | (mode == 3)) & (i_has | j_has)
+    k = np.flatnonzero(moved | arc)
+
+    moves = np.zeros(len(k), dtype=MOVE_DTYPE)
+    moves['kind'] = mode[k]
+    moves['tool'] = tools[k]
+    moves['x'] = x[k]
+    moves['y'] = y[k]
+    moves['z'] = z[k]
+    moves['i'] = np.where(arc[k], i_val[k], 0.0)
+    moves['j'] = np.where(arc[k], j_val[k], 0.0)
+    moves['feed'] = feed[k]
+
+    # keep the text before the first and after the last move
+    total = data.count(b'\n') + 1
+    first = int(k[0]) if len(k) else total
+    last = int(k[-1]) if len(k) else total
+    preamble = data.split(b'\n', first)[:first]
+    postamble = data.rsplit(b'\n', max(total - 1 - last, 0))[1:] if len(k) else []
+    if postamble and postamble[-1] == b'':
+        postamble.pop()
+    header = new_header(units, origin, (0.0, 0.0, z0),
+                        preamble=[l.decode('utf-8').rstrip('\r') for l in preamble],
+                        postamble=[l.decode('utf-8').rstrip('\r') for l in postamble])
+    return Toolpath(header, moves)
+
+#---------Drilling toolpath------------------#
+# points is an (N, 2) array of holes in drilling order
+# every hole is a lift to travel_height, a move over the hole, a rapid
+# down to r_plane and a plunge to depth at feed, as drill_G_output.py
+# writes them
+def drill_moves(points, travel_height, r_plane, depth, feed, tool=0):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    n = len(points)
+    moves = np.zeros(4 * n, dtype=MOVE_DTYPE)
+    moves['tool'] = tool
+    prev = np.concatenate((np.zeros((1, 2)), points[:-1]))
+    moves['x'][0::4] = prev[:, 0]
+    moves['y'][0::4] = prev[:, 1]
+    for k in range(1, 4):
+        moves['x'][k::4] = points[:, 0]
+        moves['y'][k::4] = points[:, 1]
+    moves['z'][0::4] = travel_height
+    moves['z'][1::4] = travel_height
+    moves['z'][2::4] = r_plane
+    moves['z'][3::4] = depth
+    moves['kind'][3::4] = FEED
+    moves['feed'][3::4] = feed
+    return moves
+
+#---------A toolpath to G-code---------------#
+# yields the lines of the program, without newlines
+# only the words a move changes are written (see gcode_emit.py)
+def to_gcode(path):
+    emitter = gcode_emit.Emitter()
+    for line in path.header['preamble']:
+        line = emitter.line(line)
+        if line is not None:
+            yield line
+    # the start Z is only the first height the program sends the cutter
+    # to, not where it is, so that first Z is always written
+    sx, sy = path.header['start'][:2]
+    emitter.at(sx, sy)
+    moves = path.moves
+    columns = [moves[name].tolist() for name in ('kind', 'x', 'y', 'z', 'i', 'j', 'feed')]
+    for kind, x, y, z, i, j, f in zip(*columns):
+        if kind == RAPID or f <= 0:
+            f = None
+        line = emitter.move(kind, x, y, z, i, j, f)
+        if line is not None:
+            yield line
+    for line in path.header['postamble']:
+        yield line
+
+#---------Write a toolpath as G-code---------#
+def write_gcode(filename, path):
+    fp = open(filename, 'w', 1 << 20)
+    try:
+        for line in to_gcode(path):
+            fp.write(line + '\n')
+    finally:
+        fp.close()
+    return filename
+
+#---------Read G-code or a toolpath----------#
+def read(filename):
+    if is_toolpath(filename):
+        return load(filename)
+    fp = open(filename, 'rb')
+    try:
+        data = fp.read()
+    finally:
+        fp.close()
+    return from_gcode(data)
+
+##############################################
+#                 MAIN
+##############################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert between G-code and binary toolpath (.tp) files.")
+    parser.add_argument('filename',
+        help="a G-code file, or a .tp file")
+    parser.add_argument('out_name', nargs='?',
+        help="the file to write: a .tp file from G-code, G-code from a .tp file")
+    parser.add_argument('--info', action='store_true',
+        help="print the header and move count of the file")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with profiling.session(args, 'toolpath'):
+        try:
+            with profiling.stage('read ' + os.path.basename(args.filename)):
+                path = read(args.filename)
+                profiling.count_file('bytes read', args.filename)
+                profiling.count('moves read', len(path.moves))
+        except IOError:
+            print("Error: unable to open file " + str(args.filename))
+            sys.exit(1)
+        if args.info:
+            header = dict(path.header)
+            header['moves'] = len(path.moves)
+            print(json.dumps(header, indent=1))
+        if args.out_name is None:
+            return
+        with profiling.stage('write ' + os.path.basename(args.out_name)):
+            if is_toolpath(args.filename):
+                write_gcode(args.out_name, path)
+            else:
+                save(args.out_name, path)
+            profiling.count('moves written', len(path.moves))
+            profiling.count_file('bytes written', args.out_name)
+        print(args.filename + " -> " + args.out_name + ", " + str(len(path.moves)) + " moves")
+
+if __name__ == '__main__':
+    main()